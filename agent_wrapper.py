@@ -2,7 +2,9 @@
 Wrapper module to handle import compatibility issues with the OpenAI Agents SDK.
 
 This module provides a clean interface around the agents SDK, handling
-various import and compatibility issues.
+various import and compatibility issues. SDK entry points are resolved lazily
+on first use (importing the SDK takes over a second), or all at once with
+init_components() before workers fork.
 """
 
 import logging
@@ -10,169 +12,286 @@ import asyncio
 from typing import Any, Dict, List, Optional
 import importlib
 import sys
+import threading
+import time
+
+from config import Config
+from services.deadline import Deadline, RunCancelledError, RunProgress
+from services import http_client, metrics
 
 logger = logging.getLogger(__name__)
 
-# Global variables for imported classes and modules
-Agent = None
-ModelSettings = None
-function_tool = None
-Runner = None
-AgentRunner = None
-Model = None
-handoff = None
+# Fallbacks used when a symbol can't be imported from any known location
+
+class AgentStub:
+    def __init__(self, name, instructions, model=None, model_settings=None, tools=None, handoffs=None):
+        self.name = name
+        self.instructions = instructions
+        self.model = model
+        self.model_settings = model_settings
+        self.tools = tools or []
+        self.handoffs = handoffs or []
+
+def handoff_stub(agent, tool_name_override=None, tool_description_override=None):
+    logger.warning("Using handoff_stub as fallback")
+    return {
+        "agent": agent,
+        "tool_name": tool_name_override or f"handoff_to_{agent.name}",
+        "tool_description": tool_description_override or f"Handoff to {agent.name}"
+    }
+
+class ModelStub:
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.__dict__.update(kwargs)
+
+class ModelSettingsStub:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def function_tool_stub(fn=None, **kwargs):
+    return fn
 
-def init_components():
-    """Initialize all components needed for the agents SDK."""
-    global Agent, ModelSettings, function_tool, Runner, AgentRunner, Model, handoff
+class RunnerStub:
+    @staticmethod
+    async def run(starting_agent, input, **kwargs):
+        logger.warning("Using RunnerStub.run as fallback")
+        class ResultStub:
+            def __init__(self, output):
+                self.output = output
+                self.trace_id = None
+                self.final_output = output
+        return ResultStub(f"Stub response from {starting_agent.name}: {input}")
+
+# SDK entry points: the import locations tried in order, then the fallback.
+# Run hooks are optional; without them runs simply don't report progress.
+SDK_SYMBOLS = {
+    "Agent": ([("agents", "Agent"), ("agents.agent", "Agent")], AgentStub),
+    "handoff": ([("agents", "handoff"), ("agents.handoffs", "handoff"), ("agents.agent", "handoff")], handoff_stub),
+    "Model": ([("agents.models.interface", "Model")], ModelStub),
+    "ModelSettings": ([("agents.model_settings", "ModelSettings")], ModelSettingsStub),
+    "function_tool": ([("agents.tool", "function_tool")], function_tool_stub),
+    "Runner": ([("agents.run", "Runner"), ("agents", "Runner"), ("agents", "AgentRunner")], RunnerStub),
+    "RunHooks": ([("agents.lifecycle", "RunHooks")], None),
+    "set_default_openai_client": ([("agents", "set_default_openai_client")], None),
+    "Reasoning": ([("openai.types.shared", "Reasoning")], None),
+}
+
+# How long resolving each symbol took; resolved symbols become module globals
+_UNRESOLVED = object()
+_resolve_lock = threading.RLock()
+startup_timings: Dict[str, float] = {}
+
+def resolve(name: str) -> Any:
+    """
+    Return an SDK entry point, importing it on first use.
     
-    try:
-        # Import agents package first
-        import agents
-        logger.info(f"Successfully imported agents module from {agents.__file__}")
+    Each symbol is resolved once per process (a forked worker inherits what
+    its parent resolved) and stored as a module global, so later lookups of
+    e.g. agent_wrapper.Agent are plain attribute access.
+    
+    Args:
+        name: A key of SDK_SYMBOLS
         
-        # Try multiple import paths for Agent and handoff
-        try:
-            # Try direct import from agents
-            from agents import Agent as AgentClass
-            from agents import handoff as handoff_fn
-            logger.info("Successfully imported Agent and handoff directly from agents")
-        except (ImportError, AttributeError) as e:
-            logger.warning(f"Direct import failed: {str(e)}, trying alternative paths")
-            
-            # Try importing from agents.agent
-            try:
-                from agents.agent import Agent as AgentClass
-                logger.info("Successfully imported Agent from agents.agent")
-            except (ImportError, AttributeError) as e:
-                logger.warning(f"agents.agent import failed: {str(e)}")
-                
-                # Create a stub Agent class if all imports fail
-                class AgentStub:
-                    def __init__(self, name, instructions, model=None, model_settings=None, tools=None, handoffs=None):
-                        self.name = name
-                        self.instructions = instructions
-                        self.model = model
-                        self.model_settings = model_settings
-                        self.tools = tools or []
-                        self.handoffs = handoffs or []
-                
-                AgentClass = AgentStub
-                logger.warning("Using AgentStub as fallback")
-            
-            # Try importing handoff from various locations
+    Returns:
+        The SDK object, or its fallback if it can't be imported
+    """
+    value = globals().get(name, _UNRESOLVED)
+    if value is not _UNRESOLVED:
+        return value
+    
+    with _resolve_lock:
+        if name in globals():
+            return globals()[name]
+        
+        candidates, fallback = SDK_SYMBOLS[name]
+        started = time.perf_counter()
+        value = fallback
+        for module_name, attribute in candidates:
             try:
-                from agents.handoffs import handoff as handoff_fn
-                logger.info("Successfully imported handoff from agents.handoffs")
+                value = getattr(importlib.import_module(module_name), attribute)
+                break
             except (ImportError, AttributeError):
-                try:
-                    from agents.agent import handoff as handoff_fn
-                    logger.info("Successfully imported handoff from agents.agent")
-                except (ImportError, AttributeError):
-                    # Create a stub handoff function if all imports fail
-                    def handoff_stub(agent, tool_name_override=None, tool_description_override=None):
-                        logger.warning("Using handoff_stub as fallback")
-                        return {
-                            "agent": agent,
-                            "tool_name": tool_name_override or f"handoff_to_{agent.name}",
-                            "tool_description": tool_description_override or f"Handoff to {agent.name}"
-                        }
-                    
-                    handoff_fn = handoff_stub
-                    logger.warning("Using handoff_stub as fallback")
+                continue
+        else:
+            if fallback is not None:
+                logger.warning(f"Could not import {name} from the agents SDK, using {fallback.__name__} as fallback")
+            else:
+                logger.warning(f"{name} is not available in the agents SDK")
         
-        # Then try to import interfaces and classes
-        try:
-            from agents.models.interface import Model as ModelClass
-            Model = ModelClass
-            
-            # Patch the agents package to provide Model class
-            if not hasattr(agents, 'Model'):
-                agents.Model = Model
-                logger.info("Patched agents.Model successfully")
-        except ImportError:
-            # If direct import fails, create a stub Model class
-            class ModelStub:
-                def __init__(self, name, **kwargs):
-                    self.name = name
-                    self.__dict__.update(kwargs)
+        # The first resolution includes importing the SDK itself
+        startup_timings[name] = round(time.perf_counter() - started, 4)
+        globals()[name] = value
+        return value
+
+def __getattr__(name: str) -> Any:
+    # Module attributes such as agent_wrapper.Agent resolve lazily
+    if name in SDK_SYMBOLS:
+        return resolve(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def init_components() -> bool:
+    """
+    Resolve all SDK entry points now.
+    
+    Called before forking workers (e.g. gunicorn --preload) so the expensive
+    SDK import happens once in the parent process.
+    
+    Returns:
+        True if the agents SDK itself could be imported
+    """
+    started = time.perf_counter()
+    for name in SDK_SYMBOLS:
+        resolve(name)
+    
+    available = resolve("Agent") is not AgentStub
+    if available:
+        logger.info(f"Resolved OpenAI Agents SDK components in {time.perf_counter() - started:.3f} seconds")
+    else:
+        logger.error("Failed to initialize OpenAI Agents SDK components")
+    return available
+
+def startup_report() -> Dict[str, Any]:
+    """Return the measured SDK resolution times in seconds."""
+    return {"resolved": [name for name in SDK_SYMBOLS if name in globals()], "timings": dict(startup_timings),
+            "total": round(sum(startup_timings.values()), 4)}
+
+# The client most recently installed as the SDK default
+_installed_client = None
+
+def install_openai_client() -> Any:
+    """
+    Install this process's shared pooled AsyncOpenAI client as the SDK default.
+    
+    Cheap to call repeatedly; the SDK is only reconfigured when the client
+    changes (e.g. in a freshly forked worker).
+    
+    Returns:
+        The installed client, or None if the SDK can't take a default client
+    """
+    global _installed_client
+    try:
+        client = http_client.get_async_client()
+    except Exception as e:
+        logger.warning(f"Could not create the shared OpenAI client, the SDK will create its own: {str(e)}")
+        return None
+    if client is _installed_client:
+        return client
+    
+    set_default_openai_client = resolve("set_default_openai_client")
+    if set_default_openai_client is None:
+        logger.warning("set_default_openai_client not available, the SDK will create its own client")
+        return None
+    
+    set_default_openai_client(client)
+    _installed_client = client
+    logger.info("Installed shared pooled OpenAI client as the SDK default")
+    return client
+
+# Run configuration shared by all runs of this process (None for SDK defaults)
+_run_config = _UNRESOLVED
+
+def get_run_config() -> Any:
+    """
+    Return the RunConfig all runs use, created on first use.
+    
+    With MODEL_BACKEND=replay, every model is replaced by the offline replay
+    backend and tracing is disabled.
+    """
+    global _run_config
+    if _run_config is _UNRESOLVED:
+        _run_config = None
+        if Config.MODEL_BACKEND == "replay":
+            from agents import RunConfig
+            from services.replay_model import ReplayModelProvider
             
-            # Use the stub
-            Model = ModelStub
-            if not hasattr(agents, 'Model'):
-                agents.Model = Model
-        
-        # Import other components
-        try:
-            from agents.model_settings import ModelSettings as ModelSettingsClass
-            ModelSettings = ModelSettingsClass
-        except ImportError:
-            class ModelSettingsStub:
-                def __init__(self, **kwargs):
-                    self.__dict__.update(kwargs)
-            ModelSettings = ModelSettingsStub
-            logger.warning("Using ModelSettingsStub as fallback")
-        
-        try:
-            from agents.tool import function_tool as function_tool_fn
-            function_tool = function_tool_fn
-        except ImportError:
-            def function_tool_stub(fn=None, **kwargs):
-                return fn
-            function_tool = function_tool_stub
-            logger.warning("Using function_tool_stub as fallback")
-        
-        # Try to import Runner or AgentRunner
-        try:
-            from agents.run import Runner as RunnerClass
-            Runner = RunnerClass
-        except ImportError:
-            try:
-                from agents import Runner as RunnerClass
-                Runner = RunnerClass
-            except ImportError:
-                # If Runner is not available, try AgentRunner
-                try:
-                    from agents import AgentRunner as AgentRunnerClass
-                    AgentRunner = AgentRunnerClass
-                    Runner = AgentRunnerClass  # Use AgentRunner as a fallback for Runner
-                    logger.info("Using AgentRunner as a fallback for Runner")
-                except ImportError:
-                    # Create a stub Runner class
-                    class RunnerStub:
-                        @staticmethod
-                        async def run(starting_agent, input):
-                            logger.warning("Using RunnerStub.run as fallback")
-                            class ResultStub:
-                                def __init__(self, output):
-                                    self.output = output
-                                    self.trace_id = None
-                                    self.final_output = output
-                            return ResultStub(f"Stub response from {starting_agent.name}: {input}")
-                    
-                    Runner = RunnerStub
-                    logger.warning("Using RunnerStub as fallback")
-        
-        # Store the imports in our global variables
-        Agent = AgentClass
-        handoff = handoff_fn
+            _run_config = RunConfig(model_provider=ReplayModelProvider.from_config(), tracing_disabled=True)
+            logger.info(f"Replaying model responses from {Config.REPLAY_FIXTURES}")
+    return _run_config
+
+# Hooks class built from the SDK's RunHooks on first use
+_progress_hooks_class = None
+
+def model_name(agent: Any) -> str:
+    """Return the model name of an SDK agent (its model may be a name or a Model object)."""
+    model = getattr(agent, 'model', None)
+    if model is None or isinstance(model, str):
+        return model or "default"
+    return getattr(model, 'model', type(model).__name__)
+
+def make_progress_hooks(progress: RunProgress) -> Any:
+    """
+    Create SDK run hooks that record how far a run got, and how long each
+    model turn, tool call and handoff took and how many tokens were used.
+    
+    Args:
+        progress: The RunProgress to update
         
-        # Print available attributes in the agents module
-        logger.info(f"Available attributes in agents module: {dir(agents)}")
+    Returns:
+        A RunHooks instance, or None if the SDK doesn't provide run hooks
+    """
+    global _progress_hooks_class
+    RunHooks = resolve("RunHooks")
+    if RunHooks is None:
+        return None
+    
+    if _progress_hooks_class is None:
+        class ProgressHooks(RunHooks):
+            def __init__(self, progress):
+                self.progress = progress
+                self._llm_started = {}
+                self._tool_started = {}
+                self._handoff_started = None
+            
+            def _phase(self, phase, started, name):
+                seconds = time.perf_counter() - started
+                self.progress.add_phase(phase, seconds)
+                metrics.observe_phase(phase, seconds, name)
+            
+            async def on_agent_start(self, context, agent):
+                self.progress.current_agent = agent.name
+            
+            async def on_llm_start(self, context, agent, system_prompt, input_items):
+                self.progress.model_turns += 1
+                if self._handoff_started is not None:
+                    # A handoff lasts until the target agent's first model turn
+                    self._phase("handoff", self._handoff_started, agent.name)
+                    self._handoff_started = None
+                self._llm_started[id(agent)] = time.perf_counter()
+            
+            async def on_llm_end(self, context, agent, response):
+                model = model_name(agent)
+                started = self._llm_started.pop(id(agent), None)
+                if started is not None:
+                    self._phase("model_turn", started, model)
+                usage = getattr(response, 'usage', None)
+                if usage is not None:
+                    details = getattr(usage, 'input_tokens_details', None)
+                    self.progress.add_usage(model, usage.input_tokens or 0, usage.output_tokens or 0,
+                                            getattr(details, 'cached_tokens', 0) or 0)
+                    metrics.record_usage(model, usage)
+            
+            async def on_tool_start(self, context, agent, tool):
+                name = getattr(tool, 'name', type(tool).__name__)
+                self.progress.tool_calls.append(name)
+                self._tool_started.setdefault(name, []).append(time.perf_counter())
+            
+            async def on_tool_end(self, context, agent, tool, result):
+                name = getattr(tool, 'name', type(tool).__name__)
+                started = self._tool_started.get(name)
+                if started:
+                    self._phase("tool_call", started.pop(0), name)
+            
+            async def on_handoff(self, context, from_agent, to_agent):
+                self.progress.handoffs.append(to_agent.name)
+                self._handoff_started = time.perf_counter()
         
-        logger.info("Successfully initialized OpenAI Agents SDK components")
-        return True
-    except ImportError as e:
-        logger.error(f"Failed to initialize OpenAI Agents SDK components: {str(e)}")
-        return False
-    except Exception as e:
-        logger.error(f"Unexpected error during SDK initialization: {str(e)}")
-        return False
-
-# Initialize components when the module is imported
-init_components()
+        _progress_hooks_class = ProgressHooks
+    
+    return _progress_hooks_class(progress)
 
-def create_run(agent: Any, messages: List[Dict[str, Any]]) -> Any:
+def create_run(agent: Any, messages: List[Dict[str, Any]], deadline: Optional[Deadline] = None,
+               history: Optional[List[Dict[str, Any]]] = None) -> Any:
     """
     Create a run with the given agent and messages.
     
@@ -182,15 +301,19 @@ def create_run(agent: Any, messages: List[Dict[str, Any]]) -> Any:
     Args:
         agent: The agent to run
         messages: The messages to send to the agent
+        deadline: Optional request deadline; when it expires the whole run
+            (model requests, tool calls and handoffs) is cancelled and
+            RunCancelledError is raised with the progress made so far
+        history: Optional input items of earlier conversation turns, sent
+            before the user's message
         
     Returns:
         A Run-like object that can be used to get the final result
     """
-    runner = Runner or AgentRunner
-    if runner is None:
-        success = init_components()
-        if not success:
-            raise ImportError("Failed to initialize SDK components")
+    runner = resolve("Runner")
+    
+    # Route all model traffic through the shared connection pool
+    install_openai_client()
     
     # Extract the user's message content
     if messages and len(messages) > 0 and 'content' in messages[0]:
@@ -199,29 +322,66 @@ def create_run(agent: Any, messages: List[Dict[str, Any]]) -> Any:
         user_input = ""
     
     # Log agent details
-    logger.debug(f"Creating run with agent: {agent.name}, model: {agent.model}")
-    logger.debug(f"Agent has {len(agent.tools) if hasattr(agent, 'tools') and agent.tools else 0} tools")
-    logger.debug(f"Agent has {len(agent.handoffs) if hasattr(agent, 'handoffs') and agent.handoffs else 0} handoffs")
-    if hasattr(agent, 'handoffs') and agent.handoffs:
-        for i, h in enumerate(agent.handoffs):
-            logger.debug(f"Handoff {i+1}: {getattr(h, 'agent_name', 'unknown')}")
+    if logger.isEnabledFor(logging.DEBUG):
+        tools = getattr(agent, 'tools', None) or []
+        handoffs = getattr(agent, 'handoffs', None) or []
+        logger.debug("Creating run with agent: %s, model: %s, %d tools, handoffs: %s", agent.name, agent.model,
+                     len(tools), [getattr(h, 'agent_name', 'unknown') for h in handoffs])
     
     # Create a wrapper object to provide compatibility with the expected interface
     class RunWrapper:
-        def __init__(self, agent, user_input):
+        def __init__(self, agent, user_input, deadline, history):
             self.agent = agent
             self.user_input = user_input
+            self.deadline = deadline
+            self.history = history or []
+            self.progress = RunProgress()
+            self.created_at = time.perf_counter()
+        
+        def _record_queue_time(self):
+            # Time between creating the run and it starting on the event loop
+            seconds = time.perf_counter() - self.created_at
+            self.progress.add_phase("queue", seconds)
+            metrics.observe_phase("queue", seconds, self.agent.name)
+        
+        def _run_kwargs(self):
+            run_input = self.user_input
+            if self.history:
+                run_input = self.history + [{"role": "user", "content": self.user_input}]
+            kwargs = {"starting_agent": self.agent, "input": run_input}
+            hooks = make_progress_hooks(self.progress)
+            if hooks is not None:
+                kwargs["hooks"] = hooks
+            run_config = get_run_config()
+            if run_config is not None:
+                kwargs["run_config"] = run_config
+            return kwargs
+        
+        def _cancelled(self):
+            error = RunCancelledError(self.deadline, self.progress)
+            logger.warning(str(error))
+            return error
             
         async def get_final_run_result(self):
             # Run the agent using the Runner class
+            # The timeout cancels the run task and waits for it to unwind,
+            # so in-flight model requests and handoffs stop with it
+            timeout = asyncio.timeout(self.deadline.remaining() if self.deadline else None)
             try:
-                logger.debug(f"Starting agent run with input: {self.user_input[:100]}...")
-                result = await runner.run(
-                    starting_agent=self.agent,
-                    input=self.user_input
-                )
-                logger.debug(f"Agent run completed successfully, trace_id: {getattr(result, 'trace_id', None)}")
+                logger.debug("Starting agent run with input: %.100s...", self.user_input)
+                self._record_queue_time()
+                if self.deadline is None:
+                    result = await runner.run(**self._run_kwargs())
+                else:
+                    with self.deadline.activate():
+                        async with timeout:
+                            result = await runner.run(**self._run_kwargs())
+                logger.debug("Agent run completed successfully, trace_id: %s", getattr(result, 'trace_id', None))
                 return result
+            except TimeoutError:
+                if timeout.expired():
+                    raise self._cancelled()
+                raise
             except Exception as e:
                 logger.error(f"Error running agent: {str(e)}", exc_info=True)
                 # Return a simple error result
@@ -230,24 +390,96 @@ def create_run(agent: Any, messages: List[Dict[str, Any]]) -> Any:
                         self.output = f"Error: {str(error)}"
                         self.trace_id = None
                         self.final_output = f"Error: {str(error)}"
+                        self.failed = True  # Never cached as an answer
                 return ErrorResult(e)
+        
+        async def stream_events(self):
+            """
+            Run the agent in streaming mode and yield simplified event dicts.
+            
+            Yields dicts with a "type" of "delta" (output text), "tool_call",
+            "tool_output", "handoff" or "final" (always last). The final event
+            carries the run's input and new items ("items") for conversations.
+            """
+            if not hasattr(runner, 'run_streamed'):
+                # Runner without streaming support: emit the whole output at once
+                result = await self.get_final_run_result()
+                output = result.final_output
+                # Structured outputs are streamed as the JSON the model would have sent
+                yield {"type": "delta", "text": output.model_dump_json() if hasattr(output, 'model_dump_json')
+                       else str(output)}
+                yield {"type": "final", "final_output": result.final_output,
+                       "trace_id": getattr(result, 'trace_id', None),
+                       "failed": getattr(result, 'failed', False),
+                       "items": result.to_input_list() if hasattr(result, 'to_input_list') else None}
+                return
+            
+            logger.debug("Starting streamed agent run with input: %.100s...", self.user_input)
+            self._record_queue_time()
+            if self.deadline is None:
+                result = runner.run_streamed(**self._run_kwargs())
+            else:
+                # The streamed run executes in its own task, which inherits the deadline
+                with self.deadline.activate():
+                    result = runner.run_streamed(**self._run_kwargs())
+            
+            events = result.stream_events().__aiter__()
+            try:
+                while True:
+                    try:
+                        if self.deadline is None:
+                            event = await events.__anext__()
+                        else:
+                            event = await asyncio.wait_for(events.__anext__(), self.deadline.remaining())
+                    except StopAsyncIteration:
+                        break
+                    except TimeoutError:
+                        raise self._cancelled()
+                    
+                    event_type = getattr(event, 'type', None)
+                    if event_type == "raw_response_event":
+                        data = event.data
+                        if getattr(data, 'type', None) == "response.output_text.delta":
+                            yield {"type": "delta", "text": data.delta}
+                    elif event_type == "run_item_stream_event":
+                        item = event.item
+                        if event.name == "tool_called":
+                            raw_item = item.raw_item
+                            yield {"type": "tool_call",
+                                   "name": getattr(raw_item, 'name', None) or getattr(raw_item, 'type', 'tool'),
+                                   "arguments": getattr(raw_item, 'arguments', None)}
+                        elif event.name == "tool_output":
+                            yield {"type": "tool_output", "output": str(item.output)}
+                        elif event.name == "handoff_occured":
+                            yield {"type": "handoff", "agent": item.target_agent.name}
+            finally:
+                # Stop the run if the deadline expired or the consumer went away
+                if not result.is_complete:
+                    result.cancel()
+            
+            trace = getattr(result, 'trace', None)
+            yield {"type": "final", "final_output": result.final_output,
+                   "trace_id": getattr(trace, 'trace_id', None),
+                   "items": result.to_input_list()}
     
     # Return the wrapper object
-    return RunWrapper(agent, user_input)
+    return RunWrapper(agent, user_input, deadline, history)
 
 def get_model_settings(**kwargs) -> Any:
     """
     Create a ModelSettings instance with the given kwargs.
     
     Args:
-        **kwargs: Arguments to pass to the ModelSettings constructor
+        **kwargs: Arguments to pass to the ModelSettings constructor, plus an
+            optional "reasoning_effort" ("low", "medium" or "high") for
+            reasoning models
         
     Returns:
         A ModelSettings instance
     """
-    if ModelSettings is None:
-        success = init_components()
-        if not success:
-            raise ImportError("Failed to initialize SDK components")
-    
-    return ModelSettings(**kwargs)
\ No newline at end of file
+    effort = kwargs.pop("reasoning_effort", None)
+    if effort:
+        reasoning = resolve("Reasoning")
+        if reasoning is not None:
+            kwargs["reasoning"] = reasoning(effort=effort)
+    return resolve("ModelSettings")(**kwargs)
\ No newline at end of file
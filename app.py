@@ -1,14 +1,20 @@
+import time
+
+# Startup is measured from here (including the Flask and SDK imports)
+_import_started = time.perf_counter()
+
 import os
 import logging
 import asyncio
 import concurrent.futures
-import time
-from flask import Flask, render_template, request, jsonify, session
+import threading
+import queue
+from flask import Flask, Response, g, render_template, request, jsonify, session, stream_with_context, url_for
 import json
-from openai import OpenAI
 
 # Configure logging first
-logging.basicConfig(level=logging.DEBUG)
+from services import logs
+logs.configure()
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
@@ -19,29 +25,35 @@ app.secret_key = os.environ.get("SESSION_SECRET", "dev_key")
 if not os.environ.get("OPENAI_API_KEY"):
     logger.warning("OPENAI_API_KEY not found in environment variables. Some features may not work.")
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-
 # Import our local tools and config
-from tools.calculator import CalculatorTool
 from config import Config
+from services.streaming import format_sse
+from services.deadline import Deadline, progress_report
+from services import agent_runtime, conversations, jobs, metrics
+from services.response_cache import bypass_requested
+from services.admission import AdmissionRejected, client_identity, rate_limiter
 
-# Import our agent wrapper module
-import agent_wrapper
-
-# Global variables for agent components
-planner_agent = None
-# Create a global event loop for async operations
+# Background event loop shared by all request threads (one per worker process)
 loop = None
-# Create a thread pool executor for running async tasks with timeouts
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+loop_pid = None
+loop_lock = threading.Lock()
+
+def init_event_loop(new_loop):
+    """Run the background event loop forever (thread target)."""
+    asyncio.set_event_loop(new_loop)
+    new_loop.run_forever()
 
 def get_event_loop():
-    """Get or create an event loop for async operations."""
-    global loop
-    if loop is None or loop.is_closed():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    """Return the background event loop, starting its thread on first use (after any fork)."""
+    global loop, loop_pid
+    if loop is None or loop.is_closed() or loop_pid != os.getpid():
+        with loop_lock:
+            # A loop inherited from the parent process has no thread running it
+            if loop is None or loop.is_closed() or loop_pid != os.getpid():
+                new_loop = asyncio.new_event_loop()
+                threading.Thread(target=init_event_loop, args=(new_loop,), daemon=True).start()
+                loop = new_loop
+                loop_pid = os.getpid()
     return loop
 
 def run_async_with_timeout(coro, timeout=25):
@@ -55,71 +67,122 @@ def run_async_with_timeout(coro, timeout=25):
         # Wait for the future to complete with a timeout
         return future.result(timeout)
     except concurrent.futures.TimeoutError:
+        if future.done():
+            # The coroutine raised its own timeout (e.g. its deadline expired)
+            raise
         # If the coroutine times out, cancel it and raise a timeout error
         future.cancel()
         raise TimeoutError(f"Operation timed out after {timeout} seconds")
 
-# Initialize agent components
-def init_agent_components():
-    """Initialize agent components with proper imports."""
-    global planner_agent
+def iterate_async_with_timeout(async_iterable, timeout=25):
+    """
+    Iterate an async iterable on the background loop from a request thread.
+    
+    Items are handed over through a queue so the caller can yield them as they
+    arrive. The underlying task is cancelled if the overall timeout expires or
+    the caller stops iterating early.
+    """
+    loop = get_event_loop()
+    items = queue.Queue()
+    done = object()
+    
+    async def pump():
+        try:
+            async for item in async_iterable:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(done)
+    
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    deadline = time.monotonic() + timeout
     
     try:
-        # Check if agent wrapper initialized correctly
-        if not agent_wrapper.Agent:
-            logger.error("Agent wrapper failed to initialize")
-            return False
-        
-        # Log successful import
-        logger.info("Successfully imported Agent SDK")
-        
-        # Import our agents
-        from custom_agents.planner_agent import PlannerAgent
-        
-        # Create our tools
-        calculator_tool = CalculatorTool()
-        
-        # Create the planner agent with calculator tool and web search handoff enabled
-        planner_agent_instance = PlannerAgent(
-            tools=[calculator_tool],
-            enable_web_search=True
-        )
-        planner_agent = planner_agent_instance
-        
-        logger.info("Successfully initialized PlannerAgent with tools and web search handoff capability")
-        return True
-        
-    except ImportError as e:
-        logger.error(f"Failed to import Agent SDK: {str(e)}")
-        return False
+        while True:
+            try:
+                item = items.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise TimeoutError(f"Operation timed out after {timeout} seconds")
+            
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+def warm_worker():
+    """
+    Warm up this worker process before it accepts requests (gunicorn post_worker_init).
+    
+    Starts the background loop and the job pool, then builds the agents and
+    primes the connection pool on the loop (see agent_runtime.warm_worker).
+    A failed or slow warm-up is logged, and the worker serves cold.
+    """
+    jobs.worker_pool.start(get_event_loop())
+    try:
+        return run_async_with_timeout(agent_runtime.warm_worker(), Config.WARM_UP_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Worker warm-up failed, serving without it: {str(e)}")
+        return {'ready': False}
 
-# Helper function to convert our tool to OpenAI function
-def convert_tool_to_function(tool):
-    """Convert our tool to an OpenAI function definition."""
-    # Use the tool's parameter_schema if available
-    if hasattr(tool, 'parameter_schema'):
-        parameters = tool.parameter_schema
-    else:
-        # Default schema if not provided
-        parameters = {
-            "type": "object",
-            "properties": {
-                "expression": {
-                    "type": "string", 
-                    "description": f"Input for {tool.name}"
-                }
-            },
-            "required": ["expression"]
-        }
+def drain_worker():
+    """
+    Let this worker's background jobs finish before it exits (gunicorn worker_exit).
     
-    return {
-        "type": "function",
-        "function": {
-            "name": tool.name,
-            "description": tool.description,
-            "parameters": parameters
-        }
-    }
+    Jobs still running after JOB_DRAIN_TIMEOUT seconds are put back in the queue.
+    """
+    if loop is None or loop_pid != os.getpid():
+        return
+    timeout = Config.JOB_DRAIN_TIMEOUT
+    try:
+        run_async_with_timeout(jobs.worker_pool.drain(timeout), timeout + Config.CANCEL_GRACE_PERIOD)
+    except Exception as e:
+        logger.warning(f"Draining background jobs failed: {str(e)}")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def start_log_sample():
+    """Decide whether this request's DEBUG records are logged; its run inherits the decision."""
+    g.log_sample = logs.start_sample()
+
+@app.teardown_request
+def end_log_sample(error=None):
+    token = g.pop('log_sample', None)
+    if token is not None:
+        logs.end_sample(token)
+
+@app.before_request
+def start_job_workers():
+    """Start this worker process's job pool on the background loop (once, after any fork)."""
+    jobs.worker_pool.start(get_event_loop())
+
+@app.after_request
+def observe_request(response):
+    """Record how long the Flask layer took to produce the response."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+def rejection_response(error):
+    """Answer a rejected run with its status (429 or 503) and a Retry-After header."""
+    logger.warning(f"Run not admitted ({error.reason}), retry after {error.retry_after} seconds")
+    return jsonify(error.as_dict()), error.status, error.headers()
+
+def start_turn(user_input):
+    """Return the conversation turn a query asks for ("conversation_id" or "conversation": true), or None."""
+    return conversations.start_turn(
+        user_input,
+        conversation_id=request.json.get('conversation_id'),
+        new=bool(request.json.get('conversation'))
+    )
 
 @app.route('/')
 def index():
@@ -129,142 +192,181 @@ def index():
 @app.route('/ask', methods=['POST'])
 def ask():
     """Handle user queries to the agent with a single agent session."""
+    deadline = Deadline(Config.RUN_TIMEOUT)
     user_input = request.json.get('query', '')
     
     if not user_input:
         return jsonify({'error': 'Empty query'}), 400
     
-    # Initialize agent components if not already done
-    if planner_agent is None:
-        success = init_agent_components()
-        if not success:
-            return jsonify({'error': 'Failed to initialize agent components'}), 500
-    
     try:
-        # Build the agent with required factories
-        agent = planner_agent.build(
-            agent_factory=agent_wrapper.Agent,
-            function_tool_factory=agent_wrapper.function_tool,
-            model_settings_factory=agent_wrapper.get_model_settings
-        )
-        
-        logger.debug(f"Agent built successfully with handoffs: {getattr(agent, 'handoffs', None)}")
-        
-        # Create a modified prompt that asks for a plan first, then execution
-        modified_prompt = f"""
-        For the following task: {user_input}
-        
-        First, I'll create a clear plan to address this request, then provide a comprehensive response.
-        
-        Please format your response in two distinct sections:
-        
-        1. "## Plan"
-        A concise, bulleted list of steps you'll take to answer this question. Keep it brief and focused.
-        If the task involves any calculations, explicitly mention that you'll use the calculator tool.
+        turn = start_turn(user_input)
         
-        2. "## Response"
-        Your complete, well-structured answer to the question. Include all relevant information, citations, 
-        and supporting details here. Make this section comprehensive and directly useful to the user.
+        # A bypassing request skips the lookup but still refreshes the entry
+        cache_key = agent_runtime.response_cache_key(user_input, turn)
+        if not bypass_requested(request.headers):
+            cached = agent_runtime.cached_answer(cache_key, turn)
+            if cached is not None:
+                return jsonify(cached)
         
-        Important instructions:
-        - For ANY mathematical calculations, use the 'calculate' tool rather than doing the math yourself.
-        - When using the calculator tool, show both the expression you're calculating and the result.
-        - Do not include "Execution" steps or numbered execution points in your response.
-        - Simply provide the final, polished answer in the Response section.
-        """
-        
-        # Run the agent with the modified prompt
-        run = agent_wrapper.create_run(
-            agent=agent,
-            messages=[
-                {
-                    "role": "user",
-                    "content": modified_prompt
-                }
-            ]
-        )
+        # Cached answers are free; runs count against the client's rate limit
+        rate_limiter.check(*client_identity(request.headers, session, request.remote_addr))
+        run = agent_runtime.create_query_run(user_input, deadline=deadline, turn=turn)
         
         # Start a background task to get the result with a timeout
         try:
             # Get the final result with a timeout
             start_time = time.time()
-            logger.debug(f"Starting agent run at {start_time}")
+            logger.debug("Starting agent run at %s", start_time)
             
-            # Use our timeout function to prevent hanging
-            result = run_async_with_timeout(run.get_final_run_result(), timeout=25)
+            # The run cancels itself at the deadline; the grace period lets it
+            # unwind and report its progress before we give up on it here
+            payload = run_async_with_timeout(
+                agent_runtime.run_query(run, cache_key=cache_key, turn=turn),
+                timeout=deadline.remaining() + Config.CANCEL_GRACE_PERIOD
+            )
             
             end_time = time.time()
-            logger.debug(f"Agent run completed in {end_time - start_time:.2f} seconds")
-            
-            # Parse the result to separate plan and execution
-            response_text = result.final_output
-            
-            # Extract plan and execution sections
-            plan = ""
-            execution = ""
-            
-            if "## Plan" in response_text and "## Response" in response_text:
-                parts = response_text.split("## Response")
-                if len(parts) >= 2:
-                    plan_section = parts[0]
-                    plan = plan_section.replace("## Plan", "").strip()
-                    execution = parts[1].strip()
-            else:
-                # If the format wasn't followed, make a best guess
-                plan = "The agent will search for information about your query and provide a comprehensive response with citations."
-                execution = response_text
+            logger.debug("Agent run completed in %.2f seconds", end_time - start_time)
             
             # Return both the plan and the execution result
-            return jsonify({
-                'plan': plan,
-                'response': execution,
-                'trace_id': getattr(result, 'trace_id', None),
-                'full_response': response_text
-            })
+            return jsonify(payload)
             
+        except AdmissionRejected as e:
+            return rejection_response(e)
         except TimeoutError as e:
             logger.error(f"Agent run timed out: {str(e)}")
             return jsonify({
                 'error': 'The request took too long to process. Please try a simpler query or try again later.',
-                'timeout': True
+                'timeout': True,
+                'progress': progress_report(e)
             }), 408
         
+    except AdmissionRejected as e:
+        return rejection_response(e)
     except Exception as e:
         logger.error(f"Error running agent: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/about')
-def about():
-    """Render the about page with information about the agent system."""
-    # Initialize agent components if not already done
-    if planner_agent is None:
-        init_agent_components()
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    """Handle user queries, streaming plan, response and tool events as SSE."""
+    deadline = Deadline(Config.STREAM_TIMEOUT)
+    user_input = request.json.get('query', '')
     
-    # Get tools from planner agent if available
-    tools = []
-    if planner_agent and hasattr(planner_agent, 'tools'):
-        for tool in planner_agent.tools:
-            tools.append({
-                'name': tool.name,
-                'description': tool.description
+    if not user_input:
+        return jsonify({'error': 'Empty query'}), 400
+    
+    try:
+        turn = start_turn(user_input)
+        cache_key = agent_runtime.response_cache_key(user_input, turn)
+        cached = None if bypass_requested(request.headers) else agent_runtime.cached_answer(cache_key, turn)
+        run = slot = None
+        if cached is None:
+            rate_limiter.check(*client_identity(request.headers, session, request.remote_addr))
+            # Admit the run before the response starts, so a rejection gets its own status
+            slot = run_async_with_timeout(agent_runtime.acquire_run_slot(deadline), timeout=deadline.remaining())
+            try:
+                run = agent_runtime.create_query_run(user_input, deadline=deadline, turn=turn)
+            except Exception:
+                slot.release()
+                raise
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        logger.error(f"Error creating streamed run: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        if cached is not None:
+            for name, data in agent_runtime.cached_events(cached):
+                yield format_sse(name, data)
+            return
+        
+        start_time = time.time()
+        
+        try:
+            events = iterate_async_with_timeout(
+                agent_runtime.stream_query(run, cache_key=cache_key, slot=slot, turn=turn),
+                timeout=deadline.remaining() + Config.CANCEL_GRACE_PERIOD
+            )
+            for name, data in events:
+                yield format_sse(name, data)
+            
+            logger.debug("Streamed agent run completed in %.2f seconds", time.time() - start_time)
+        except TimeoutError as e:
+            logger.error(f"Streamed agent run timed out: {str(e)}")
+            yield format_sse('error', {
+                'error': 'The request took too long to process. Please try a simpler query or try again later.',
+                'timeout': True,
+                'progress': progress_report(e)
             })
+        except Exception as e:
+            logger.error(f"Error streaming agent run: {str(e)}", exc_info=True)
+            yield format_sse('error', {'error': str(e)})
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if slot is not None:
+        # Also covers a client that disconnects before the stream starts
+        response.call_on_close(slot.release)
+    return response
+
+@app.route('/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    """Forget a conversation's history."""
+    if not conversations.delete_conversation(conversation_id):
+        return jsonify({'error': 'Conversation not found'}), 404
+    return '', 204
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a query as a background job; poll GET /jobs/<id> for the answer."""
+    user_input = request.json.get('query', '')
+    
+    if not user_input:
+        return jsonify({'error': 'Empty query'}), 400
     
-    return render_template('about.html', tools=tools, model=Config.DEFAULT_MODEL)
+    try:
+        rate_limiter.check(*client_identity(request.headers, session, request.remote_addr))
+        job = jobs.submit(user_input)
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        logger.error(f"Error queueing job: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify(job), 202, {'Location': url_for('get_job', job_id=job['id'])}
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Return the status of a job and, once it has finished, its answer or error."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
-# Initialize agent components when the module is loaded
-init_agent_components()
+@app.route('/metrics')
+def metrics_endpoint():
+    """Export run, phase, token and tool metrics in Prometheus format (all workers combined)."""
+    try:
+        body, content_type = metrics.render()
+    except RuntimeError as e:
+        return Response(str(e), status=501, mimetype='text/plain')
+    return Response(body, headers={'Content-Type': content_type})
 
-# Initialize the event loop in a background thread
-def init_event_loop():
-    global loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_forever()
+@app.route('/about')
+def about():
+    """Render the about page with information about the agent system."""
+    return render_template('about.html', tools=agent_runtime.describe_tools(), model=Config.DEFAULT_MODEL)
 
-# Start the event loop in a background thread
-import threading
-loop_thread = threading.Thread(target=init_event_loop, daemon=True)
-loop_thread.start()
+# Import the SDK and build the agents when the module is loaded; with
+# gunicorn --preload this runs once in the master, before workers fork
+startup_report = agent_runtime.warm_up()
+startup_report['total'] = round(time.perf_counter() - _import_started, 4)
+logger.info(f"Startup completed in {startup_report['total']:.3f} seconds")
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
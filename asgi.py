@@ -0,0 +1,260 @@
+"""
+ASGI serving mode.
+
+Serves the same routes as the Flask app with Quart, awaiting agent runs
+directly on the server's event loop instead of bridging request threads to a
+background loop. Concurrency is then bounded by outstanding awaits rather
+than by worker threads.
+
+Run with, for example:
+    hypercorn --bind 0.0.0.0:5000 asgi:app
+"""
+
+import time
+
+# Startup is measured from here (including the Quart and SDK imports)
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+import os
+
+from quart import Quart, Response, g, jsonify, render_template, request, session, url_for
+
+from config import Config
+from services.streaming import format_sse
+from services.deadline import Deadline, progress_report
+from services import agent_runtime, conversations, jobs, logs, metrics
+from services.response_cache import bypass_requested
+from services.admission import AdmissionRejected, client_identity, rate_limiter
+from tools.executor import tool_executor
+
+# Configure logging first
+logs.configure()
+logger = logging.getLogger(__name__)
+
+# Reuse the Flask templates and static files
+app = Quart(__name__, template_folder="templates", static_folder="static")
+app.secret_key = os.environ.get("SESSION_SECRET", "dev_key")
+
+
+@app.before_serving
+async def start_job_workers():
+    """Run this worker process's job pool on the server's loop, and start its tool workers."""
+    jobs.worker_pool.start(asyncio.get_running_loop())
+    await asyncio.to_thread(tool_executor.start)
+
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+async def start_log_sample():
+    """Decide whether this request's DEBUG records are logged; its run inherits the decision."""
+    g.log_sample = logs.start_sample()
+
+
+@app.teardown_request
+async def end_log_sample(error=None):
+    token = g.pop('log_sample', None)
+    if token is not None:
+        logs.end_sample(token)
+
+
+@app.after_request
+async def observe_request(response):
+    """Record how long the Quart layer took to produce the response."""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
+def rejection_response(error):
+    """Answer a rejected run with its status (429 or 503) and a Retry-After header."""
+    logger.warning(f"Run not admitted ({error.reason}), retry after {error.retry_after} seconds")
+    return jsonify(error.as_dict()), error.status, error.headers()
+
+
+async def start_turn(user_input, data):
+    """Return the conversation turn a query asks for ("conversation_id" or "conversation": true), or None."""
+    return await asyncio.to_thread(
+        conversations.start_turn, user_input,
+        conversation_id=data.get('conversation_id'), new=bool(data.get('conversation'))
+    )
+
+
+@app.route('/')
+async def index():
+    """Render the main page."""
+    return await render_template('index.html')
+
+
+@app.route('/ask', methods=['POST'])
+async def ask():
+    """Handle user queries, awaiting the agent run on the server's loop."""
+    deadline = Deadline(Config.RUN_TIMEOUT)
+    data = await request.get_json()
+    user_input = (data or {}).get('query', '')
+
+    if not user_input:
+        return jsonify({'error': 'Empty query'}), 400
+
+    try:
+        turn = await start_turn(user_input, data)
+
+        # A bypassing request skips the lookup but still refreshes the entry
+        cache_key = agent_runtime.response_cache_key(user_input, turn)
+        if not bypass_requested(request.headers):
+            cached = await asyncio.to_thread(agent_runtime.cached_answer, cache_key, turn)
+            if cached is not None:
+                return jsonify(cached)
+
+        # Cached answers are free; runs count against the client's rate limit
+        rate_limiter.check(*client_identity(request.headers, session, request.remote_addr))
+
+        # The run cancels itself when the deadline expires
+        run = agent_runtime.create_query_run(user_input, deadline=deadline, turn=turn)
+
+        start_time = time.time()
+        payload = await agent_runtime.run_query(run, cache_key=cache_key, turn=turn)
+        logger.debug("Agent run completed in %.2f seconds", time.time() - start_time)
+
+        return jsonify(payload)
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except TimeoutError as e:
+        logger.error(f"Agent run timed out: {str(e)}")
+        return jsonify({
+            'error': 'The request took too long to process. Please try a simpler query or try again later.',
+            'timeout': True,
+            'progress': progress_report(e)
+        }), 408
+    except Exception as e:
+        logger.error(f"Error running agent: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/ask/stream', methods=['POST'])
+async def ask_stream():
+    """Handle user queries, streaming plan, response and tool events as SSE."""
+    data = await request.get_json()
+    user_input = (data or {}).get('query', '')
+
+    if not user_input:
+        return jsonify({'error': 'Empty query'}), 400
+
+    deadline = Deadline(Config.STREAM_TIMEOUT)
+    try:
+        turn = await start_turn(user_input, data)
+        cache_key = agent_runtime.response_cache_key(user_input, turn)
+        cached = None
+        if not bypass_requested(request.headers):
+            cached = await asyncio.to_thread(agent_runtime.cached_answer, cache_key, turn)
+        run = slot = None
+        if cached is None:
+            rate_limiter.check(*client_identity(request.headers, session, request.remote_addr))
+            # Admit the run before the response starts, so a rejection gets its own status
+            slot = await agent_runtime.acquire_run_slot(deadline)
+            try:
+                run = agent_runtime.create_query_run(user_input, deadline=deadline, turn=turn)
+            except Exception:
+                slot.release()
+                raise
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        logger.error(f"Error creating streamed run: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+    async def generate():
+        if cached is not None:
+            for name, event in agent_runtime.cached_events(cached):
+                yield format_sse(name, event)
+            return
+        try:
+            async for name, event in agent_runtime.stream_query(run, cache_key=cache_key, slot=slot, turn=turn):
+                yield format_sse(name, event)
+        except TimeoutError as e:
+            logger.error(f"Streamed agent run timed out: {str(e)}")
+            yield format_sse('error', {
+                'error': 'The request took too long to process. Please try a simpler query or try again later.',
+                'timeout': True,
+                'progress': progress_report(e)
+            })
+        except Exception as e:
+            logger.error(f"Error streaming agent run: {str(e)}", exc_info=True)
+            yield format_sse('error', {'error': str(e)})
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None
+    if slot is not None:
+        # Backstop in case the client disconnects before the stream starts
+        asyncio.get_running_loop().call_later(deadline.remaining() + Config.CANCEL_GRACE_PERIOD, slot.release)
+    return response
+
+
+@app.route('/conversations/<conversation_id>', methods=['DELETE'])
+async def delete_conversation(conversation_id):
+    """Forget a conversation's history."""
+    if not await asyncio.to_thread(conversations.delete_conversation, conversation_id):
+        return jsonify({'error': 'Conversation not found'}), 404
+    return '', 204
+
+
+@app.route('/jobs', methods=['POST'])
+async def submit_job():
+    """Queue a query as a background job; poll GET /jobs/<id> for the answer."""
+    data = await request.get_json()
+    user_input = (data or {}).get('query', '')
+
+    if not user_input:
+        return jsonify({'error': 'Empty query'}), 400
+
+    try:
+        rate_limiter.check(*client_identity(request.headers, session, request.remote_addr))
+        job = await asyncio.to_thread(jobs.submit, user_input)
+    except AdmissionRejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        logger.error(f"Error queueing job: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify(job), 202, {'Location': url_for('get_job', job_id=job['id'])}
+
+
+@app.route('/jobs/<job_id>')
+async def get_job(job_id):
+    """Return the status of a job and, once it has finished, its answer or error."""
+    job = await asyncio.to_thread(jobs.get_job, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    """Export run, phase, token and tool metrics in Prometheus format (all workers combined)."""
+    try:
+        body, content_type = metrics.render()
+    except RuntimeError as e:
+        return Response(str(e), status=501, mimetype='text/plain')
+    return Response(body, headers={'Content-Type': content_type})
+
+
+@app.route('/about')
+async def about():
+    """Render the about page with information about the agent system."""
+    return await render_template('about.html', tools=agent_runtime.describe_tools(), model=Config.DEFAULT_MODEL)
+
+
+# Import the SDK and build the agents when the module is loaded; with
+# gunicorn --preload this runs once in the master, before workers fork
+startup_report = agent_runtime.warm_up()
+startup_report['total'] = round(time.perf_counter() - _import_started, 4)
+logger.info(f"Startup completed in {startup_report['total']:.3f} seconds")
@@ -0,0 +1,262 @@
+"""
+Offline load test for the /ask pipeline.
+
+Starts the Flask app in-process with the replay model backend (no network,
+no API key), drives /ask at a fixed concurrency with the fixture queries and
+reports latency percentiles, throughput and where the time went per phase
+(from /metrics). Exits non-zero when a --max-p95 or --max-errors gate fails,
+so it can guard against performance regressions in CI.
+
+Examples:
+    python benchmarks/load_test.py --concurrency 16 --requests 200
+    python benchmarks/load_test.py --latency-scale 0.1 --max-p95 1.5 --json
+    python benchmarks/load_test.py --url http://127.0.0.1:5000  # a running server
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures", "ask.json")
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Return the p-th percentile (nearest rank) of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def parse_metrics(text: str) -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+    """Parse Prometheus text exposition into {(name, labels): value}."""
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match or line.startswith("#"):
+            continue
+        name, labels, value = match.groups()
+        samples[(name, tuple(sorted(_LABEL.findall(labels or ""))))] = float(value)
+    return samples
+
+
+def fetch_metrics(base_url: str) -> Optional[Dict]:
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+            return parse_metrics(response.read().decode("utf-8"))
+    except urllib.error.URLError:
+        return None
+
+
+def phase_breakdown(before: Dict, after: Dict) -> Dict[str, Dict[str, float]]:
+    """
+    Return count, total and mean seconds per phase between two metric scrapes.
+
+    Phases are the run phases (build, queue, model_turn, tool_call, handoff)
+    by name, whole runs by mode and by route, and the HTTP layer.
+    """
+    totals = defaultdict(lambda: {"count": 0.0, "seconds": 0.0})
+    for (name, labels), value in after.items():
+        labels = dict(labels)
+        if name == "agent_phase_seconds_sum":
+            key = f"{labels['phase']}:{labels['name']}"
+        elif name == "agent_run_seconds_sum":
+            key = f"run:{labels['mode']}:{labels['outcome']}"
+        elif name == "route_run_seconds_sum":
+            key = f"route:{labels['route']}:{labels['outcome']}"
+        elif name == "http_request_seconds_sum":
+            key = f"http:{labels['endpoint']}"
+        else:
+            continue
+        count_key = (name[:-len("_sum")] + "_count", tuple(sorted(labels.items())))
+        sum_key = (name, tuple(sorted(labels.items())))
+        totals[key]["seconds"] += value - before.get(sum_key, 0.0)
+        totals[key]["count"] += after.get(count_key, 0.0) - before.get(count_key, 0.0)
+
+    return {
+        key: {"count": int(t["count"]), "total": round(t["seconds"], 4),
+              "mean": round(t["seconds"] / t["count"], 4)}
+        for key, t in sorted(totals.items()) if t["count"]
+    }
+
+
+def token_usage(before: Dict, after: Dict) -> Dict[str, Dict[str, int]]:
+    """Return input, cached input and output tokens per model between two metric scrapes."""
+    usage = defaultdict(dict)
+    for (name, labels), value in after.items():
+        if name != "agent_tokens_total":
+            continue
+        labels = dict(labels)
+        usage[labels["model"]][labels["kind"]] = int(value - before.get((name, tuple(sorted(labels.items()))), 0.0))
+    return dict(sorted(usage.items()))
+
+
+def start_local_server(args) -> str:
+    """Import the app with the replay backend and serve it on a free local port."""
+    os.environ["MODEL_BACKEND"] = "replay"
+    os.environ["REPLAY_FIXTURES"] = args.fixtures
+    os.environ["REPLAY_LATENCY_SCALE"] = str(args.latency_scale)
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    # All requests come from one client; measure the pipeline, not the rate limiter
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_BACKEND"] = "none"
+        os.environ["SEMANTIC_CACHE"] = "false"
+    sys.path.insert(0, ROOT)
+
+    from werkzeug.serving import make_server
+    import app as flask_app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = make_server("127.0.0.1", port, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def ask(base_url: str, query: str, timeout: float) -> Tuple[float, int]:
+    """Send one /ask request; return its latency and HTTP status (0 on connection errors)."""
+    body = json.dumps({"query": query}).encode("utf-8")
+    request = urllib.request.Request(f"{base_url}/ask", data=body, headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.loads(response.read())
+            status = response.status
+            if str(payload.get("response", "")).startswith("Error:"):
+                status = 500
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, TimeoutError):
+        status = 0
+    return time.perf_counter() - started, status
+
+
+def run_load(base_url: str, queries: List[str], concurrency: int, requests: int, timeout: float) -> Dict[str, Any]:
+    """Send ``requests`` /ask requests from ``concurrency`` threads, cycling through queries."""
+    counter = itertools.count()
+    results: List[Tuple[float, int]] = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            result = ask(base_url, queries[index % len(queries)], timeout)
+            with lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, status in results if status == 200]
+    statuses = defaultdict(int)
+    for _, status in results:
+        statuses[status] += 1
+
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "errors": len(results) - len(latencies),
+        "statuses": dict(statuses),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "max": round(max(latencies, default=0.0), 4),
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+        },
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report["latency"]
+    print(f"Requests:    {report['requests']} at concurrency {report['concurrency']} "
+          f"({report['errors']} errors, statuses {report['statuses']})")
+    print(f"Throughput:  {report['throughput']} req/s over {report['elapsed']} s")
+    print(f"Latency:     p50 {latency['p50']:.3f} s, p95 {latency['p95']:.3f} s, "
+          f"p99 {latency['p99']:.3f} s, max {latency['max']:.3f} s")
+    phases = report.get("phases")
+    if phases is None:
+        print("Phases:      unavailable (no /metrics; is prometheus_client installed?)")
+        return
+    print("Phases:")
+    for key, phase in phases.items():
+        print(f"  {key:<40} {phase['count']:>6} x {phase['mean']:.4f} s = {phase['total']:.2f} s")
+    print("Tokens:")
+    for model, usage in report["tokens"].items():
+        input_tokens, cached = usage.get("input", 0), usage.get("cached_input", 0)
+        share = cached / input_tokens if input_tokens else 0.0
+        print(f"  {model:<40} {input_tokens:>8} input ({cached} cached, {share:.0%}), "
+              f"{usage.get('output', 0)} output")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test for /ask")
+    parser.add_argument("--url", help="Base URL of a running server (default: start one in-process)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Replay fixture file")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplies recorded model latencies")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache enabled")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--max-p95", type=float, help="Fail if the p95 latency exceeds this many seconds")
+    parser.add_argument("--max-errors", type=int, default=0, help="Fail if more requests than this fail")
+    args = parser.parse_args(argv)
+
+    with open(args.fixtures, encoding="utf-8") as f:
+        queries = json.load(f).get("queries") or ["What is 2 + 2?"]
+
+    base_url = args.url.rstrip("/") if args.url else start_local_server(args)
+
+    # One warm-up request so first-use costs don't skew the percentiles
+    ask(base_url, queries[0], args.timeout)
+
+    before = fetch_metrics(base_url)
+    report = run_load(base_url, queries, args.concurrency, args.requests, args.timeout)
+    after = fetch_metrics(base_url)
+    report["phases"] = phase_breakdown(before, after) if before is not None and after is not None else None
+    report["tokens"] = token_usage(before, after) if report["phases"] is not None else None
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failed = report["errors"] > args.max_errors
+    if args.max_p95 is not None and report["latency"]["p95"] > args.max_p95:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
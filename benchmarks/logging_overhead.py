@@ -0,0 +1,193 @@
+"""
+Per-request cost of logging on the /ask path.
+
+Runs the Flask app in a child process per logging profile, with the replay
+model backend at zero latency so the pipeline itself is measured, and
+stderr going to a file so log writes are real I/O. Each child sends the same
+/ask requests one after another and reports the mean, p50 and p95 latency,
+the CPU time and the log bytes written per request. The profiles run
+interleaved for --rounds rounds and the best round of each is kept. The
+overhead of a profile is its mean latency minus that of a profile that logs
+nothing.
+
+With --slow-sink, stderr is a pipe drained slowly (like a backed-up log
+collector) instead of a file: log writes made on the request path then
+block the requests, while queued records wait for the listener thread.
+
+Profiles:
+    before    DEBUG for every logger, written on the logging thread
+              (what logging.basicConfig(level=logging.DEBUG) did)
+    debug     DEBUG for every logger, written by the queue listener
+    info      the default: INFO, noisy libraries at WARNING, queued
+    sampled   info, plus DEBUG records of 1% of the requests (LOG_DEBUG_SAMPLE_RATE)
+    silent    nothing logged (the baseline)
+
+Examples:
+    python benchmarks/logging_overhead.py --requests 300 --rounds 3
+    python benchmarks/logging_overhead.py --profiles before,debug,info --slow-sink 0.002
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import DEFAULT_FIXTURES, ROOT, percentile
+
+PROFILES = {
+    "before": {"LOG_LEVEL": "DEBUG", "LOG_LEVELS": "", "LOG_ASYNC": "false"},
+    "debug": {"LOG_LEVEL": "DEBUG", "LOG_LEVELS": "", "LOG_ASYNC": "true"},
+    "info": {"LOG_LEVEL": "INFO", "LOG_ASYNC": "true"},
+    "sampled": {"LOG_LEVEL": "INFO", "LOG_ASYNC": "true", "LOG_DEBUG_SAMPLE_RATE": "0.01"},
+    "silent": {"LOG_LEVEL": "CRITICAL", "LOG_LEVELS": "", "LOG_ASYNC": "true"},
+}
+
+
+def run_child(requests: int, fixtures: str) -> Dict[str, Any]:
+    """Send the /ask requests through the app's test client in this process."""
+    sys.path.insert(0, ROOT)
+    import app as flask_app
+    from services import logs
+
+    with open(fixtures, encoding="utf-8") as f:
+        queries = json.load(f).get("queries") or ["What is 2 + 2?"]
+    client = flask_app.app.test_client()
+    for query in queries:
+        client.post("/ask", json={"query": query})
+
+    latencies = []
+    cpu_started = time.process_time()
+    for index in range(requests):
+        started = time.perf_counter()
+        response = client.post("/ask", json={"query": queries[index % len(queries)]})
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"/ask returned {response.status_code}")
+    cpu = (time.process_time() - cpu_started) / requests
+    stats = logs.stats()
+    logs.shutdown()
+    return {
+        "cpu": cpu,
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "dropped": stats["dropped"],
+        "sampled": stats["sampled"],
+    }
+
+
+class SlowReader(threading.Thread):
+    """Read a pipe in 4 KiB chunks with a pause after each, counting the bytes."""
+
+    def __init__(self, pipe, pause: float):
+        super().__init__(daemon=True)
+        self.pipe = pipe
+        self.pause = pause
+        self.bytes = 0
+
+    def run(self) -> None:
+        while True:
+            chunk = self.pipe.read(4096)
+            if not chunk:
+                return
+            self.bytes += len(chunk)
+            time.sleep(self.pause)
+
+    def wait(self) -> int:
+        self.join()
+        return self.bytes
+
+
+def drain_slowly(pipe, pause: float) -> SlowReader:
+    reader = SlowReader(pipe, pause)
+    reader.start()
+    return reader
+
+
+def measure(profile: str, args) -> Dict[str, Any]:
+    """Run one profile in a child process and return its report."""
+    with tempfile.TemporaryDirectory(prefix="logging-overhead-") as tmp:
+        env = dict(
+            os.environ,
+            MODEL_BACKEND="replay",
+            REPLAY_FIXTURES=args.fixtures,
+            REPLAY_LATENCY_SCALE="0",
+            RESPONSE_CACHE_BACKEND="none",
+            SEMANTIC_CACHE="false",
+            RATE_LIMIT_PER_MINUTE="0",
+            WEB_SEARCH_BACKEND="local",
+            JOBS_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'jobs.sqlite3')}",
+            CONVERSATIONS_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'conversations.sqlite3')}",
+            **PROFILES[profile],
+        )
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)  # Metrics stay in the child's memory
+        env.setdefault("OPENAI_API_KEY", "replay")
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--requests", str(args.requests),
+                   "--fixtures", args.fixtures]
+        if args.slow_sink:
+            child = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, text=True)
+            written = drain_slowly(child.stderr, args.slow_sink)
+            output = child.stdout.read()
+            if child.wait() != 0:
+                raise RuntimeError(f"Profile {profile} failed")
+            log_bytes = written.wait()
+        else:
+            log_path = os.path.join(tmp, "stderr.log")
+            with open(log_path, "w") as log:
+                output = subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=log,
+                                        text=True, check=True).stdout
+            log_bytes = os.path.getsize(log_path)
+        report = json.loads(output.strip().splitlines()[-1])
+        # Startup and warm-up logging is included; it is small next to the measured requests
+        report["log_bytes"] = log_bytes / args.requests
+    return report
+
+
+def print_table(reports: Dict[str, Dict[str, Any]]) -> None:
+    baseline = reports["silent"]["mean"]
+    print(f"{'profile':>8} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'overhead ms':>11} {'cpu ms':>7} "
+          f"{'log B/req':>9} {'dropped':>7}")
+    for profile, r in reports.items():
+        print(f"{profile:>8} {r['mean'] * 1000:>8.2f} {r['p50'] * 1000:>7.2f} {r['p95'] * 1000:>7.2f} "
+              f"{(r['mean'] - baseline) * 1000:>11.2f} {r['cpu'] * 1000:>7.2f} {r['log_bytes']:>9.0f} {r['dropped']:>7}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Per-request logging overhead on /ask")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated profiles to run")
+    parser.add_argument("--rounds", type=int, default=1, help="Interleaved rounds; the best of each profile is kept")
+    parser.add_argument("--slow-sink", type=float, default=0.0,
+                        help="Write stderr to a pipe drained 4 KiB per this many seconds instead of a file")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Replay fixture file")
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.requests, args.fixtures)))
+        return 0
+
+    profiles = [p for p in args.profiles.split(",") if p != "silent"] + ["silent"]
+    reports: Dict[str, Dict[str, Any]] = {}
+    for _ in range(args.rounds):
+        for profile in profiles:
+            report = measure(profile, args)
+            if profile not in reports or report["mean"] < reports[profile]["mean"]:
+                reports[profile] = report
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_table(reports)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Throughput of the gunicorn serving profile as the number of workers grows.
+
+For each worker count, starts gunicorn (gunicorn.conf.py) with the replay
+model backend on a free local port, measures how long it takes to serve
+and the latency of the first request, drives /ask at a fixed concurrency
+(see load_test.py) and shuts the server down gracefully. Every worker has
+its own admission limits, event loop and connection pool, so throughput
+should grow with the workers until the cores (or the queries' model
+latency) are the limit.
+
+Examples:
+    python benchmarks/worker_scaling.py --workers 1,2,4 --concurrency 32 --requests 300
+    python benchmarks/worker_scaling.py --workers 1,2 --no-preload --json
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import DEFAULT_FIXTURES, ROOT, ask, run_load
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_serving(base_url: str, process: subprocess.Popen, timeout: float) -> bool:
+    """Poll /about until the server answers; False if it exits or takes longer than timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"{base_url}/about", timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def measure(workers: int, queries: List[str], args) -> Dict[str, Any]:
+    """Start gunicorn with this many workers, load it and stop it."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="worker-scaling-") as tmp:
+        env = dict(
+            os.environ,
+            BIND=f"127.0.0.1:{port}",
+            WEB_CONCURRENCY=str(workers),
+            PRELOAD_APP="false" if args.no_preload else "true",
+            MODEL_BACKEND="replay",
+            REPLAY_FIXTURES=args.fixtures,
+            REPLAY_LATENCY_SCALE=str(args.latency_scale),
+            RESPONSE_CACHE_BACKEND="none",
+            SEMANTIC_CACHE="false",
+            RATE_LIMIT_PER_MINUTE="0",
+            PROMETHEUS_MULTIPROC_DIR=os.path.join(tmp, "metrics"),
+            JOBS_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'jobs.sqlite3')}",
+            CONVERSATIONS_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'conversations.sqlite3')}",
+        )
+        env.setdefault("OPENAI_API_KEY", "replay")
+        log_path = os.path.join(tmp, "gunicorn.log")
+        with open(log_path, "w") as log:
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "--config", os.path.join(ROOT, "gunicorn.conf.py"), "main:app"],
+                cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+            try:
+                if not wait_until_serving(base_url, process, args.start_timeout):
+                    with open(log_path) as f:
+                        sys.stderr.write(f.read()[-4000:])
+                    raise RuntimeError(f"gunicorn with {workers} worker(s) did not start")
+                ready = time.perf_counter() - started
+                first, _ = ask(base_url, queries[0], args.timeout)
+                report = run_load(base_url, queries, args.concurrency, args.requests, args.timeout)
+            finally:
+                process.send_signal(signal.SIGTERM)
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+    report.update(workers=workers, ready=round(ready, 3), first_request=round(first, 4))
+    return report
+
+
+def print_table(reports: List[Dict[str, Any]]) -> None:
+    baseline = reports[0]["throughput"] or 1.0
+    print(f"{'workers':>7} {'ready s':>8} {'first s':>8} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} {'errors':>6} {'speedup':>7}")
+    for r in reports:
+        print(f"{r['workers']:>7} {r['ready']:>8.2f} {r['first_request']:>8.3f} {r['throughput']:>8.2f} "
+              f"{r['latency']['p50']:>7.3f} {r['latency']['p95']:>7.3f} {r['errors']:>6} "
+              f"{r['throughput'] / baseline:>6.2f}x")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Throughput of /ask as gunicorn workers are added")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Replay fixture file")
+    parser.add_argument("--latency-scale", type=float, default=0.2, help="Multiplies recorded model latencies")
+    parser.add_argument("--no-preload", action="store_true", help="Import the app in every worker instead")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request in seconds")
+    parser.add_argument("--start-timeout", type=float, default=60.0, help="Seconds allowed for gunicorn to start")
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.fixtures, encoding="utf-8") as f:
+        queries = json.load(f).get("queries") or ["What is 2 + 2?"]
+
+    reports = [measure(int(count), queries, args) for count in args.workers.split(",")]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print(f"{os.cpu_count()} core(s), concurrency {args.concurrency}, {args.requests} requests per run")
+        print_table(reports)
+    return 1 if any(r["errors"] for r in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,14 +7,132 @@ class Config:
     # OpenAI API settings
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
     
+    # OpenAI connection pool settings (one pool per worker process)
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))  # Seconds an idle connection is kept
+    OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "false").lower() == "true"  # Requires the h2 package
+    
+    # Model backend: "openai", or "replay" to answer from recorded fixtures offline (benchmarks)
+    MODEL_BACKEND = os.getenv("MODEL_BACKEND", "openai").lower()
+    REPLAY_FIXTURES = os.getenv("REPLAY_FIXTURES", os.path.join("benchmarks", "fixtures", "ask.json"))
+    REPLAY_LATENCY_SCALE = float(os.getenv("REPLAY_LATENCY_SCALE", "1.0"))  # Multiplies recorded latencies
+    
     # Agent settings
-    DEFAULT_MODEL = "o3-mini"  # Using o3-mini for planning, with handoff to gpt-4o-mini for web search
+    DEFAULT_MODEL = "o3-mini"  # Using o3-mini for planning; web search is a tool of the planner
     DEFAULT_REASONING_EFFORT = "medium"  # Medium reasoning effort
     
+    # Query routing: arithmetic is evaluated directly, simple questions get one fast model turn,
+    # everything else goes to the planner
+    ENABLE_ROUTING = os.getenv("ENABLE_ROUTING", "true").lower() == "true"
+    FAST_MODEL = os.getenv("FAST_MODEL", "gpt-4o-mini")
+    ROUTER_FAST_MAX_WORDS = int(os.getenv("ROUTER_FAST_MAX_WORDS", "30"))  # Longer queries go to the planner
+    ROUTER_CLASSIFIER_MODEL = os.getenv("ROUTER_CLASSIFIER_MODEL", "")  # e.g. "gpt-4o-mini" to confirm fast routes
+    PLANNER_REASONING_EFFORT = os.getenv("PLANNER_REASONING_EFFORT", DEFAULT_REASONING_EFFORT)
+    FAST_REASONING_EFFORT = os.getenv("FAST_REASONING_EFFORT", "")  # Only for a reasoning FAST_MODEL
+    
+    # Plan execution: "sequential" (one planner conversation) or "parallel" (structured plan whose
+    # independent steps run concurrently, then a synthesis turn)
+    PLAN_EXECUTION = os.getenv("PLAN_EXECUTION", "sequential").lower()
+    FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "4"))  # Plan steps running at a time per run
+    MAX_PLAN_STEPS = int(os.getenv("MAX_PLAN_STEPS", "8"))
+    
     # Web search settings
     SEARCH_RESULT_COUNT = 5
     SEARCH_TIMEOUT = 10  # Timeout in seconds
+    WEB_SEARCH_BACKEND = os.getenv("WEB_SEARCH_BACKEND", "agent").lower()  # "agent" (hosted search) or "local" (offline)
+    WEB_SEARCH_CORPUS = os.getenv("WEB_SEARCH_CORPUS")  # Optional JSON corpus for the local backend
+    WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "900"))  # Seconds a search result stays fresh
+    WEB_SEARCH_CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "500"))  # Maximum number of cached searches
+    WEB_SEARCH_CONCURRENCY = int(os.getenv("WEB_SEARCH_CONCURRENCY", "8"))  # Search tool calls at a time per event loop; 0 for no limit
     
+    # Tool executor (tools.executor): CPU-bound tools run in a warm pool of worker processes
+    TOOL_EXECUTOR = os.getenv("TOOL_EXECUTOR", "process").lower()  # "process", or "inline" (calling thread, no limits)
+    TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "2"))  # Worker processes per server process
+    TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "5"))  # Wall-clock seconds per call; overrunning workers are replaced
+    TOOL_QUEUE_SIZE = int(os.getenv("TOOL_QUEUE_SIZE", "32"))  # Calls waiting for a worker; more are rejected
+    TOOL_QUEUE_TIMEOUT = float(os.getenv("TOOL_QUEUE_TIMEOUT", "5"))  # Max seconds a call waits for a worker
+    TOOL_MEMORY_LIMIT_MB = int(os.getenv("TOOL_MEMORY_LIMIT_MB", "1024"))  # Address space of a worker; 0 for no limit
+    TOOL_CPU_LIMIT = int(os.getenv("TOOL_CPU_LIMIT", "5"))  # CPU seconds per call before the worker is killed; 0 for none
+
+    # Tool middleware (tools.middleware): applied to every function tool given to the agents
+    TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "30"))  # Seconds per call for tools without their own; 0 for none
+    TOOL_MEMO_SIZE = int(os.getenv("TOOL_MEMO_SIZE", "512"))  # Results kept per deterministic tool; 0 disables memoization
+
+    # Run deadlines
+    RUN_TIMEOUT = 25  # Per-request budget in seconds for /ask
+    STREAM_TIMEOUT = 120  # Overall limit in seconds for a streamed run
+    CANCEL_GRACE_PERIOD = 2  # Extra seconds allowed for a cancelled run to unwind
+
+    # Serving profile (gunicorn.conf.py): preforked workers that are warm before they take requests
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))  # Worker processes; 0 sizes them to the available cores
+    WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))  # Request threads per worker; 0 fits admitted and queued runs
+    PRELOAD_APP = os.getenv("PRELOAD_APP", "true").lower() == "true"  # Import the SDK and build agents before forking
+    WARM_UP_CONNECTIONS = int(os.getenv("WARM_UP_CONNECTIONS", "2"))  # API connections a worker opens before serving
+    WARM_UP_TIMEOUT = float(os.getenv("WARM_UP_TIMEOUT", "10"))  # Max seconds a worker spends warming up
+    GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", str(STREAM_TIMEOUT + CANCEL_GRACE_PERIOD)))  # Drain on reload
+    JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "10"))  # Seconds an exiting worker waits for its jobs
+
+    # Admission control (per worker process): concurrent runs, and a bounded queue in front of them
+    ADMISSION_MAX_CONCURRENT_RUNS = int(os.getenv("ADMISSION_MAX_CONCURRENT_RUNS", "10"))
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "20"))  # Runs beyond this are rejected with 503
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))  # Max seconds a run waits for a slot
+
+    # Per-client rate limits (configured API key, session or IP address); 0 disables them
+    RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))
+    RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "5"))  # Runs a client may start back to back
+    RATE_LIMIT_CLIENTS = int(os.getenv("RATE_LIMIT_CLIENTS", "10000"))  # Maximum number of clients tracked
+    # API keys that identify a client to the rate limiter (comma-separated); other keys are ignored
+    RATE_LIMIT_API_KEYS = frozenset(key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip())
+
+    # Background jobs (POST /jobs): stored in DATABASE_URL if set (PostgreSQL), else a local SQLite file
+    JOBS_DATABASE_URL = os.getenv("JOBS_DATABASE_URL") or os.getenv("DATABASE_URL") or "sqlite:///instance/jobs.sqlite3"
+    JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))  # Budget in seconds for a job's run
+    JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))  # Jobs run at a time per worker process
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # Seconds between checks for new jobs
+    JOB_LEASE = float(os.getenv("JOB_LEASE", "30"))  # Seconds before a job of a dead worker is picked up again
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))  # Starts before an interrupted job is failed
+    JOB_MAX_DEFERRALS = int(os.getenv("JOB_MAX_DEFERRALS", "10"))  # Times a job is not admitted before it is failed
+    JOB_MAX_DEFERRAL_DELAY = float(os.getenv("JOB_MAX_DEFERRAL_DELAY", "300"))  # Cap of the backoff between them
+    JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))  # Seconds finished jobs are kept
+
+    # Conversations: follow-up queries (conversation_id) get the earlier turns' items as run input
+    ENABLE_CONVERSATIONS = os.getenv("ENABLE_CONVERSATIONS", "true").lower() == "true"
+    CONVERSATIONS_DATABASE_URL = (os.getenv("CONVERSATIONS_DATABASE_URL") or os.getenv("DATABASE_URL")
+                                  or "sqlite:///instance/conversations.sqlite3")
+    CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "8000"))  # History beyond this is compacted
+    CONVERSATION_KEEP_TURNS = int(os.getenv("CONVERSATION_KEEP_TURNS", "2"))  # Latest turns never compacted
+    CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(24 * 3600)))  # Seconds kept after the last turn
+
+    # Response cache for /ask ("sqlite" is shared by all workers, "memory" is per worker, "none" disables it)
+    RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "sqlite").lower()
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join("instance", "response_cache.sqlite3"))
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))  # Maximum number of cached answers
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # Seconds an answer stays fresh
+
+    # Semantic response cache (services.semantic_cache): paraphrases of an answered query get its answer
+    SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "false").lower() == "true"  # Needs NumPy
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.75"))  # Minimum cosine similarity of a hit
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))  # Answers kept per worker
+    SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(RESPONSE_CACHE_TTL)))  # Seconds an answer can be served
+    # Only serve answers of queries with the same content words in the same order; turn off only
+    # with an embedder whose threshold was validated on near-miss queries ("inflation"/"deflation")
+    SEMANTIC_CACHE_MATCH_TERMS = os.getenv("SEMANTIC_CACHE_MATCH_TERMS", "true").lower() == "true"
+    SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "hashing")  # "hashing" or "module:Class"
+    SEMANTIC_CACHE_DIMENSIONS = int(os.getenv("SEMANTIC_CACHE_DIMENSIONS", "512"))  # Size of the hashing embedder's vectors
+    # Time-sensitive queries, never answered from the semantic cache
+    SEMANTIC_CACHE_VOLATILE = os.getenv(
+        "SEMANTIC_CACHE_VOLATILE",
+        r"\b(today|tonight|tomorrow|yesterday|now|current(ly)?|latest|recent(ly)?|this (week|month|year)|news|price|weather)\b")
+    
+    # Logging (services.logs): records are written by a background thread, levels are per logger
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING,openai=INFO")  # Per-logger levels, "name=LEVEL,..."
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "%(levelname)s:%(name)s:%(message)s")
+    LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"  # false writes records on the logging thread
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Records waiting to be written; more are dropped
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0"))  # Share of runs whose DEBUG records are kept
+
     # Tracing settings
     ENABLE_TRACING = True
     TRACE_WORKFLOW_NAME = "Agent with Planning and Search"
@@ -22,8 +140,8 @@ class Config:
     @classmethod
     def get_model_settings(cls) -> Dict[str, Any]:
         """Returns model settings dictionary."""
-        # Using default settings for model since reasoning is not supported
-        # in the ModelSettings class in the agents SDK
+        # Agents on reasoning models add "reasoning_effort", which
+        # agent_wrapper.get_model_settings turns into ModelSettings.reasoning
         return {
             # Removed temperature parameter as it's not supported with o3-mini model
         }
@@ -3,11 +3,14 @@
 
 # Import the agent classes when they're requested, but not at the module level
 # This breaks the circular import chain
-__all__ = ['BaseAgent', 'PlannerAgent', 'WebSearchAgent']
+__all__ = ['BaseAgent', 'PlannerAgent', 'QuickAnswerAgent', 'RouteClassifierAgent', 'StepPlannerAgent', 'WebSearchAgent']
 
 # These will be populated when they're first imported
 BaseAgent = None
 PlannerAgent = None
+QuickAnswerAgent = None
+RouteClassifierAgent = None
+StepPlannerAgent = None
 WebSearchAgent = None
 
 def __getattr__(name):
@@ -20,6 +23,18 @@ def __getattr__(name):
         from .planner_agent import PlannerAgent as _PlannerAgent
         globals()['PlannerAgent'] = _PlannerAgent
         return _PlannerAgent
+    elif name == 'QuickAnswerAgent':
+        from .quick_answer_agent import QuickAnswerAgent as _QuickAnswerAgent
+        globals()['QuickAnswerAgent'] = _QuickAnswerAgent
+        return _QuickAnswerAgent
+    elif name == 'RouteClassifierAgent':
+        from .route_classifier_agent import RouteClassifierAgent as _RouteClassifierAgent
+        globals()['RouteClassifierAgent'] = _RouteClassifierAgent
+        return _RouteClassifierAgent
+    elif name == 'StepPlannerAgent':
+        from .step_planner_agent import StepPlannerAgent as _StepPlannerAgent
+        globals()['StepPlannerAgent'] = _StepPlannerAgent
+        return _StepPlannerAgent
     elif name == 'WebSearchAgent':
         from .web_search_agent import WebSearchAgent as _WebSearchAgent
         globals()['WebSearchAgent'] = _WebSearchAgent
@@ -0,0 +1,98 @@
+"""
+Process-wide cache of built SDK agents.
+
+Building an SDK ``Agent`` wraps every tool (for the planner, including the
+web search tool from the registry) and creates ``ModelSettings``. The result only
+depends on the agent definition and the factories used, so it is built once per
+worker and reused until the cache is explicitly invalidated.
+"""
+
+import functools
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=128)
+def hash_text(text: str) -> str:
+    """Return a short, stable hash of a text (used for instructions)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class AgentBuildCache:
+    """A thread-safe dictionary of built agents keyed on agent configuration."""
+
+    def __init__(self):
+        self._entries: Dict[Hashable, Any] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: Hashable, builder: Callable[[], Any], placeholder: Any = None) -> Any:
+        """
+        Return the agent cached under ``key``, building it on a miss.
+
+        Args:
+            key: The configuration key of the agent
+            builder: A callable that builds the agent
+            placeholder: A value the builder returns when the build failed;
+                such results are returned but never cached
+
+        Returns:
+            The built agent
+        """
+        agent = self._entries.get(key)
+        if agent is not None:
+            self.hits += 1
+            return agent
+
+        with self._lock:
+            agent = self._entries.get(key)
+            if agent is not None:
+                self.hits += 1
+                return agent
+
+            self.misses += 1
+            agent = builder()
+            if agent is not None and agent is not placeholder:
+                self._entries[key] = agent
+            return agent
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """
+        Drop cached agents.
+
+        Args:
+            predicate: Optional filter on keys; all entries are dropped when omitted
+
+        Returns:
+            The number of entries removed
+        """
+        with self._lock:
+            if predicate is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [key for key in self._entries if predicate(key)]
+                for key in keys:
+                    del self._entries[key]
+                removed = len(keys)
+
+        logger.info(f"Invalidated {removed} cached agent build(s)")
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache size and hit/miss counters."""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Shared cache used by all agent definitions in this process
+build_cache = AgentBuildCache()
+
+
+def factories_key(*factories: Any) -> Tuple[int, ...]:
+    """Identify a set of factories; different factories produce different agents."""
+    return tuple(id(factory) for factory in factories)
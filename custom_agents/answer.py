@@ -0,0 +1,45 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class Citation(BaseModel):
+    """A source the answer is based on."""
+
+    title: str = Field(description="Title of the source page or document")
+    url: str = Field(description="URL of the source")
+
+
+class Calculation(BaseModel):
+    """A calculation done with the calculator tool."""
+
+    expression: str = Field(description="The expression as passed to the calculator")
+    result: str = Field(description="The calculator's result")
+
+
+class PlannedAnswer(BaseModel):
+    """
+    The structured answer of the planner and quick answer agents.
+
+    Fields are generated in this order, so a streamed answer shows its plan
+    before the response is written.
+    """
+
+    plan: List[str] = Field(description="The steps taken to answer, one short sentence each")
+    response: str = Field(description="The complete answer in Markdown, without the plan or a sources list")
+    citations: List[Citation] = Field(description="The sources the response is based on, empty if none")
+    calculations: List[Calculation] = Field(
+        description="Every calculation done with the calculator tool, with its result; empty if none"
+    )
+
+    def plan_text(self) -> str:
+        """Return the plan as a Markdown bullet list."""
+        return "\n".join(f"- {step}" for step in self.plan)
+
+    def to_markdown(self) -> str:
+        """Return the answer in the "## Plan" / "## Response" text format."""
+        return f"## Plan\n{self.plan_text()}\n\n## Response\n{self.response}"
+
+
+# The answer schema, part of the agents' build cache keys; computed once, not per build
+PLANNED_ANSWER_SCHEMA = repr(PlannedAnswer.model_json_schema())
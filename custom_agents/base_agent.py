@@ -2,6 +2,8 @@ from typing import List, Dict, Any, Optional, Type
 import logging
 
 from config import Config
+from custom_agents.agent_cache import build_cache, factories_key, hash_text
+from services import prompts
 
 class BaseAgent:
     """Base agent class that provides common functionality for all agents."""
@@ -12,16 +14,77 @@ class BaseAgent:
         
         Args:
             name: The agent's name
-            instructions: Instructions for the agent
+            instructions: Instructions for the agent; indentation is removed so
+                they are byte-identical however the source is formatted
             tools: Optional list of tools to provide to the agent
         """
         self.name = name
-        self.instructions = instructions
+        self.instructions = prompts.instructions(name, instructions)
         self.tools = tools or []
         self.model_name = Config.DEFAULT_MODEL
         self.model_settings_dict = Config.get_model_settings()
     
+    def config_key(self) -> tuple:
+        """
+        Return a hashable key describing everything the built agent depends on.
+        
+        Subclasses that add build-time options should extend this key.
+        """
+        tool_keys = tuple(
+            tool.cache_key() if hasattr(tool, 'cache_key') else (getattr(tool, 'name', repr(tool)), type(tool).__qualname__)
+            for tool in self.tools
+        )
+        settings_key = tuple(sorted((k, repr(v)) for k, v in self.model_settings_dict.items()))
+        return (
+            type(self).__qualname__,
+            self.name,
+            self.model_name,
+            hash_text(self.instructions),
+            tool_keys,
+            settings_key,
+        )
+    
+    def fingerprint(self) -> str:
+        """
+        Return a short hash of the whole agent graph this definition builds.
+        
+        Used to key caches of answers, so they are invalidated whenever a model,
+        instructions, tool or handoff target changes.
+        """
+        return hash_text(repr(self.config_key()))
+    
     def build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
+        """
+        Return the built Agent instance for this definition, building it once.
+        
+        Built agents are cached per process, keyed on the agent configuration
+        and the factories, so repeated calls are a dictionary lookup.
+        
+        Args:
+            agent_factory: A function that creates an Agent instance
+            function_tool_factory: A function that creates a function tool
+            model_settings_factory: A function that creates ModelSettings
+            
+        Returns:
+            An Agent instance configured based on this agent's properties
+        """
+        # Placeholders are cheap and must not be cached
+        if not all([agent_factory, function_tool_factory, model_settings_factory]):
+            return self._build(agent_factory, function_tool_factory, model_settings_factory)
+        
+        key = self.config_key() + (factories_key(agent_factory, function_tool_factory, model_settings_factory),)
+        return build_cache.get_or_build(
+            key,
+            lambda: self._build(agent_factory, function_tool_factory, model_settings_factory),
+            placeholder=self
+        )
+    
+    def invalidate_build_cache(self) -> int:
+        """Drop any cached builds of this agent definition."""
+        key = self.config_key()
+        return build_cache.invalidate(lambda cached_key: cached_key[:len(key)] == key)
+    
+    def _build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
         """
         Build and return an Agent instance.
         
@@ -36,7 +99,7 @@ class BaseAgent:
         Returns:
             An Agent instance configured based on this agent's properties
         """
-        logging.info(f"Building agent: {self.name}")
+        logging.info("Building agent: %s", self.name)
         
         # If we don't have the required factories, return a placeholder
         if not all([agent_factory, function_tool_factory, model_settings_factory]):
@@ -53,7 +116,7 @@ class BaseAgent:
                 tool_fn = tool.to_function_tool(function_tool_factory)
                 if tool_fn:
                     function_tools.append(tool_fn)
-                    logging.info(f"Successfully converted tool {tool.name} to function tool")
+                    logging.info("Successfully converted tool %s to function tool", tool.name)
             else:
                 function_tools.append(tool)
                 logging.warning(f"Tool {getattr(tool, 'name', 'unknown')} does not have to_function_tool method")
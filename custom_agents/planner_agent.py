@@ -1,6 +1,9 @@
 from typing import List, Optional, Dict, Any
 import logging
 
+from config import Config
+from custom_agents.agent_cache import hash_text
+from custom_agents.answer import PLANNED_ANSWER_SCHEMA, PlannedAnswer
 from custom_agents.base_agent import BaseAgent
 from tools.base_tool import BaseTool
 
@@ -9,6 +12,8 @@ class PlannerAgent(BaseAgent):
     An agent specialized in creating and executing plans.
     
     This agent extends the base agent with planning-specific instructions.
+    Its output is a PlannedAnswer: plan steps, response, citations and the
+    calculations performed.
     """
     
     def __init__(self, tools: Optional[List[BaseTool]] = None, enable_web_search: bool = True):
@@ -17,7 +22,7 @@ class PlannerAgent(BaseAgent):
         
         Args:
             tools: Optional list of tools to provide to the agent
-            enable_web_search: Whether to enable web search capabilities via handoff
+            enable_web_search: Whether to enable the web search tool
         """
         # Enhanced instructions for planning capabilities
         planning_instructions = """
@@ -27,7 +32,7 @@ class PlannerAgent(BaseAgent):
         2. Create a clear plan to achieve the goal
         3. Execute the plan step by step
         4. ALWAYS use the calculator tool for ANY mathematical operations, no matter how simple
-        5. When you need up-to-date information or to verify facts, hand off to the Web Search Assistant
+        5. When you need up-to-date information or to verify facts, use the web_search tool
         6. Always explain your reasoning and current step of the plan
         
         When using the calculator tool:
@@ -35,10 +40,12 @@ class PlannerAgent(BaseAgent):
         - Format your request as a clear mathematical expression
         - Show both the expression you're calculating and the result
         - Example: To calculate 25 * 4, use the calculator tool with expression "25 * 4"
+        - When several calculations are needed, use the calculate_batch tool to do them all in one call
+          (a list of expressions, or one expression with variables bound to lists of values)
         
         When you need to search the web:
-        - Use the web_search_preview tool to hand off to the Web Search Assistant with a clear, specific query
-        - The Web Search Assistant will search the web and provide you with the information
+        - Use the web_search tool with a clear, specific query
+        - It returns the findings with their sources; list the ones you use in your citations
         - Continue your plan with the information provided
         
         When creating plans:
@@ -57,13 +64,33 @@ class PlannerAgent(BaseAgent):
         
         # Override the model name to use o3-mini explicitly
         self.model_name = "o3-mini"
+        if Config.PLANNER_REASONING_EFFORT:
+            self.model_settings_dict["reasoning_effort"] = Config.PLANNER_REASONING_EFFORT
         
         # Store whether web search is enabled
         self.enable_web_search = enable_web_search
         
         logging.info("PlannerAgent initialized with planning capabilities")
     
-    def build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
+    def config_key(self) -> tuple:
+        """Extend the base configuration key with the answer schema and the web search settings."""
+        return super().config_key() + (
+            ("output_type", PLANNED_ANSWER_SCHEMA),
+            ("enable_web_search", self.enable_web_search),
+            ("web_search_backend", Config.WEB_SEARCH_BACKEND if self.enable_web_search else None),
+        )
+    
+    def fingerprint(self) -> str:
+        """Include the web search agent behind the web search tool in the fingerprint."""
+        fingerprint = super().fingerprint()
+        if self.enable_web_search:
+            if getattr(self, '_web_search_fingerprint', None) is None:
+                from custom_agents.web_search_agent import WebSearchAgent
+                self._web_search_fingerprint = WebSearchAgent().fingerprint()
+            fingerprint = hash_text(fingerprint + self._web_search_fingerprint)
+        return fingerprint
+    
+    def _build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
         """
         Build the agent with the specified factories.
         
@@ -75,7 +102,7 @@ class PlannerAgent(BaseAgent):
         Returns:
             An agent instance
         """
-        logging.debug(f"Building PlannerAgent with model: {self.model_name}")
+        logging.debug("Building PlannerAgent with model: %s", self.model_name)
         
         # If we don't have the required factories, return a placeholder
         if not all([agent_factory, function_tool_factory, model_settings_factory]):
@@ -92,151 +119,54 @@ class PlannerAgent(BaseAgent):
                 tool_fn = tool.to_function_tool(function_tool_factory)
                 if tool_fn:
                     function_tools.append(tool_fn)
-                    logging.info(f"Successfully converted tool {tool.name} to function tool")
+                    logging.info("Successfully converted tool %s to function tool", tool.name)
             else:
                 function_tools.append(tool)
                 logging.warning(f"Tool {getattr(tool, 'name', 'unknown')} does not have to_function_tool method")
         
-        # If web search is enabled, add handoff to the WebSearchAgent
-        handoffs = []
+        # If web search is enabled, add the web search tool. Searching through a
+        # tool rather than a handoff to the WebSearchAgent keeps the planner in
+        # control and lets results be cached and shared between requests.
         if self.enable_web_search:
-            logging.info("Web search is enabled, attempting to add web search handoff")
-            
             try:
-                # Import the WebSearchAgent
-                from custom_agents.web_search_agent import WebSearchAgent
-                
-                # Try to get the handoff function from agent_wrapper
-                try:
-                    from agent_wrapper import handoff
-                    
-                    if handoff is None:
-                        logging.error("handoff function is None in agent_wrapper")
-                        raise ImportError("handoff function is None")
-                        
-                    logging.info("Successfully imported handoff from agent_wrapper")
-                except (ImportError, AttributeError) as e:
-                    logging.error(f"Failed to import handoff from agent_wrapper: {str(e)}")
-                    logging.warning("Will try to create a simple handoff dictionary instead")
-                    
-                    # Create a simple handoff dictionary as fallback
-                    def handoff_fallback(agent, tool_name_override=None, tool_description_override=None):
-                        logging.warning("Using handoff_fallback function")
-                        return {
-                            "agent": agent,
-                            "tool_name": tool_name_override or f"handoff_to_{agent.name}",
-                            "tool_description": tool_description_override or f"Handoff to {agent.name}"
-                        }
-                    
-                    handoff = handoff_fallback
-                
-                # Create the web search agent
-                web_search_agent = WebSearchAgent()
-                
-                # Build the web search agent
-                built_web_search_agent = web_search_agent.build(
-                    agent_factory=agent_factory,
-                    function_tool_factory=function_tool_factory,
-                    model_settings_factory=model_settings_factory
-                )
-                
-                # Log the built web search agent details
-                logging.debug(f"Built WebSearchAgent: {built_web_search_agent.name}, model: {getattr(built_web_search_agent, 'model', 'unknown')}")
-                
-                # Get the correct tool name from the WebSearchTool
-                try:
-                    from agents import WebSearchTool
-                    tool_name = WebSearchTool().name  # Get the name from the actual tool
-                    logging.debug(f"Using tool name from WebSearchTool: {tool_name}")
-                except ImportError:
-                    tool_name = "web_search_preview"  # Fallback to the known name
-                    logging.warning(f"Could not import WebSearchTool, using fallback name: {tool_name}")
+                from tools.registry import get_tool
                 
-                # Create a handoff to the web search agent
-                web_search_handoff = handoff(
-                    agent=built_web_search_agent,
-                    tool_name_override=tool_name,  # Use the name from the WebSearchTool
-                    tool_description_override="Search the web for information. Use this when you need up-to-date information or to verify facts."
-                )
-                
-                # Define the input schema for the handoff
-                input_schema = {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "The search query to look up on the web"
-                        }
-                    },
-                    "required": ["query"],
-                    "additionalProperties": False  # This is required by the OpenAI API
-                }
-                
-                # If the handoff function returned a dictionary, add the input schema
-                if isinstance(web_search_handoff, dict):
-                    web_search_handoff["input_schema"] = input_schema
-                    logging.debug(f"Added input schema to handoff dictionary: {web_search_handoff}")
-                # If it's an object with an input_json_schema attribute, try to update it
-                elif hasattr(web_search_handoff, "input_json_schema"):
-                    try:
-                        web_search_handoff.input_json_schema = input_schema
-                        logging.debug(f"Updated input_json_schema on handoff object")
-                    except (AttributeError, TypeError) as e:
-                        logging.warning(f"Could not update input_json_schema on handoff object: {str(e)}")
-                
-                # Log the handoff details
-                if isinstance(web_search_handoff, dict):
-                    logging.debug(f"Created handoff dictionary: {web_search_handoff}")
-                else:
-                    logging.debug(f"Created handoff object of type: {type(web_search_handoff)}")
-                
-                # Add the handoff to the handoffs list
-                handoffs.append(web_search_handoff)
-                logging.info("Added web search handoff to the handoffs list")
+                function_tools.append(get_tool("web_search").to_function_tool(function_tool_factory))
+                logging.info("Added web search tool (%s backend)", Config.WEB_SEARCH_BACKEND)
             except Exception as e:
-                logging.error(f"Failed to add web search handoff: {str(e)}", exc_info=True)
+                logging.error(f"Failed to add web search tool: {str(e)}", exc_info=True)
         else:
             logging.info("Web search is disabled")
         
-        # Create and return the agent with handoffs
+        # Create and return the agent
         try:
-            # Try to create the agent with handoffs
             agent_kwargs = {
                 "name": self.name,
                 "instructions": self.instructions,
                 "model": self.model_name,
                 "model_settings": model_settings,
-                "tools": function_tools
+                "tools": function_tools,
+                "output_type": PlannedAnswer
             }
-            
-            # Only add handoffs if we have any
-            if handoffs:
-                agent_kwargs["handoffs"] = handoffs
-                
+
             # Log the agent creation parameters
-            logging.debug(f"Creating agent with parameters: {agent_kwargs}")
+            logging.debug("Creating agent with parameters: %s", agent_kwargs)
             
             # Create the agent
             agent = agent_factory(**agent_kwargs)
             
-            logging.info(f"Successfully built PlannerAgent with {len(function_tools)} tools and {len(handoffs)} handoffs")
+            logging.info("Successfully built PlannerAgent with %s tools", len(function_tools))
             return agent
         except TypeError as e:
-            # If we get a TypeError, it might be because the agent_factory doesn't accept 'handoffs'
-            # Try again without handoffs
-            if "unexpected keyword argument 'handoffs'" in str(e):
-                logging.warning(f"Agent factory doesn't accept 'handoffs' parameter: {str(e)}")
-                logging.warning("Trying again without handoffs parameter")
+            # Without structured output support the answer is Plan/Response text
+            if "unexpected keyword argument 'output_type'" in str(e):
+                logging.warning(f"Agent factory doesn't accept 'output_type' parameter: {str(e)}")
+                logging.warning("Trying again without output_type parameter")
                 
-                agent = agent_factory(
-                    name=self.name,
-                    instructions=self.instructions,
-                    model=self.model_name,
-                    model_settings=model_settings,
-                    tools=function_tools
-                )
+                agent_kwargs.pop("output_type")
+                agent = agent_factory(**agent_kwargs)
                 
-                logging.info(f"Successfully built PlannerAgent without handoffs parameter")
+                logging.info("Successfully built PlannerAgent without output_type parameter")
                 return agent
             # If we get a TypeError about 'model', try without it
             elif "unexpected keyword argument 'model'" in str(e):
@@ -248,10 +178,10 @@ class PlannerAgent(BaseAgent):
                     instructions=self.instructions,
                     model_settings=model_settings,
                     tools=function_tools,
-                    handoffs=handoffs if handoffs else None
+                    output_type=PlannedAnswer
                 )
                 
-                logging.info(f"Successfully built PlannerAgent without model parameter")
+                logging.info("Successfully built PlannerAgent without model parameter")
                 return agent
             else:
                 # For other TypeErrors, log and return self
@@ -0,0 +1,83 @@
+from typing import List, Optional
+import logging
+
+from config import Config
+from custom_agents.answer import PLANNED_ANSWER_SCHEMA, PlannedAnswer
+from custom_agents.base_agent import BaseAgent
+from tools.base_tool import BaseTool
+
+
+class QuickAnswerAgent(BaseAgent):
+    """
+    An agent that answers simple questions in a single turn of a fast model.
+
+    The router sends it queries that need no web search, calculations or
+    planning, so they don't pay for the planner's reasoning model. Its
+    output is a PlannedAnswer, like the planner's.
+    """
+
+    def __init__(self, tools: Optional[List[BaseTool]] = None):
+        """
+        Initialize a quick answer agent.
+
+        Args:
+            tools: Optional list of tools; the router's fast route uses none
+        """
+        quick_answer_instructions = """
+        You are a helpful assistant. Answer directly from your own knowledge, accurately and concisely.
+
+        If a question needs current information, web research or calculations you are not sure of,
+        say so briefly instead of guessing.
+        """
+
+        super().__init__(
+            name="Quick Answer Assistant",
+            instructions=quick_answer_instructions,
+            tools=tools
+        )
+
+        self.model_name = Config.FAST_MODEL
+        if Config.FAST_REASONING_EFFORT:
+            self.model_settings_dict["reasoning_effort"] = Config.FAST_REASONING_EFFORT
+
+        logging.info("QuickAnswerAgent initialized with model %s", self.model_name)
+
+    def config_key(self) -> tuple:
+        """Extend the base configuration key with the answer schema."""
+        return super().config_key() + (("output_type", PLANNED_ANSWER_SCHEMA),)
+
+    def _build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
+        """
+        Build the agent with a structured PlannedAnswer output.
+
+        Args:
+            agent_factory: Factory function to create an agent
+            function_tool_factory: Factory function to create function tools
+            model_settings_factory: Factory function to create model settings
+
+        Returns:
+            An agent instance
+        """
+        logging.debug("Building QuickAnswerAgent with model: %s", self.model_name)
+
+        # If we don't have the required factories, return a placeholder
+        if not all([agent_factory, function_tool_factory, model_settings_factory]):
+            logging.warning("Missing required factories, returning self as placeholder")
+            return self
+
+        model_settings = model_settings_factory(**self.model_settings_dict)
+        agent_kwargs = {
+            "name": self.name,
+            "instructions": self.instructions,
+            "model": self.model_name,
+            "model_settings": model_settings,
+            "tools": [tool.to_function_tool(function_tool_factory) for tool in self.tools],
+            "output_type": PlannedAnswer
+        }
+        try:
+            return agent_factory(**agent_kwargs)
+        except TypeError as e:
+            # Without structured output support the answer is Plan/Response text
+            logging.warning(f"Agent factory doesn't accept 'output_type' parameter: {str(e)}")
+            agent_kwargs.pop("output_type")
+            return agent_factory(**agent_kwargs)
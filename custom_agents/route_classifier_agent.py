@@ -0,0 +1,93 @@
+from typing import List, Literal, Optional
+import logging
+
+from pydantic import BaseModel, Field
+
+from config import Config
+from custom_agents.base_agent import BaseAgent
+from tools.base_tool import BaseTool
+
+
+class RouteChoice(BaseModel):
+    """The classifier's decision for one query."""
+
+    route: Literal["fast", "planner"] = Field(
+        description="\"fast\" if the query can be answered from general knowledge in one short answer, "
+                    "\"planner\" if it needs web search, calculations or several steps"
+    )
+
+
+# Part of the build cache key; computed once, not per build
+ROUTE_CHOICE_SCHEMA = repr(RouteChoice.model_json_schema())
+
+
+class RouteClassifierAgent(BaseAgent):
+    """
+    A small-model agent that decides whether a query needs the planner.
+
+    Only consulted for queries the router's heuristics would answer on the
+    fast route, when ROUTER_CLASSIFIER_MODEL is set.
+    """
+
+    def __init__(self, tools: Optional[List[BaseTool]] = None):
+        """
+        Initialize a route classifier agent.
+
+        Args:
+            tools: Unused; the classifier doesn't call tools
+        """
+        route_classifier_instructions = """
+        You decide how a user's query is answered. Do not answer the query yourself.
+
+        Choose "fast" for questions a capable model answers well from general knowledge in one reply:
+        definitions, explanations, advice, writing help, simple facts that don't change.
+        Choose "planner" for anything that needs current or specific facts from the web, arithmetic,
+        comparisons of several things, or a multi-step investigation. When unsure, choose "planner".
+        """
+
+        super().__init__(
+            name="Route Classifier",
+            instructions=route_classifier_instructions,
+            tools=tools
+        )
+
+        self.model_name = Config.ROUTER_CLASSIFIER_MODEL or Config.FAST_MODEL
+
+        logging.info("RouteClassifierAgent initialized with model %s", self.model_name)
+
+    def config_key(self) -> tuple:
+        """Extend the base configuration key with the route schema."""
+        return super().config_key() + (("output_type", ROUTE_CHOICE_SCHEMA),)
+
+    def _build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
+        """
+        Build the agent with a structured RouteChoice output.
+
+        Args:
+            agent_factory: Factory function to create an agent
+            function_tool_factory: Factory function to create function tools
+            model_settings_factory: Factory function to create model settings
+
+        Returns:
+            An agent instance
+        """
+        logging.debug("Building RouteClassifierAgent with model: %s", self.model_name)
+
+        # If we don't have the required factories, return a placeholder
+        if not all([agent_factory, function_tool_factory, model_settings_factory]):
+            logging.warning("Missing required factories, returning self as placeholder")
+            return self
+
+        model_settings = model_settings_factory(**self.model_settings_dict)
+        try:
+            return agent_factory(
+                name=self.name,
+                instructions=self.instructions,
+                model=self.model_name,
+                model_settings=model_settings,
+                output_type=RouteChoice
+            )
+        except TypeError as e:
+            # Agent factories without structured output support can't classify
+            logging.error(f"Failed to create RouteClassifierAgent: {str(e)}")
+            return self
@@ -0,0 +1,112 @@
+from typing import List, Literal, Optional
+import logging
+
+from pydantic import BaseModel, Field
+
+from config import Config
+from custom_agents.base_agent import BaseAgent
+from tools.base_tool import BaseTool
+
+
+class PlanStep(BaseModel):
+    """One step of a structured plan."""
+
+    id: str = Field(description="Short unique id, e.g. \"s1\"")
+    kind: Literal["search", "calculate"] = Field(description="\"search\" for a web lookup, \"calculate\" for arithmetic")
+    description: str = Field(description="What the step finds out, in a few words")
+    query: str = Field(description="The web search query for a search step, empty for a calculate step")
+    expressions: List[str] = Field(
+        description="The expressions of a calculate step, empty for a search step; "
+                    "{id} stands for the result of an earlier calculate step"
+    )
+    depends_on: List[str] = Field(description="Ids of the steps whose results this step needs")
+
+
+class StepPlan(BaseModel):
+    """A plan of lookups and calculations to carry out before answering."""
+
+    steps: List[PlanStep]
+
+
+# Part of the build cache key; computed once, not per build
+STEP_PLAN_SCHEMA = repr(StepPlan.model_json_schema())
+
+
+class StepPlannerAgent(BaseAgent):
+    """
+    An agent that breaks a task into a structured plan of steps.
+
+    It only plans: the orchestrator carries out the steps, running independent
+    ones concurrently, and the planner agent writes the answer from their results.
+    """
+
+    def __init__(self, tools: Optional[List[BaseTool]] = None):
+        """
+        Initialize a step planner agent.
+
+        Args:
+            tools: Unused; the step planner doesn't call tools
+        """
+        step_planning_instructions = f"""
+        You plan the research for a task before it is answered. Do not answer the task yourself.
+
+        Return the web searches and calculations needed to answer it as a list of steps:
+        - "search" steps look something up on the web; give a clear, specific query
+        - "calculate" steps evaluate arithmetic expressions with numbers that are already known
+        - List in depends_on the ids of the steps a step needs results from, and nothing else;
+          steps without dependencies run at the same time, so keep independent lookups separate
+        - A calculate step may use {{id}} in its expressions for the result of an earlier calculate step
+        - Leave out calculations that need numbers from search results; they are done when answering
+        - Leave out lookups and calculations whose results are already in the conversation
+        - Use at most {Config.MAX_PLAN_STEPS} steps, and no steps at all if the task needs no lookups or calculations
+        """
+
+        super().__init__(
+            name="Step Planner",
+            instructions=step_planning_instructions,
+            tools=tools
+        )
+
+        # Planning needs the reasoning model
+        self.model_name = "o3-mini"
+        if Config.PLANNER_REASONING_EFFORT:
+            self.model_settings_dict["reasoning_effort"] = Config.PLANNER_REASONING_EFFORT
+
+        logging.info("StepPlannerAgent initialized")
+
+    def config_key(self) -> tuple:
+        """Extend the base configuration key with the plan schema."""
+        return super().config_key() + (("output_type", STEP_PLAN_SCHEMA),)
+
+    def _build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
+        """
+        Build the agent with a structured StepPlan output.
+
+        Args:
+            agent_factory: Factory function to create an agent
+            function_tool_factory: Factory function to create function tools
+            model_settings_factory: Factory function to create model settings
+
+        Returns:
+            An agent instance
+        """
+        logging.debug("Building StepPlannerAgent with model: %s", self.model_name)
+
+        # If we don't have the required factories, return a placeholder
+        if not all([agent_factory, function_tool_factory, model_settings_factory]):
+            logging.warning("Missing required factories, returning self as placeholder")
+            return self
+
+        model_settings = model_settings_factory(**self.model_settings_dict)
+        try:
+            return agent_factory(
+                name=self.name,
+                instructions=self.instructions,
+                model=self.model_name,
+                model_settings=model_settings,
+                output_type=StepPlan
+            )
+        except TypeError as e:
+            # Agent factories without structured output support can't plan steps
+            logging.error(f"Failed to create StepPlannerAgent: {str(e)}")
+            return self
@@ -50,7 +50,7 @@ class WebSearchAgent(BaseAgent):
         
         logging.info("WebSearchAgent initialized with web search capabilities")
     
-    def build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
+    def _build(self, agent_factory=None, function_tool_factory=None, model_settings_factory=None):
         """
         Build the agent with the specified factories and add web search tool.
         
@@ -62,7 +62,7 @@ class WebSearchAgent(BaseAgent):
         Returns:
             An agent instance with web search capability
         """
-        logging.debug(f"Building WebSearchAgent with model: {self.model_name}")
+        logging.debug("Building WebSearchAgent with model: %s", self.model_name)
         
         # If we don't have the required factories, return a placeholder
         if not all([agent_factory, function_tool_factory, model_settings_factory]):
@@ -79,7 +79,7 @@ class WebSearchAgent(BaseAgent):
                 tool_fn = tool.to_function_tool(function_tool_factory)
                 if tool_fn:
                     function_tools.append(tool_fn)
-                    logging.info(f"Successfully converted tool {tool.name} to function tool")
+                    logging.info("Successfully converted tool %s to function tool", tool.name)
             else:
                 function_tools.append(tool)
                 logging.warning(f"Tool {getattr(tool, 'name', 'unknown')} does not have to_function_tool method")
@@ -91,15 +91,18 @@ class WebSearchAgent(BaseAgent):
             
             # Create a WebSearchTool instance with medium search context size
             web_search_tool = WebSearchTool(search_context_size="medium")
-            logging.debug(f"Created WebSearchTool with name: {web_search_tool.name}")
+            logging.debug("Created WebSearchTool with name: %s", web_search_tool.name)
             
             # Add the web search tool to the function tools
             function_tools.append(web_search_tool)
-            logging.debug(f"Added web search tool to tools list, now have {len(function_tools)} tools")
+            logging.debug("Added web search tool to tools list, now have %s tools", len(function_tools))
         except ImportError as e:
             logging.error(f"Failed to import WebSearchTool from agents SDK: {str(e)}")
             logging.warning("Falling back to custom web search tool implementation")
             
+            from services.web_search import LocalSearchBackend
+            local_backend = LocalSearchBackend()
+            
             # Create a custom web search function tool
             try:
                 # Create a web search function tool using the function_tool_factory
@@ -115,12 +118,11 @@ class WebSearchAgent(BaseAgent):
                     "additionalProperties": False  # This is required by the OpenAI API
                 }
                 
-                def web_search_function(query: str) -> str:
+                async def web_search_function(query: str) -> str:
                     """Search the web for information."""
-                    logging.info(f"Web search function called with query: {query}")
-                    # This is a placeholder implementation that would be replaced by actual web search
-                    # In a real implementation, this would call a web search API
-                    return f"Results for: {query}\n\nThe Eiffel Tower was designed by Gustave Eiffel and his team of engineers. Construction began in 1887 and was completed in 1889."
+                    logging.info("Web search function called with query: %s", query)
+                    # Without the hosted tool, search the local corpus
+                    return await local_backend.search(query)
                 
                 # Create the function tool
                 web_search_tool = function_tool_factory(
@@ -130,11 +132,11 @@ class WebSearchAgent(BaseAgent):
                     parameter_schema=web_search_schema
                 )
                 
-                logging.debug(f"Created custom web search function tool: {web_search_tool}")
+                logging.debug("Created custom web search function tool: %s", web_search_tool)
                 
                 # Add the web search tool to the function tools
                 function_tools.append(web_search_tool)
-                logging.debug(f"Added custom web search tool to tools list, now have {len(function_tools)} tools")
+                logging.debug("Added custom web search tool to tools list, now have %s tools", len(function_tools))
             except Exception as e:
                 logging.error(f"Failed to create custom web search function tool: {str(e)}", exc_info=True)
         except Exception as e:
@@ -152,12 +154,12 @@ class WebSearchAgent(BaseAgent):
             }
             
             # Log the agent creation parameters
-            logging.debug(f"Creating agent with parameters: {agent_kwargs}")
+            logging.debug("Creating agent with parameters: %s", agent_kwargs)
             
             # Create the agent
             agent = agent_factory(**agent_kwargs)
             
-            logging.info(f"Successfully built WebSearchAgent with {len(function_tools)} tools")
+            logging.info("Successfully built WebSearchAgent with %s tools", len(function_tools))
             return agent
         except TypeError as e:
             # If we get a TypeError about 'model', try without it
@@ -172,7 +174,7 @@ class WebSearchAgent(BaseAgent):
                     tools=function_tools
                 )
                 
-                logging.info(f"Successfully built WebSearchAgent without model parameter")
+                logging.info("Successfully built WebSearchAgent without model parameter")
                 return agent
             else:
                 # For other TypeErrors, log and return self
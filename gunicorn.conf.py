@@ -0,0 +1,112 @@
+"""
+Gunicorn settings, loaded automatically from the working directory.
+
+Serving profile: WEB_CONCURRENCY worker processes (one per available core by
+default), each running request threads for the runs admission control lets
+in. With PRELOAD_APP the app is imported in the master, so the Agents SDK is
+imported and the agents are built once and shared by the forked workers.
+Every worker then warms up before it accepts requests (its event loop, job
+pool and API connection pool). On a reload (SIGHUP) or shutdown, workers
+stop accepting connections, finish the requests in flight (streams
+included, up to GRACEFUL_TIMEOUT seconds) and drain their background jobs.
+Note that with a preloaded app, SIGHUP restarts the workers with the code
+loaded by the master; deploy new code by restarting the master.
+
+Metrics are aggregated across workers through files in a shared directory
+(prometheus_client multiprocess mode). The directory is set up here, in the
+master process, before the app is imported. When the server starts
+(on_starting, not on every load of this file: --check-config and reloads
+load it too) it is emptied of an earlier run's files, so their counters
+don't leak into this one.
+"""
+
+import contextlib
+import os
+import shutil
+import signal
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import Config
+
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "agent-metrics")
+)
+os.makedirs(metrics_dir, exist_ok=True)
+
+
+def available_cores() -> int:
+    """Return the number of cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = Config.WEB_CONCURRENCY or available_cores()
+# Runs wait on the model API, not the CPU: threads cover every admitted and queued run
+worker_class = "gthread"
+threads = Config.WORKER_THREADS or Config.ADMISSION_MAX_CONCURRENT_RUNS + Config.ADMISSION_MAX_QUEUE
+# The reloader can't see code changes in an app imported before the fork
+preload_app = Config.PRELOAD_APP and "--reload" not in sys.argv
+graceful_timeout = int(Config.GRACEFUL_TIMEOUT)
+# A draining gthread worker stops heartbeating; don't kill it before its streams finish
+timeout = max(30, graceful_timeout)
+
+
+def on_starting(server):
+    """Remove the metric files of earlier server runs from the metrics directory."""
+    # A preloaded app was imported before this hook: the master's own files are current
+    own = f"_{os.getpid()}.db"
+    removed = 0
+    for name in os.listdir(metrics_dir):
+        if name.endswith(own):
+            continue
+        path = os.path.join(metrics_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        removed += 1
+    if removed:
+        server.log.info(f"Removed {removed} metric file(s) of an earlier run from {metrics_dir}")
+
+
+def when_ready(server):
+    """Log the serving profile once the master is listening."""
+    server.log.info(
+        f"Serving with {server.cfg.workers} worker(s) x {server.cfg.threads} thread(s), "
+        f"preload {'on' if server.cfg.preload_app else 'off'}, graceful timeout {server.cfg.graceful_timeout}s"
+    )
+
+
+def post_worker_init(worker):
+    """Warm up a new worker before it accepts requests."""
+    from app import warm_worker
+    from services import jobs
+
+    # On shutdown, stop claiming background jobs while requests in flight finish
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        jobs.worker_pool.stop_claiming()
+        if callable(handle_exit):
+            handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+    warm_worker()
+
+
+def worker_exit(server, worker):
+    """Give a stopping worker's background jobs time to finish."""
+    from app import drain_worker
+    drain_worker()
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of an exited worker; its counters are kept."""
+    from services import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,3 @@
+from services.streaming import AnswerStreamer, PlanResponseSplitter, format_sse
+
+__all__ = ['AnswerStreamer', 'PlanResponseSplitter', 'format_sse']
@@ -0,0 +1,332 @@
+"""
+Admission control and per-client rate limiting for agent runs.
+
+Every run costs several OpenAI requests, and our OpenAI rate limits are the
+real capacity limit, so runs are admitted before they start instead of all
+being scheduled at once and timing out together under overload:
+
+- A token bucket per client (configured API key, else session, else IP
+  address) rejects clients exceeding RATE_LIMIT_PER_MINUTE with 429. Session
+  requests also draw on their IP address's bucket, so new sessions don't add
+  to an address's budget.
+- At most ADMISSION_MAX_CONCURRENT_RUNS runs execute at a time. Further runs
+  wait in a queue of at most ADMISSION_MAX_QUEUE for up to
+  ADMISSION_QUEUE_TIMEOUT seconds (or their deadline, if sooner). A full queue
+  or an expired wait is rejected with 503.
+
+Both rejections carry a Retry-After estimate. Limits apply per worker
+process; size them as the account limit divided by the number of workers.
+The controller is thread-safe and works with any number of event loops.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Collection, Dict, Optional, Tuple
+
+from config import Config
+from services import metrics
+
+
+class AdmissionRejected(Exception):
+    """Raised when a run is not admitted; maps to an HTTP error with Retry-After."""
+
+    def __init__(self, status: int, reason: str, retry_after: int, message: str):
+        """
+        Args:
+            status: The HTTP status to answer with (429 or 503)
+            reason: "rate_limited", "queue_full" or "queue_timeout"
+            retry_after: Seconds the client should wait before retrying
+            message: A message for the client
+        """
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(message)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'error': str(self), 'reason': self.reason, 'retry_after': self.retry_after}
+
+    def headers(self) -> Dict[str, str]:
+        return {'Retry-After': str(self.retry_after)}
+
+
+class TokenBucket:
+    """Allows ``rate`` requests per second on average, with bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def wait(self) -> float:
+        """Return the seconds until a token is available (0 if one is)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Take a token; call when ``wait`` returned 0."""
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """Token buckets per client; the least recently seen clients are forgotten past ``maxsize``."""
+
+    def __init__(self, per_minute: float, burst: int, maxsize: int = 10000):
+        """
+        Args:
+            per_minute: Sustained runs per client and minute; 0 disables rate limiting
+            burst: Runs a client may start back to back
+            maxsize: Maximum number of clients tracked
+        """
+        self.rate = per_minute / 60
+        self.burst = max(burst, 1)
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _bucket(self, client: str) -> TokenBucket:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket
+
+    def check(self, *clients: str) -> None:
+        """
+        Take one run from the budget of each of ``clients``, or from none if any is over its limit.
+
+        Raises:
+            AdmissionRejected: With status 429 if a client is over its limit
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            buckets = [self._bucket(client) for client in clients]
+            wait = max(bucket.wait() for bucket in buckets)
+            if not wait:
+                for bucket in buckets:
+                    bucket.take()
+
+        if wait:
+            metrics.record_admission("rate_limited")
+            raise AdmissionRejected(
+                429, "rate_limited", max(math.ceil(wait), 1),
+                "Too many requests. Please wait before asking again."
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class Slot:
+    """A permit to execute one run; release it exactly once when the run is over."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        """Return the permit (further calls do nothing)."""
+        # Streams release from both the run and the serving layer, possibly on different threads
+        with self.controller._lock:
+            if self.released:
+                return
+            self.released = True
+        self.controller._release(time.monotonic() - self.acquired_at)
+
+
+class AdmissionController:
+    """Bounds concurrent runs, with a bounded, time-limited wait queue in front."""
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        """
+        Args:
+            max_concurrent: Maximum number of runs executing at a time
+            max_queue: Maximum number of runs waiting for a slot
+            queue_timeout: Maximum seconds a run waits for a slot
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._average_hold: Optional[float] = None
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Estimate the seconds until a new run would be admitted."""
+        hold = self._average_hold if self._average_hold is not None else self.queue_timeout
+        return min(max(math.ceil(hold * (self.waiting + 1) / self.max_concurrent), 1), 60)
+
+    def _reject(self, reason: str, message: str) -> AdmissionRejected:
+        with self._lock:
+            self.rejected += 1
+        metrics.record_admission(reason)
+        self._publish_load()
+        return AdmissionRejected(503, reason, self.retry_after(), message)
+
+    def _publish_load(self) -> None:
+        metrics.set_admission_load(self.active, self.waiting)
+
+    async def acquire(self, timeout: Optional[float] = None) -> Slot:
+        """
+        Wait for a slot to execute a run.
+
+        Args:
+            timeout: Optional maximum wait in seconds (e.g. the request's remaining
+                budget); the wait never exceeds the configured queue timeout
+
+        Returns:
+            The slot; the caller must release it
+
+        Raises:
+            AdmissionRejected: With status 503 if the queue is full or the wait expired
+        """
+        started = time.monotonic()
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                waiter = None
+            elif len(self._waiters) >= self.max_queue:
+                waiter = False
+            else:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+
+        if waiter is False:
+            raise self._reject("queue_full", "The server is busy. Please try again shortly.")
+
+        if waiter is not None:
+            self._publish_load()
+            wait = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+            try:
+                async with asyncio.timeout(wait):
+                    await waiter
+            except TimeoutError:
+                self._abandon(waiter)
+                raise self._reject("queue_timeout", "The server is busy. Please try again shortly.") from None
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+
+        with self._lock:
+            self.admitted += 1
+        metrics.record_admission("admitted")
+        metrics.observe_phase("admission", time.monotonic() - started)
+        self._publish_load()
+        return Slot(self)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, timeout: Optional[float] = None):
+        """Hold a slot for the enclosed block (see acquire)."""
+        slot = await self.acquire(timeout)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        # A waiter giving up either leaves the queue, or passes on the slot it was just granted
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+                return
+            except ValueError:
+                pass
+        if waiter.cancel() or waiter.cancelled():
+            # The pending grant sees the cancelled waiter and passes the slot on
+            return
+        self._release(None)
+
+    def _grant(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            self._release(None)
+        else:
+            waiter.set_result(None)
+
+    def _release(self, held: Optional[float]) -> None:
+        if held is not None:
+            self._average_hold = held if self._average_hold is None else 0.8 * self._average_hold + 0.2 * held
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    # Hand the slot straight to the next waiter, on its own loop
+                    waiter.get_loop().call_soon_threadsafe(self._grant, waiter)
+                    break
+            else:
+                self.active -= 1
+        self._publish_load()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current load and counters."""
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average_run_seconds": round(self._average_hold, 3) if self._average_hold is not None else None,
+        }
+
+
+def client_identity(headers: Any, session: Any, remote_addr: Optional[str],
+                    api_keys: Collection[str] = Config.RATE_LIMIT_API_KEYS) -> Tuple[str, ...]:
+    """
+    Return the keys a request is rate limited under (it must be within all of them).
+
+    An API key (X-API-Key or Authorization: Bearer) identifies the client if it
+    is one of ``api_keys``. A request with any other key is limited by IP
+    address: clients choose their keys, so a fresh key per request would
+    otherwise get a fresh budget. Without a key, the session identifies the
+    client, which is given an id on first use. Session requests are also
+    limited by IP address, and requests without an established session (e.g.
+    no cookies) only by it, so dropping the cookie for a new session doesn't
+    reset the limit.
+    """
+    api_key = headers.get("X-API-Key") or ""
+    authorization = headers.get("Authorization", "")
+    if not api_key and authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    if api_key:
+        if api_key in api_keys:
+            return ("key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16],)
+        return (f"ip:{remote_addr or 'unknown'}",)
+
+    if session is not None:
+        client_id = session.get("client_id")
+        if client_id:
+            return f"session:{client_id}", f"ip:{remote_addr or 'unknown'}"
+        session["client_id"] = uuid.uuid4().hex
+    return (f"ip:{remote_addr or 'unknown'}",)
+
+
+rate_limiter = RateLimiter(Config.RATE_LIMIT_PER_MINUTE, Config.RATE_LIMIT_BURST, Config.RATE_LIMIT_CLIENTS)
+controller = AdmissionController(
+    Config.ADMISSION_MAX_CONCURRENT_RUNS, Config.ADMISSION_MAX_QUEUE, Config.ADMISSION_QUEUE_TIMEOUT
+)
@@ -0,0 +1,617 @@
+"""
+Agent setup and query execution shared by the WSGI and ASGI front ends.
+
+Everything here is either synchronous and cheap (agent lookup, prompt
+assembly) or a coroutine, so the serving layer decides how to await it:
+the Flask app bridges to its background loop, the Quart app awaits directly.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+import agent_wrapper
+from config import Config
+from custom_agents.agent_cache import hash_text
+from services import admission, conversations, http_client, logs, metrics, prompts, response_cache, router, semantic_cache
+from services.conversations import Turn
+from services.deadline import Deadline
+from services.orchestrator import ParallelPlanRun
+from services.streaming import AnswerStreamer, structured_answer
+from tools.executor import tool_executor
+from tools.registry import get_tool
+
+logger = logging.getLogger(__name__)
+
+# The planner agent definition, created once per process
+planner_agent = None
+
+# The step planner of the parallel execution mode, created on first use
+step_planner_agent = None
+
+# The agents of the router's fast route and its optional classifier, created on first use
+quick_answer_agent = None
+route_classifier_agent = None
+
+# agent_fingerprint() results by the agents' configuration keys
+_fingerprints: Dict[tuple, str] = {}
+
+
+def init_agent_components() -> bool:
+    """Initialize agent components with proper imports."""
+    global planner_agent
+
+    try:
+        # Resolve the SDK entry points (a no-op once done in this process)
+        if not agent_wrapper.init_components():
+            logger.error("Agent wrapper failed to initialize")
+            return False
+
+        # Log successful import
+        logger.info("Successfully imported Agent SDK")
+
+        # Import our agents
+        from custom_agents.planner_agent import PlannerAgent
+
+        # Create the planner agent with the shared calculator tools and web search enabled
+        planner_agent = PlannerAgent(
+            tools=[get_tool("calculate"), get_tool("calculate_batch")],
+            enable_web_search=True
+        )
+
+        logger.info("Successfully initialized PlannerAgent with calculator and web search tools")
+        return True
+
+    except ImportError as e:
+        logger.error(f"Failed to import Agent SDK: {str(e)}")
+        return False
+
+
+def get_planner_agent():
+    """Return the planner agent definition, initializing it on first use."""
+    if planner_agent is None:
+        init_agent_components()
+    return planner_agent
+
+
+def build_agent():
+    """Return the SDK agent for the planner, built once and cached."""
+    agent = get_planner_agent().build(
+        agent_factory=agent_wrapper.Agent,
+        function_tool_factory=agent_wrapper.function_tool,
+        model_settings_factory=agent_wrapper.get_model_settings
+    )
+
+    logger.debug("Agent built successfully with tools: %s", [getattr(tool, 'name', tool) for tool in getattr(agent, 'tools', [])])
+    return agent
+
+
+def build_step_planner():
+    """Return the SDK agent for the step planner (parallel execution mode), built once and cached."""
+    global step_planner_agent
+    if step_planner_agent is None:
+        from custom_agents.step_planner_agent import StepPlannerAgent
+        step_planner_agent = StepPlannerAgent()
+    return step_planner_agent.build(
+        agent_factory=agent_wrapper.Agent,
+        function_tool_factory=agent_wrapper.function_tool,
+        model_settings_factory=agent_wrapper.get_model_settings
+    )
+
+
+def build_quick_answer_agent():
+    """Return the SDK agent answering the router's fast route, built once and cached."""
+    global quick_answer_agent
+    if quick_answer_agent is None:
+        from custom_agents.quick_answer_agent import QuickAnswerAgent
+        quick_answer_agent = QuickAnswerAgent()
+    return quick_answer_agent.build(
+        agent_factory=agent_wrapper.Agent,
+        function_tool_factory=agent_wrapper.function_tool,
+        model_settings_factory=agent_wrapper.get_model_settings
+    )
+
+
+def build_route_classifier():
+    """Return the SDK agent confirming fast routes (ROUTER_CLASSIFIER_MODEL), built once and cached."""
+    global route_classifier_agent
+    if route_classifier_agent is None:
+        from custom_agents.route_classifier_agent import RouteClassifierAgent
+        route_classifier_agent = RouteClassifierAgent()
+    return route_classifier_agent.build(
+        agent_factory=agent_wrapper.Agent,
+        function_tool_factory=agent_wrapper.function_tool,
+        model_settings_factory=agent_wrapper.get_model_settings
+    )
+
+
+def parallel_execution() -> bool:
+    """Whether plans are executed as parallel steps (PLAN_EXECUTION=parallel)."""
+    return Config.PLAN_EXECUTION == "parallel"
+
+
+def _build_agents() -> None:
+    # Every agent a query may need; cached builds make repeated calls cheap
+    build_agent()
+    if parallel_execution():
+        build_step_planner()
+    if Config.ENABLE_ROUTING:
+        build_quick_answer_agent()
+        if Config.ROUTER_CLASSIFIER_MODEL:
+            build_route_classifier()
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Do the expensive startup work: import the SDK and build the agents.
+
+    Run at import time of the serving module, so with gunicorn --preload it
+    happens once in the master process and every forked worker inherits the
+    result. Per-process resources (the HTTP connection pool, the event loop
+    thread) are still created lazily after the fork.
+
+    Returns:
+        Measured times in seconds for the SDK import and the agent build
+    """
+    started = time.perf_counter()
+    if not init_agent_components():
+        return {'ready': False}
+    components_ready = time.perf_counter()
+    _build_agents()
+    finished = time.perf_counter()
+
+    report = {
+        'ready': True,
+        'sdk': agent_wrapper.startup_report()['total'],
+        'components': round(components_ready - started, 4),
+        'agent_build': round(finished - components_ready, 4),
+        'prompt_versions': prompts.versions(),
+    }
+    logger.info(f"Agent runtime warmed up in {finished - started:.3f} seconds: {report}")
+    return report
+
+
+async def warm_worker() -> Dict[str, Any]:
+    """
+    Prepare a worker process to serve requests at full speed.
+
+    Run on the worker's event loop before it accepts requests (gunicorn's
+    post_worker_init). The agents built before the fork are looked up (or
+    built, without --preload), and this process's connection pool is created,
+    installed in the SDK and primed with WARM_UP_CONNECTIONS connections to
+    the API, so the first requests don't pay for TLS handshakes. The tool
+    executor's worker processes are started too.
+
+    Returns:
+        Measured times in seconds and the number of connections opened
+    """
+    started = time.perf_counter()
+    ready = get_planner_agent() is not None
+    if ready:
+        _build_agents()
+    agents_ready = time.perf_counter()
+
+    connections = 0
+    agent_wrapper.install_openai_client()
+    # The replay backend makes no API requests, and without a key they would all fail
+    if Config.MODEL_BACKEND == "openai" and Config.OPENAI_API_KEY and Config.WARM_UP_CONNECTIONS > 0:
+        connections = await http_client.prime(Config.WARM_UP_CONNECTIONS)
+    connected = time.perf_counter()
+
+    await asyncio.to_thread(tool_executor.start)
+    finished = time.perf_counter()
+
+    report = {
+        'ready': ready,
+        'agents': round(agents_ready - started, 4),
+        'connections': connections,
+        'connect': round(connected - agents_ready, 4),
+        'tool_workers': round(finished - connected, 4),
+        'total': round(finished - started, 4),
+    }
+    logger.info(f"Worker warmed up in {finished - started:.3f} seconds: {report}")
+    return report
+
+
+def build_prompt(user_input: str) -> str:
+    """
+    Create a prompt that asks for a plan first, then execution.
+
+    The static format rules come first and the task last, so the prompt
+    shares its prefix with every other request (see services.prompts).
+    """
+    return prompts.PLANNER_PROMPT.render(user_input=user_input)
+
+
+def agent_fingerprint() -> str:
+    """
+    Return a hash of the agent graph and prompt template answering /ask.
+
+    Memoized on the agents' build cache keys and the prompt versions, so
+    a request only pays for the key lookups.
+    """
+    planner = get_planner_agent()
+    key = (planner.config_key(), prompts.PLANNER_PROMPT.version)
+    if parallel_execution():
+        build_step_planner()
+        key += (step_planner_agent.config_key(),)
+    if Config.ENABLE_ROUTING:
+        build_quick_answer_agent()
+        key += (quick_answer_agent.config_key(), prompts.QUICK_PROMPT.version)
+
+    fingerprint = _fingerprints.get(key)
+    if fingerprint is None:
+        fingerprint = hash_text(planner.fingerprint() + prompts.PLANNER_PROMPT.version)
+        if parallel_execution():
+            fingerprint = hash_text(fingerprint + step_planner_agent.fingerprint())
+        if Config.ENABLE_ROUTING:
+            fingerprint = hash_text(fingerprint + quick_answer_agent.fingerprint() + prompts.QUICK_PROMPT.version)
+        if len(_fingerprints) >= 16:
+            _fingerprints.clear()  # Only changed configurations accumulate
+        _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+class CacheKey(NamedTuple):
+    """Where a query's answer is cached: its exact key, and its text for the semantic tier."""
+
+    exact: Optional[str]  # Key in the response cache, None if that is disabled
+    query: str
+    fingerprint: str
+
+
+def response_cache_key(user_input: str, turn: Optional[Turn] = None) -> Optional[CacheKey]:
+    """
+    Return the response cache key of a query, or None if caching is disabled.
+
+    Follow-up queries aren't cached: their answer depends on the conversation.
+    """
+    if response_cache.response_cache is None and semantic_cache.semantic_cache is None:
+        return None
+    if get_planner_agent() is None:
+        return None
+    if turn is not None and turn.history:
+        return None
+    fingerprint = agent_fingerprint()
+    exact = None
+    if response_cache.response_cache is not None:
+        exact = response_cache.make_key(user_input, fingerprint)
+    return CacheKey(exact, user_input, fingerprint)
+
+
+def _lookup_answer(cache_key: CacheKey) -> Optional[response_cache.CacheHit]:
+    # The exact cache first, then paraphrases of answered queries
+    if cache_key.exact is not None:
+        try:
+            hit = response_cache.response_cache.get(cache_key.exact)
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {str(e)}")
+            hit = None
+        metrics.record_cache("response", "miss" if hit is None else "hit")
+        if hit is not None:
+            return hit
+
+    if semantic_cache.semantic_cache is None:
+        return None
+    try:
+        found = semantic_cache.semantic_cache.get(cache_key.query, cache_key.fingerprint)
+    except Exception as e:
+        logger.warning(f"Semantic cache lookup failed: {str(e)}")
+        return None
+    metrics.record_cache("semantic", "miss" if found is None else "hit")
+    if found is None:
+        return None
+    (payload, metadata), similarity = found
+    return payload, {**metadata, 'semantic': True, 'similarity': round(similarity, 4)}
+
+
+def cached_answer(cache_key: Optional[CacheKey], turn: Optional[Turn] = None) -> Optional[Dict[str, Any]]:
+    """
+    Return the cached /ask payload for a cache key, if there is a fresh one.
+
+    The payload carries a "cache" entry with the hit count and age in seconds;
+    answers of a paraphrase also have "semantic", the "similarity" of the
+    queries and the "matched_query". A hit that starts a conversation is
+    recorded as its first turn.
+    """
+    if cache_key is None:
+        return None
+    hit = _lookup_answer(cache_key)
+    if hit is None:
+        return None
+
+    payload, metadata = hit
+    if metadata.get('semantic'):
+        logger.info("Semantic cache hit (similarity=%s, hits=%s, age=%ss)",
+                    metadata['similarity'], metadata['hits'], metadata['age'])
+    else:
+        logger.info("Response cache hit (hits=%s, age=%ss)", metadata['hits'], metadata['age'])
+    payload = {**payload, 'cache': {'hit': True, **metadata}}
+    if turn is not None:
+        conversations.record_turn(turn, turn.answered(payload['full_response']))
+        payload['conversation_id'] = turn.conversation_id
+    return payload
+
+
+def _store_answer(cache_key: Optional[CacheKey], payload: Dict[str, Any]) -> None:
+    # Blocking (SQLite); run_query and stream_query call it in a worker thread
+    if cache_key is None:
+        return
+    if cache_key.exact is not None:
+        try:
+            response_cache.response_cache.set(cache_key.exact, payload)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {str(e)}")
+    if semantic_cache.semantic_cache is not None:
+        try:
+            semantic_cache.semantic_cache.set(cache_key.query, cache_key.fingerprint, payload)
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {str(e)}")
+
+
+def create_query_run(user_input: str, deadline: Optional[Deadline] = None, turn: Optional[Turn] = None) -> Any:
+    """
+    Create the run answering a user query on the route the router chooses.
+
+    Arithmetic is evaluated directly and simple questions get one turn of the
+    fast model (see services.router); everything else is a planner run. The
+    run's ``route`` attribute names the route taken.
+
+    Args:
+        user_input: The user's query
+        deadline: Optional request deadline the run must finish by
+        turn: Optional conversation turn; the run gets the earlier turns as input
+
+    Raises:
+        RuntimeError: If the agent components could not be initialized
+    """
+    if get_planner_agent() is None:
+        raise RuntimeError("Failed to initialize agent components")
+
+    history = turn.history if turn is not None else None
+    if not Config.ENABLE_ROUTING:
+        run = create_planner_run(user_input, deadline, history)
+    else:
+        decision = router.route(user_input, has_history=bool(history))
+        if decision.route == router.CALCULATOR:
+            run = router.DirectCalculationRun(user_input, decision.expression, deadline=deadline, history=history)
+        elif decision.route == router.FAST and Config.ROUTER_CLASSIFIER_MODEL:
+            classifier = build_route_classifier()
+            if classifier is route_classifier_agent:
+                run = create_fast_run(user_input, deadline)
+            else:
+                def create_run(route: str) -> Any:
+                    if route == router.FAST:
+                        return create_fast_run(user_input, deadline)
+                    return create_planner_run(user_input, deadline)
+                run = router.ClassifiedRun(classifier, user_input, create_run, deadline=deadline)
+        elif decision.route == router.FAST:
+            run = create_fast_run(user_input, deadline)
+        else:
+            run = create_planner_run(user_input, deadline, history)
+        run.route = decision.route
+    return run
+
+
+def create_fast_run(user_input: str, deadline: Optional[Deadline] = None) -> Any:
+    """Create a single-turn run of the fast model for a simple query."""
+    started = time.perf_counter()
+    agent = build_quick_answer_agent()
+    metrics.observe_phase("build", time.perf_counter() - started, quick_answer_agent.name)
+    return agent_wrapper.create_run(
+        agent=agent,
+        messages=[{"role": "user", "content": prompts.QUICK_PROMPT.render(user_input=user_input)}],
+        deadline=deadline
+    )
+
+
+def create_planner_run(user_input: str, deadline: Optional[Deadline] = None,
+                       history: Optional[List[Dict[str, Any]]] = None) -> Any:
+    """
+    Create a planner run for a user query.
+
+    In the parallel execution mode this is a ParallelPlanRun, unless the step
+    planner couldn't be built, in which case the plan runs sequentially.
+    """
+    started = time.perf_counter()
+    agent = build_agent()
+    step_planner = build_step_planner() if parallel_execution() else None
+    metrics.observe_phase("build", time.perf_counter() - started, planner_agent.name)
+
+    if step_planner is not None and step_planner is not step_planner_agent:
+        return ParallelPlanRun(agent, step_planner, user_input, build_prompt(user_input),
+                               deadline=deadline, concurrency=Config.FANOUT_CONCURRENCY, history=history)
+
+    return agent_wrapper.create_run(
+        agent=agent,
+        messages=[
+            {
+                "role": "user",
+                "content": build_prompt(user_input)
+            }
+        ],
+        deadline=deadline,
+        history=history
+    )
+
+
+def _remaining(deadline: Optional[Deadline]) -> Optional[float]:
+    return deadline.remaining() if deadline is not None else None
+
+
+async def acquire_run_slot(deadline: Optional[Deadline] = None) -> admission.Slot:
+    """
+    Wait for admission of a run that will be streamed (see stream_query).
+
+    Raises:
+        AdmissionRejected: If the run queue is full or the wait expired
+    """
+    return await admission.controller.acquire(_remaining(deadline))
+
+
+@contextlib.contextmanager
+def _observe_run(mode: str, run: Any):
+    """Record the duration and outcome of the enclosed run (its DEBUG logging sampled); the body sets outcome["value"]."""
+    started = time.perf_counter()
+    outcome = {"value": "error"}
+    try:
+        with logs.sampled_run():
+            yield outcome
+    except TimeoutError:
+        outcome["value"] = "timeout"
+        raise
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome["value"] = "cancelled"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.observe_run(mode, outcome["value"], seconds)
+        # The route is read last: a classified run may have moved to the planner
+        if getattr(run, 'route', None) is not None:
+            metrics.observe_route(run.route, outcome["value"], seconds)
+
+
+async def _record_turn(turn: Optional[Turn], run: Any, items: Optional[List[Dict[str, Any]]]) -> None:
+    if turn is None or items is None:
+        return
+    # Plan step results of a parallel run are part of the turn, like tool outputs
+    new_history = turn.items(items, getattr(run, 'context', ""))
+    await asyncio.to_thread(conversations.record_turn, turn, new_history)
+
+
+async def run_query(run: Any, cache_key: Optional[CacheKey] = None, mode: str = "ask",
+                    turn: Optional[Turn] = None) -> Dict[str, Any]:
+    """
+    Wait for admission, then await a run and return the /ask response payload.
+
+    Args:
+        run: A run created by create_query_run
+        cache_key: Optional response cache key to store a successful answer under
+        mode: How the run is served ("ask" or "job"), for metrics
+        turn: The conversation turn the run was created for, stored once answered
+
+    Returns:
+        The answer_payload of the result with the token "usage" and "route",
+        plus "failed" if the run ended in an error and "conversation_id" for
+        a turn
+
+    Raises:
+        AdmissionRejected: If the run queue is full or the wait expired
+    """
+    async with admission.controller.admit(_remaining(run.deadline)):
+        with _observe_run(mode, run) as outcome:
+            result = await run.get_final_run_result()
+            outcome["value"] = "error" if getattr(result, 'failed', False) else "ok"
+    usage = _usage_report(run)
+    payload = answer_payload(result.final_output, getattr(result, 'trace_id', None))
+    if getattr(result, 'failed', False):
+        payload['failed'] = True
+    else:
+        await asyncio.to_thread(_store_answer, cache_key, payload)
+        await _record_turn(turn, run, result.to_input_list() if hasattr(result, 'to_input_list') else None)
+    if turn is not None:
+        payload['conversation_id'] = turn.conversation_id
+    return {**payload, 'usage': usage, 'route': getattr(run, 'route', None)}
+
+
+def answer_payload(output: Any, trace_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Return the /ask payload of a run's final output.
+
+    The payload has the plan as Markdown ("plan") and as a list ("steps"),
+    the "response", "citations", "calculations", the trace_id, and the
+    answer in Plan/Response text format ("full_response"; a failed run's
+    error text as it is).
+    """
+    answer = structured_answer(output)
+    return {
+        'plan': answer.plan_text(),
+        'steps': answer.plan,
+        'response': answer.response,
+        'citations': [citation.model_dump() for citation in answer.citations],
+        'calculations': [calculation.model_dump() for calculation in answer.calculations],
+        'trace_id': trace_id,
+        'full_response': answer.to_markdown() if answer is output else str(output)
+    }
+
+
+def _usage_report(run: Any) -> Dict[str, Any]:
+    """Log and return the run's token usage, including the input tokens served from the prompt cache."""
+    usage = run.progress.usage_summary()
+    share = usage["cached"] / usage["input"] if usage["input"] else 0.0
+    logger.info("Run used %d input tokens (%d cached, %.0f%%) and %d output tokens",
+                usage['input'], usage['cached'], share * 100, usage['output'])
+    template = {router.FAST: prompts.QUICK_PROMPT, router.CALCULATOR: None}.get(getattr(run, 'route', None),
+                                                                          prompts.PLANNER_PROMPT)
+    return {**usage, 'cached_share': round(share, 3), 'prompt_version': template.version if template else None}
+
+
+@contextlib.contextmanager
+def _releasing(slot: Optional[admission.Slot]):
+    try:
+        yield
+    finally:
+        if slot is not None:
+            slot.release()
+
+
+def cached_events(payload: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Return a cached answer as the events stream_query would emit for it."""
+    done = {'trace_id': payload['trace_id'], 'cache': payload['cache']}
+    if 'conversation_id' in payload:
+        done['conversation_id'] = payload['conversation_id']
+    return [
+        ('plan', {'text': payload['plan'], 'steps': payload['steps']}),
+        ('response', {'text': payload['response']}),
+        ('citations', {'citations': payload['citations']}),
+        ('calculations', {'calculations': payload['calculations']}),
+        ('done', done),
+    ]
+
+
+async def stream_query(run: Any, cache_key: Optional[CacheKey] = None, slot: Optional[admission.Slot] = None,
+                       turn: Optional[Turn] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Stream a run as (event, data) pairs ready to be sent as SSE.
+
+    Emits "plan" once the plan is complete, "response" deltas as the response
+    is written, "citations" and "calculations" once each is complete (see
+    AnswerStreamer), "tool_call" and "tool_output" events as they happen, and
+    finally "done" with the trace_id, the token usage and the conversation_id
+    of a ``turn`` (stored once answered).
+    A completed answer is stored under ``cache_key`` if one is given, and the
+    admission ``slot`` from acquire_run_slot is released when the stream ends.
+    """
+    streamer = AnswerStreamer()
+
+    with _observe_run("stream", run) as outcome, _releasing(slot):
+        async for event in run.stream_events():
+            event_type = event.pop('type')
+            if event_type == 'delta':
+                for name, data in streamer.feed(event['text']):
+                    yield name, data
+            elif event_type == 'final':
+                for name, data in streamer.finish():
+                    yield name, data
+                if not event.get('failed'):
+                    outcome["value"] = "ok"
+                    payload = answer_payload(event['final_output'], event['trace_id'])
+                    await asyncio.to_thread(_store_answer, cache_key, payload)
+                    await _record_turn(turn, run, event.get('items'))
+                done = {'trace_id': event['trace_id'], 'usage': _usage_report(run),
+                        'route': getattr(run, 'route', None)}
+                if turn is not None:
+                    done['conversation_id'] = turn.conversation_id
+                yield 'done', done
+            else:
+                yield event_type, event
+
+
+def describe_tools():
+    """Return name/description pairs of the planner's tools for the about page."""
+    agent = get_planner_agent()
+    if agent is None:
+        return []
+    return [{'name': tool.name, 'description': tool.description} for tool in agent.tools]
@@ -0,0 +1,322 @@
+"""
+Server-side conversation history for follow-up questions.
+
+A query sent with a conversation_id continues that conversation: the planner
+run gets the stored items of the earlier turns (messages, tool calls and
+their outputs, including search results) as input before the new question,
+so a follow-up can build on earlier searches and calculations instead of
+repeating them. Only the new turn is planned and answered.
+
+Each turn is stored with the user's query in place of the full prompt
+template, without reasoning items and item ids (which refer to server-side
+state of a single response). Once the history is estimated to exceed
+CONVERSATION_TOKEN_BUDGET, older turns are compacted to the question, the
+answer and a shortened digest of their tool results; the last
+CONVERSATION_KEEP_TURNS turns stay verbatim. If that is not enough, the
+oldest turns are dropped.
+
+Conversations live in a database (CONVERSATIONS_DATABASE_URL) shared by all
+worker processes and expire CONVERSATION_TTL seconds after their last turn.
+A turn is saved only if no other turn was saved since its history was read
+(compare-and-swap on the turn count); otherwise it is appended to the newer
+history, so concurrent turns of a conversation are all kept.
+"""
+
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Float, Integer, String, Text, and_, delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Mapped, mapped_column
+
+from config import Config
+from services.database import Base, Database
+
+logger = logging.getLogger(__name__)
+
+# Item types that only make sense within the response that produced them
+_DROPPED_TYPES = {"reasoning", "web_search_call"}
+
+# Characters of each tool output kept when an older turn is compacted
+_DIGEST_OUTPUT_CHARS = 400
+
+# Times a turn is re-applied to a history other turns changed meanwhile
+_SAVE_ATTEMPTS = 5
+
+
+class Conversation(Base):
+    """The stored history of a conversation."""
+
+    __tablename__ = "conversations"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    items: Mapped[str] = mapped_column(Text)  # JSON list of input items
+    turns: Mapped[int] = mapped_column(Integer, default=0)
+    tokens: Mapped[int] = mapped_column(Integer, default=0)  # Estimated size of the items
+    created_at: Mapped[float] = mapped_column(Float)
+    updated_at: Mapped[float] = mapped_column(Float, index=True)
+
+
+def estimate_tokens(items: List[Dict[str, Any]]) -> int:
+    """Roughly estimate the number of tokens of input items (about 4 characters per token)."""
+    return len(json.dumps(items, ensure_ascii=False)) // 4
+
+
+def _message_text(item: Dict[str, Any]) -> str:
+    content = item.get("content")
+    if isinstance(content, str):
+        return content
+    return "".join(str(part.get("text", "")) for part in content or [] if isinstance(part, dict))
+
+
+def clean_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Return run items in a form that can be sent again as input of a later run.
+
+    Reasoning and hosted search items are dropped, item ids removed and
+    assistant messages reduced to their text.
+    """
+    cleaned = []
+    for item in items:
+        if item.get("type") in _DROPPED_TYPES:
+            continue
+        if item.get("role") == "assistant":
+            cleaned.append({"role": "assistant", "content": _message_text(item)})
+            continue
+        cleaned.append({key: value for key, value in item.items() if key not in ("id", "status")})
+    return cleaned
+
+
+def split_turns(items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split items into turns, each starting with a user message."""
+    turns: List[List[Dict[str, Any]]] = []
+    for item in items:
+        if item.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(item)
+    return turns
+
+
+def compact_turn(turn: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reduce a turn to its question and one assistant message with the answer and a tool result digest."""
+    question = turn[0]
+    answers = [_message_text(item) for item in turn[1:] if item.get("role") == "assistant"]
+    calls = {item.get("call_id"): item for item in turn if item.get("type") == "function_call"}
+
+    digest = []
+    for item in turn:
+        if item.get("type") != "function_call_output":
+            continue
+        call = calls.get(item.get("call_id"), {})
+        output = str(item.get("output", ""))
+        if len(output) > _DIGEST_OUTPUT_CHARS:
+            output = output[:_DIGEST_OUTPUT_CHARS] + "..."
+        digest.append(f"- {call.get('name', 'tool')}({call.get('arguments', '')}): {output}")
+
+    text = answers[-1] if answers else ""
+    if digest:
+        text += "\n\n(Tool results used for this answer:\n" + "\n".join(digest) + ")"
+    return [question, {"role": "assistant", "content": text}]
+
+
+def compact(items: List[Dict[str, Any]], budget: int, keep_turns: int) -> List[Dict[str, Any]]:
+    """
+    Fit a history into a token budget.
+
+    Turns before the last ``keep_turns`` are compacted, oldest first, until the
+    history fits; then the oldest turns are dropped. The latest turn is always
+    kept, even if it alone exceeds the budget.
+    """
+    if estimate_tokens(items) <= budget:
+        return items
+
+    turns = split_turns(items)
+    for index in range(max(len(turns) - keep_turns, 0)):
+        turns[index] = compact_turn(turns[index])
+        if estimate_tokens([item for turn in turns for item in turn]) <= budget:
+            break
+    while len(turns) > 1 and estimate_tokens([item for turn in turns for item in turn]) > budget:
+        turns.pop(0)
+
+    compacted = [item for turn in turns for item in turn]
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Compacted conversation history from %d to %d estimated tokens (%d turns kept)",
+                    estimate_tokens(items), estimate_tokens(compacted), len(turns))
+    return compacted
+
+
+class ConversationStore:
+    """Conversation histories in a SQL database, shared by all worker processes."""
+
+    def __init__(self, url: str, ttl: float, budget: int, keep_turns: int):
+        """
+        Args:
+            url: SQLAlchemy database URL
+            ttl: Seconds a conversation is kept after its last turn
+            budget: Estimated tokens of history beyond which it is compacted
+            keep_turns: Number of latest turns never compacted
+        """
+        self.database = Database(url, [Conversation.__table__])
+        self.ttl = ttl
+        self.budget = budget
+        self.keep_turns = keep_turns
+        self._last_purge = 0.0
+
+    def load(self, conversation_id: str) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """Return the stored items of a conversation and its turn count, or None if it is unknown or expired."""
+        with self.database.session() as session:
+            conversation = session.get(Conversation, conversation_id)
+            if conversation is None or conversation.updated_at < time.time() - self.ttl:
+                return None
+            return json.loads(conversation.items), conversation.turns
+
+    def history(self, conversation_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Return the stored items of a conversation, or None if it is unknown or expired."""
+        loaded = self.load(conversation_id)
+        return loaded[0] if loaded is not None else None
+
+    def save(self, conversation_id: str, items: List[Dict[str, Any]], turns: int) -> Optional[int]:
+        """
+        Store the history of a conversation after a turn, compacted to the budget.
+
+        Args:
+            conversation_id: The conversation
+            items: The history after the turn
+            turns: The turn count of the history the turn was based on (0 for a new conversation)
+
+        Returns:
+            The estimated number of tokens stored, or None if another turn was
+            saved since (nothing is stored then)
+        """
+        items = compact(items, self.budget, self.keep_turns)
+        tokens = estimate_tokens(items)
+        now = time.time()
+        values = dict(items=json.dumps(items, ensure_ascii=False), turns=turns + 1, tokens=tokens, updated_at=now)
+        with self.database.session() as session:
+            if turns == 0:
+                session.add(Conversation(id=conversation_id, created_at=now, **values))
+                try:
+                    session.commit()
+                except IntegrityError:
+                    return None  # Another first turn won
+            else:
+                unchanged = and_(Conversation.id == conversation_id, Conversation.turns == turns)
+                saved = session.execute(update(Conversation).where(unchanged).values(**values))
+                session.commit()
+                if saved.rowcount != 1:
+                    return None
+
+        if now - self._last_purge > 3600:
+            self._last_purge = now
+            self.purge()
+        return tokens
+
+    def delete(self, conversation_id: str) -> bool:
+        """Forget a conversation; return whether it existed."""
+        with self.database.session() as session:
+            deleted = session.execute(delete(Conversation).where(Conversation.id == conversation_id))
+            session.commit()
+            return deleted.rowcount > 0
+
+    def purge(self) -> int:
+        """Delete expired conversations and return how many there were."""
+        with self.database.session() as session:
+            deleted = session.execute(delete(Conversation).where(Conversation.updated_at < time.time() - self.ttl))
+            session.commit()
+        if deleted.rowcount:
+            logger.info(f"Purged {deleted.rowcount} expired conversation(s)")
+        return deleted.rowcount
+
+
+class Turn:
+    """A query answered as the next turn of a conversation."""
+
+    def __init__(self, conversation_id: str, history: List[Dict[str, Any]], query: str, turns: int = 0):
+        """
+        Args:
+            conversation_id: The conversation the turn belongs to
+            history: The stored items of the earlier turns, sent as run input
+            query: The user's query of this turn
+            turns: The stored turn count of ``history`` (0 for a new conversation)
+        """
+        self.conversation_id = conversation_id
+        self.history = history
+        self.query = query
+        self.turns = turns
+
+    def items(self, run_items: List[Dict[str, Any]], context: str = "") -> List[Dict[str, Any]]:
+        """
+        Return the history after this turn from the input list of its run.
+
+        The run's input starts with the history and the full prompt; the prompt
+        is stored as the plain query, followed by ``context`` (e.g. results of
+        plan steps carried out outside the run).
+        """
+        question = self.query if not context else f"{self.query}\n\n{context}"
+        new_items = [{"role": "user", "content": question}] + run_items[len(self.history) + 1:]
+        return self.history + clean_items(new_items)
+
+    def answered(self, answer: str) -> List[Dict[str, Any]]:
+        """Return the history after this turn for an answer that didn't come from a run (cache hit)."""
+        return self.history + [{"role": "user", "content": self.query}, {"role": "assistant", "content": answer}]
+
+
+store = ConversationStore(
+    Config.CONVERSATIONS_DATABASE_URL,
+    ttl=Config.CONVERSATION_TTL,
+    budget=Config.CONVERSATION_TOKEN_BUDGET,
+    keep_turns=Config.CONVERSATION_KEEP_TURNS,
+)
+
+
+def start_turn(query: str, conversation_id: Optional[str] = None, new: bool = False) -> Optional[Turn]:
+    """
+    Return the conversation turn of a query, or None for a stateless query.
+
+    Args:
+        query: The user's query
+        conversation_id: Continue this conversation; an unknown or expired id
+            starts a new conversation with a new id
+        new: Start a new conversation
+    """
+    if not Config.ENABLE_CONVERSATIONS or (conversation_id is None and not new):
+        return None
+
+    loaded = store.load(conversation_id) if conversation_id else None
+    if loaded is None:
+        return Turn(uuid.uuid4().hex, [], query)
+    history, turns = loaded
+    return Turn(conversation_id, history, query, turns)
+
+
+def record_turn(turn: Turn, items: List[Dict[str, Any]]) -> None:
+    """
+    Store the history of a conversation after a turn; failures are logged, not raised.
+
+    If other turns of the conversation were saved since the turn started, its
+    new items are appended to the latest history instead.
+    """
+    # items is turn.history followed by what this turn added
+    added = items[len(turn.history):]
+    history, turns = turn.history, turn.turns
+    try:
+        for _ in range(_SAVE_ATTEMPTS):
+            tokens = store.save(turn.conversation_id, history + added, turns)
+            if tokens is not None:
+                logger.debug("Saved conversation %s (%d estimated tokens)", turn.conversation_id, tokens)
+                return
+            logger.debug("Conversation %s changed during the turn, appending to its latest history",
+                         turn.conversation_id)
+            history, turns = store.load(turn.conversation_id) or ([], 0)
+        logger.warning(f"Failed to save conversation {turn.conversation_id}: "
+                       f"it kept changing over {_SAVE_ATTEMPTS} attempts")
+    except Exception as e:
+        logger.warning(f"Failed to save conversation {turn.conversation_id}: {str(e)}")
+
+
+def delete_conversation(conversation_id: str) -> bool:
+    """Forget a conversation; return whether it existed."""
+    return store.delete(conversation_id)
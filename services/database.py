@@ -0,0 +1,86 @@
+"""
+SQLAlchemy setup shared by the database-backed stores (jobs, conversations).
+
+Each store has a Database for its URL: SQLite files by default, or PostgreSQL
+(through psycopg2) when DATABASE_URL is set, so all worker processes and
+restarts see the same data. Engines are created lazily, once per process.
+"""
+
+import os
+import threading
+from typing import List, Optional
+
+from sqlalchemy import Table, create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import DeclarativeBase, Session
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+def database_url(url: str) -> str:
+    """Return a URL SQLAlchemy accepts (Heroku-style "postgres://" URLs are not)."""
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+class Database:
+    """An engine for one database URL, creating the given tables on first use."""
+
+    def __init__(self, url: str, tables: List[Table]):
+        """
+        Args:
+            url: SQLAlchemy database URL
+            tables: The tables the store using this database needs
+        """
+        self.url = database_url(url)
+        self.tables = tables
+        self._engine: Optional[Engine] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> Engine:
+        # One engine per process; pooled connections can't cross a fork
+        if self._engine is None or self._pid != os.getpid():
+            with self._lock:
+                if self._engine is None or self._pid != os.getpid():
+                    self._engine = self._create_engine()
+                    self._pid = os.getpid()
+        return self._engine
+
+    def _create_engine(self) -> Engine:
+        if self.url.startswith("sqlite"):
+            path = self.url.split("///", 1)[-1]
+            directory = os.path.dirname(path)
+            if directory and path != ":memory:":
+                os.makedirs(directory, exist_ok=True)
+            engine = create_engine(self.url, connect_args={"check_same_thread": False, "timeout": 10})
+
+            @event.listens_for(engine, "connect")
+            def _set_pragmas(connection, record):
+                connection.execute("PRAGMA journal_mode=WAL")
+        else:
+            engine = create_engine(self.url, pool_pre_ping=True)
+        Base.metadata.create_all(engine, tables=self.tables)
+        self._add_missing_columns(engine)
+        return engine
+
+    def _add_missing_columns(self, engine: Engine) -> None:
+        # create_all skips existing tables: add columns introduced since (they must have a server default)
+        inspector = inspect(engine)
+        for table in self.tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or column.server_default is None:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type} "
+                                            f"DEFAULT {column.server_default.arg}"))
+
+    def session(self) -> Session:
+        """Return a new session; objects stay usable after commit."""
+        return Session(self.engine, expire_on_commit=False)
@@ -0,0 +1,139 @@
+"""
+Per-request deadlines and run progress reporting.
+
+A Deadline is created when a request arrives and handed down to the run. It
+is also published through a context variable while the run executes, so any
+nested call (tools, handoff sub-runs, searches) can size its own timeout from
+the remaining budget instead of a fixed number.
+"""
+
+import contextlib
+import contextvars
+import time
+from typing import Any, Dict, List, Optional
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("current_deadline", default=None)
+
+
+class Deadline:
+    """An absolute point in time by which a request must finish."""
+
+    def __init__(self, timeout: float):
+        """
+        Create a deadline.
+
+        Args:
+            timeout: The budget in seconds, starting now
+        """
+        self.timeout = timeout
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + timeout
+
+    def remaining(self) -> float:
+        """Return the remaining budget in seconds (never negative)."""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def elapsed(self) -> float:
+        """Return the seconds spent since the deadline was created."""
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Publish this deadline as the current one for the enclosed code."""
+        token = _current_deadline.set(self)
+        try:
+            yield self
+        finally:
+            _current_deadline.reset(token)
+
+    @staticmethod
+    def current() -> Optional["Deadline"]:
+        """Return the deadline of the run being executed, if any."""
+        return _current_deadline.get()
+
+
+def remaining_budget(default: float) -> float:
+    """Return the remaining budget of the current deadline, or ``default``."""
+    deadline = Deadline.current()
+    if deadline is None:
+        return default
+    return min(deadline.remaining(), default)
+
+
+class RunProgress:
+    """How far a run got; filled in by SDK run hooks as the run executes."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.current_agent: Optional[str] = None
+        self.model_turns = 0
+        self.tool_calls: List[str] = []
+        self.handoffs: List[str] = []
+        self.phase_seconds: Dict[str, float] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+
+    def add_phase(self, phase: str, seconds: float) -> None:
+        """Add time spent in a phase ("queue", "model_turn", "tool_call", "handoff")."""
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+
+    def add_usage(self, model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> None:
+        """Add the tokens a model turn used; ``cached_tokens`` of the input came from the prompt cache."""
+        usage = self.tokens.setdefault(model, {"input": 0, "cached": 0, "output": 0})
+        usage["input"] += input_tokens
+        usage["cached"] += cached_tokens
+        usage["output"] += output_tokens
+
+    def merge(self, other: "RunProgress") -> None:
+        """Add the turns, tool calls, handoffs, phases and tokens of another run (e.g. a sub-run)."""
+        self.model_turns += other.model_turns
+        self.tool_calls.extend(other.tool_calls)
+        self.handoffs.extend(other.handoffs)
+        self.current_agent = other.current_agent or self.current_agent
+        for phase, seconds in other.phase_seconds.items():
+            self.add_phase(phase, seconds)
+        for model, usage in other.tokens.items():
+            self.add_usage(model, usage["input"], usage["output"], usage["cached"])
+
+    def usage_summary(self) -> Dict[str, int]:
+        """Return the input, cached input and output tokens of all models together."""
+        return {kind: sum(usage[kind] for usage in self.tokens.values()) for kind in ("input", "cached", "output")}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "elapsed": round(time.monotonic() - self.started_at, 3),
+            "current_agent": self.current_agent,
+            "model_turns": self.model_turns,
+            "tool_calls": list(self.tool_calls),
+            "handoffs": list(self.handoffs),
+            "phase_seconds": {phase: round(seconds, 3) for phase, seconds in self.phase_seconds.items()},
+            "tokens": {model: dict(usage) for model, usage in self.tokens.items()},
+        }
+
+    def describe(self) -> str:
+        """Return a one-line summary for logs."""
+        return (
+            f"{self.model_turns} model turn(s), {len(self.tool_calls)} tool call(s), "
+            f"{len(self.handoffs)} handoff(s), last agent: {self.current_agent}"
+        )
+
+
+class RunCancelledError(TimeoutError):
+    """Raised when a run is cancelled because its deadline expired."""
+
+    def __init__(self, deadline: Deadline, progress: Optional[RunProgress] = None):
+        self.deadline = deadline
+        self.progress = progress or RunProgress()
+        super().__init__(
+            f"Run cancelled after {deadline.elapsed():.2f} seconds "
+            f"(budget {deadline.timeout} seconds): {self.progress.describe()}"
+        )
+
+
+def progress_report(error: BaseException) -> Optional[Dict[str, Any]]:
+    """Return the progress of a cancelled run as a dict, if the error carries one."""
+    progress = getattr(error, "progress", None)
+    return progress.as_dict() if progress is not None else None
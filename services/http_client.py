@@ -0,0 +1,167 @@
+"""
+Shared, pooled AsyncOpenAI client.
+
+One client is created per worker process and installed as the Agents SDK's
+default client, so every planner and web search turn reuses the same
+keep-alive connection pool instead of paying a new TLS handshake.
+"""
+
+import asyncio
+import importlib
+import importlib.util
+import logging
+import os
+import threading
+from typing import Any, Dict
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """Counters describing how the connection pool is used."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.waiting = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.connections_reused,
+            "waiting": self.waiting,
+        }
+
+
+class _RequestTracer:
+    """
+    httpcore "trace" extension for a single request.
+
+    A request waits from the moment it is sent until it starts writing headers
+    on a connection; if no TCP connect happened in between, the connection
+    was reused from the pool.
+    """
+
+    def __init__(self, metrics: PoolMetrics):
+        self.metrics = metrics
+        self.connected = False
+        self.acquired = False
+
+    async def __call__(self, name: str, info: Dict[str, Any]) -> None:
+        if name.endswith("connect_tcp.complete"):
+            self.connected = True
+            self.metrics.connections_opened += 1
+        elif name.endswith("send_request_headers.started"):
+            self._acquire()
+            if not self.connected:
+                self.metrics.connections_reused += 1
+        elif name.endswith(".failed"):
+            self._acquire()
+
+    def _acquire(self) -> None:
+        if not self.acquired:
+            self.acquired = True
+            self.metrics.waiting -= 1
+
+
+# Metrics of the current process's pool
+pool_metrics = PoolMetrics()
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _httpx_module():
+    """Return the httpx module the installed openai package is built on."""
+    import openai
+    base_client = openai.DefaultAsyncHttpxClient.__mro__[1]
+    return importlib.import_module(base_client.__module__.split(".")[0])
+
+
+async def _on_request(request) -> None:
+    pool_metrics.requests += 1
+    pool_metrics.waiting += 1
+    request.extensions["trace"] = _RequestTracer(pool_metrics)
+
+
+def create_async_client() -> Any:
+    """
+    Create an AsyncOpenAI client with a sized keep-alive connection pool.
+
+    HTTP/2 is used when enabled in Config and the h2 package is installed.
+    """
+    import openai
+
+    httpx = _httpx_module()
+
+    http2 = Config.OPENAI_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("OPENAI_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+        http2 = False
+
+    http_client = openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=Config.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=Config.OPENAI_KEEPALIVE_EXPIRY
+        ),
+        http2=http2,
+        event_hooks={"request": [_on_request]}
+    )
+
+    logger.info(
+        f"Created pooled OpenAI client (max_connections={Config.OPENAI_MAX_CONNECTIONS}, "
+        f"keepalive={Config.OPENAI_MAX_KEEPALIVE_CONNECTIONS}, http2={http2})"
+    )
+    return openai.AsyncOpenAI(api_key=Config.OPENAI_API_KEY or None, http_client=http_client)
+
+
+def get_async_client() -> Any:
+    """
+    Return this process's shared AsyncOpenAI client, creating it on first use.
+
+    A forked worker gets its own client rather than the parent's pool.
+    """
+    global _client, _client_pid
+
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                # Counters inherited from a parent process describe its pool, not ours
+                pool_metrics.__init__()
+                _client = create_async_client()
+                _client_pid = os.getpid()
+    return _client
+
+
+async def prime(connections: int) -> int:
+    """
+    Open keep-alive connections to the API before the first requests need them.
+
+    Each connection costs one cheap authenticated request (a model listing),
+    sent concurrently so they don't share a connection. Failures are logged
+    and ignored: the connections are then opened by the first requests.
+
+    Args:
+        connections: The number of connections to open (at most the keep-alive limit)
+
+    Returns:
+        The number of requests that succeeded
+    """
+    client = get_async_client()
+    count = min(connections, Config.OPENAI_MAX_KEEPALIVE_CONNECTIONS)
+    results = await asyncio.gather(*(client.models.list() for _ in range(count)), return_exceptions=True)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        logger.warning(f"Failed to open {len(failures)} of {count} API connection(s): {str(failures[0])}")
+    return count - len(failures)
+
+
+def pool_stats() -> Dict[str, int]:
+    """Return the connection pool counters of this process."""
+    return pool_metrics.as_dict()
@@ -0,0 +1,395 @@
+"""
+Background jobs for long-running queries.
+
+POST /jobs stores a query as a job and returns its id right away; GET
+/jobs/<id> returns its status and, once finished, the answer. A worker pool
+in each server process claims queued jobs from the job store and runs them
+on the serving event loop, detached from any HTTP request, with a budget of
+JOB_TIMEOUT seconds instead of the /ask timeout.
+
+Jobs live in a database (JOBS_DATABASE_URL: SQLite by default, or PostgreSQL
+through psycopg2), so results survive worker restarts. A running job holds a
+lease that its worker renews; if the worker dies, another one picks the job
+up again once the lease expires, up to JOB_MAX_ATTEMPTS times. A worker that
+shuts down gracefully stops claiming jobs, gives its running ones
+JOB_DRAIN_TIMEOUT seconds to finish and puts the rest back in the queue.
+A job that admission control turns away is deferred with a growing delay,
+and failed once it was turned away JOB_MAX_DEFERRALS times.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Float, Integer, String, Text, and_, delete, func, or_, select, update
+from sqlalchemy.orm import Mapped, Session, mapped_column
+
+from config import Config
+from services.admission import AdmissionRejected
+from services.database import Base, Database
+from services.deadline import Deadline, progress_report
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job(Base):
+    """A query to answer in the background, and its outcome."""
+
+    __tablename__ = "jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    query: Mapped[str] = mapped_column(Text)
+    status: Mapped[str] = mapped_column(String(16), index=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    deferrals: Mapped[int] = mapped_column(Integer, default=0, server_default="0")  # Times not admitted
+    # Worker process running the job, and until when it holds it (for queued jobs: not before)
+    owner: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    lease_expires_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    result: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    progress: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON
+    created_at: Mapped[float] = mapped_column(Float, index=True)
+    started_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    finished_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "query": self.query,
+            "attempts": self.attempts,
+            "deferrals": self.deferrals,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "progress": json.loads(self.progress) if self.progress else None,
+        }
+
+
+class JobStore:
+    """Jobs in a SQL database, safe to share between worker processes."""
+
+    def __init__(self, url: str, max_attempts: int = 2):
+        """
+        Args:
+            url: SQLAlchemy database URL
+            max_attempts: How often a job is started before an interruption fails it
+        """
+        self.database = Database(url, [Job.__table__])
+        self.max_attempts = max_attempts
+
+    def _session(self) -> Session:
+        return self.database.session()
+
+    def submit(self, query: str) -> Dict[str, Any]:
+        """Store a new queued job and return it."""
+        job = Job(id=uuid.uuid4().hex, query=query, status=QUEUED, attempts=0, deferrals=0, created_at=time.time())
+        with self._session() as session:
+            session.add(job)
+            session.commit()
+        return job.as_dict()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job, or None if there is no such job."""
+        with self._session() as session:
+            job = session.get(Job, job_id)
+            return job.as_dict() if job is not None else None
+
+    def claim(self, owner: str, lease: float) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest job that is queued, or running with an expired lease.
+
+        Claims are compare-and-set updates, so concurrent workers never take the
+        same job. A job interrupted ``max_attempts`` times is failed instead.
+
+        Returns:
+            The claimed job, or None if there is nothing to do
+        """
+        now = time.time()
+        available = or_(
+            and_(Job.status == QUEUED, or_(Job.lease_expires_at.is_(None), Job.lease_expires_at <= now)),
+            and_(Job.status == RUNNING, Job.lease_expires_at < now),
+        )
+        with self._session() as session:
+            candidates = session.scalars(select(Job).where(available).order_by(Job.created_at).limit(10)).all()
+            for job in candidates:
+                unchanged = and_(Job.id == job.id, Job.status == job.status, Job.attempts == job.attempts)
+                if job.attempts >= self.max_attempts:
+                    session.execute(update(Job).where(unchanged).values(
+                        status=FAILED, error="The job was interrupted too many times", finished_at=now
+                    ))
+                    session.commit()
+                    continue
+
+                claimed = session.execute(update(Job).where(unchanged).values(
+                    status=RUNNING, owner=owner, attempts=Job.attempts + 1,
+                    started_at=now, lease_expires_at=now + lease
+                ))
+                session.commit()
+                if claimed.rowcount == 1:
+                    return session.get(Job, job.id, populate_existing=True).as_dict()
+        return None
+
+    def _update_owned(self, job_id: str, holder: str, **values) -> bool:
+        # Only the worker holding a running job may change it
+        with self._session() as session:
+            updated = session.execute(
+                update(Job).where(Job.id == job_id, Job.owner == holder, Job.status == RUNNING).values(**values)
+            )
+            session.commit()
+            return updated.rowcount == 1
+
+    def renew(self, job_id: str, owner: str, lease: float) -> bool:
+        """Extend the lease of a running job; False if the worker lost the job."""
+        return self._update_owned(job_id, owner, lease_expires_at=time.time() + lease)
+
+    def release(self, job_id: str, owner: str, delay: float) -> bool:
+        """Put a claimed job back in the queue, to be picked up after ``delay`` seconds."""
+        return self._update_owned(
+            job_id, owner, status=QUEUED, owner=None, attempts=Job.attempts - 1,
+            lease_expires_at=time.time() + delay
+        )
+
+    def defer(self, job_id: str, owner: str, delay: float) -> bool:
+        """Like ``release``, for a job that was not admitted: counts it in ``deferrals``."""
+        return self._update_owned(
+            job_id, owner, status=QUEUED, owner=None, attempts=Job.attempts - 1, deferrals=Job.deferrals + 1,
+            lease_expires_at=time.time() + delay
+        )
+
+    def finish(self, job_id: str, owner: str, status: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None, progress: Optional[Dict[str, Any]] = None) -> bool:
+        """Record the outcome of a running job."""
+        return self._update_owned(
+            job_id, owner, status=status, finished_at=time.time(), lease_expires_at=None,
+            result=json.dumps(result) if result is not None else None, error=error,
+            progress=json.dumps(progress) if progress is not None else None
+        )
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs that finished before a timestamp; return how many."""
+        with self._session() as session:
+            deleted = session.execute(
+                delete(Job).where(Job.status.in_([SUCCEEDED, FAILED]), Job.finished_at < older_than)
+            )
+            session.commit()
+            return deleted.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of jobs per status."""
+        with self._session() as session:
+            return dict(session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+
+
+class JobWorkerPool:
+    """Claims jobs from the store and runs up to ``concurrency`` of them on an event loop."""
+
+    def __init__(self, store: JobStore, concurrency: int, poll_interval: float, lease: float):
+        """
+        Args:
+            store: The job store shared with the other workers
+            concurrency: Maximum number of jobs this process runs at a time
+            poll_interval: Seconds between checks for new jobs when idle
+            lease: Seconds a running job is held without renewal
+        """
+        self.store = store
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.completed = 0
+        self.failed = 0
+        self.requeued = 0
+        self._running: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._pid: Optional[int] = None
+        self._draining = False
+        self._lock = threading.Lock()
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start dispatching jobs on a loop (once per process; later calls do nothing)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.owner = f"{socket.gethostname()}:{self._pid}"
+            self._running = set()
+            self._draining = False
+            self._loop = loop
+            asyncio.run_coroutine_threadsafe(self._dispatch(), loop)
+            logger.info(f"Job worker pool started ({self.owner}, concurrency {self.concurrency})")
+
+    def notify(self) -> None:
+        """Check for new jobs now instead of at the next poll."""
+        if self._loop is not None and self._wake is not None and self._pid == os.getpid():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def stop_claiming(self) -> None:
+        """Claim no more jobs in this process (safe to call from signal handlers and other threads)."""
+        self._draining = True
+        self.notify()
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Stop claiming jobs and wait up to ``timeout`` seconds for the running ones.
+
+        Jobs still running then are cancelled and put back in the queue, so
+        another worker starts them right away instead of after their lease.
+
+        Returns:
+            The number of jobs put back
+        """
+        self._draining = True
+        if self._wake is not None:
+            self._wake.set()
+        running = set(self._running)
+        if not running:
+            return 0
+        logger.info(f"Waiting up to {timeout} seconds for {len(running)} running job(s)")
+        _, pending = await asyncio.wait(running, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.info(f"Put {len(pending)} unfinished job(s) back in the queue")
+        return len(pending)
+
+    async def _dispatch(self) -> None:
+        self._wake = asyncio.Event()
+        last_purge = 0.0
+        while not self._draining:
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                await self._purge()
+
+            while not self._draining and len(self._running) < self.concurrency:
+                try:
+                    job = await asyncio.to_thread(self.store.claim, self.owner, self.lease)
+                except Exception as e:
+                    logger.error(f"Failed to claim a job: {str(e)}")
+                    break
+                if job is None:
+                    break
+                task = asyncio.ensure_future(self._run(job))
+                self._running.add(task)
+                task.add_done_callback(self._job_done)
+
+            self._wake.clear()
+            try:
+                async with asyncio.timeout(self.poll_interval):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
+
+    def _job_done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        self._wake.set()
+
+    async def _purge(self) -> None:
+        try:
+            deleted = await asyncio.to_thread(self.store.purge, time.time() - Config.JOB_RETENTION)
+            if deleted:
+                logger.info(f"Purged {deleted} finished job(s)")
+        except Exception as e:
+            logger.warning(f"Failed to purge finished jobs: {str(e)}")
+
+    async def _renew_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await asyncio.to_thread(self.store.renew, job_id, self.owner, self.lease):
+                logger.warning(f"Job {job_id} is no longer held by this worker")
+                return
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        from services import agent_runtime
+
+        job_id = job["id"]
+        logger.info(f"Running job {job_id} (attempt {job['attempts']})")
+        renewal = asyncio.ensure_future(self._renew_lease(job_id))
+        try:
+            cache_key = agent_runtime.response_cache_key(job["query"])
+            payload = await asyncio.to_thread(agent_runtime.cached_answer, cache_key)
+            if payload is None:
+                run = agent_runtime.create_query_run(job["query"], deadline=Deadline(Config.JOB_TIMEOUT))
+                payload = await agent_runtime.run_query(run, cache_key=cache_key, mode="job")
+
+            if payload.get('failed'):
+                self.failed += 1
+                await asyncio.to_thread(self.store.finish, job_id, self.owner, FAILED, result=payload,
+                                        error=payload['full_response'])
+            else:
+                self.completed += 1
+                await asyncio.to_thread(self.store.finish, job_id, self.owner, SUCCEEDED, result=payload)
+        except asyncio.CancelledError:
+            # The worker is shutting down; the job starts over elsewhere
+            self.requeued += 1
+            await asyncio.to_thread(self.store.release, job_id, self.owner, 0)
+            raise
+        except AdmissionRejected as e:
+            # The server is busy with interactive requests: try again later, backing off, up to a limit
+            deferrals = (job.get("deferrals") or 0) + 1
+            if deferrals > Config.JOB_MAX_DEFERRALS:
+                self.failed += 1
+                logger.warning(f"Job {job_id} not admitted {deferrals} times ({e.reason}), giving up")
+                await asyncio.to_thread(self.store.finish, job_id, self.owner, FAILED,
+                                        error="The server was too busy to run the job")
+            else:
+                self.requeued += 1
+                delay = min(max(e.retry_after, 1) * 2 ** (deferrals - 1), Config.JOB_MAX_DEFERRAL_DELAY)
+                logger.info(f"Job {job_id} not admitted ({e.reason}), retrying in {delay} seconds")
+                await asyncio.to_thread(self.store.defer, job_id, self.owner, delay)
+        except TimeoutError as e:
+            self.failed += 1
+            logger.error(f"Job {job_id} timed out: {str(e)}")
+            await asyncio.to_thread(self.store.finish, job_id, self.owner, FAILED, error=str(e), progress=progress_report(e))
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Job {job_id} failed: {str(e)}", exc_info=True)
+            await asyncio.to_thread(self.store.finish, job_id, self.owner, FAILED, error=str(e))
+        finally:
+            renewal.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return this process's job counters."""
+        return {
+            "running": len(self._running),
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+            "requeued": self.requeued,
+        }
+
+
+store = JobStore(Config.JOBS_DATABASE_URL, max_attempts=Config.JOB_MAX_ATTEMPTS)
+worker_pool = JobWorkerPool(
+    store, concurrency=Config.JOB_CONCURRENCY, poll_interval=Config.JOB_POLL_INTERVAL, lease=Config.JOB_LEASE
+)
+
+
+def submit(query: str) -> Dict[str, Any]:
+    """Queue a query as a job and return the job."""
+    job = store.submit(query)
+    worker_pool.notify()
+    logger.info(f"Queued job {job['id']}")
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Return a job by id, or None."""
+    return store.get(job_id)
@@ -0,0 +1,201 @@
+"""
+Logging set up for the request hot path.
+
+configure() takes the place of logging.basicConfig. Request threads and the
+event loop only put records on a bounded queue (a QueueHandler), and a
+listener thread formats and writes them, so slow log I/O never holds up a
+request. When the queue is full, records are dropped and counted rather than
+blocking the caller.
+
+Levels come from Config: LOG_LEVEL for the root logger and LOG_LEVELS
+("name=LEVEL,...") per logger. DEBUG records are too many to write for every
+request in production, so LOG_DEBUG_SAMPLE_RATE keeps them for a sample of
+requests instead: start_sample() decides once per request (or background
+run), and the DEBUG records of a request, its run, tasks and tool calls
+included, are kept or dropped together.
+
+Log calls on the hot path pass their arguments %-style
+(``logger.debug("Result: %s", result)``), so records that are filtered out
+are never formatted.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+
+# Whether DEBUG records of the current request or run are kept (None outside of one)
+_sampled: contextvars.ContextVar[Optional[bool]] = contextvars.ContextVar("log_sampled", default=None)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records while its queue is full instead of blocking or raising."""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0  # Approximate: incremented without a lock
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DebugSampler(logging.Filter):
+    """Pass records below ``threshold`` (DEBUG) only within sampled requests and runs."""
+
+    def __init__(self, threshold: int):
+        super().__init__()
+        self.threshold = threshold
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.threshold or _sampled.get() is True
+
+
+class LogStats:
+    """Counters of sampling decisions for DEBUG logging."""
+
+    def __init__(self):
+        self.decisions = 0
+        self.sampled = 0
+
+
+_handler: Optional[logging.Handler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_pid: Optional[int] = None
+_lock = threading.Lock()
+log_stats = LogStats()
+
+
+def parse_levels(spec: str) -> List[Tuple[str, int]]:
+    """Parse "name=LEVEL,..." into (logger name, level) pairs, skipping invalid entries."""
+    levels = []
+    for entry in spec.split(","):
+        name, _, level = entry.partition("=")
+        value = logging.getLevelName(level.strip().upper())
+        if name.strip() and isinstance(value, int):
+            levels.append((name.strip(), value))
+    return levels
+
+
+def configure() -> None:
+    """
+    Install the logging pipeline on the root logger, once per process.
+
+    Calling it again in the same process does nothing; a forked child gets
+    its own queue and listener thread (see _reinit_after_fork).
+    """
+    global _handler, _listener, _pid
+    with _lock:
+        if _pid == os.getpid():
+            return
+        root = logging.getLogger()
+        if _handler is not None:
+            root.removeHandler(_handler)
+
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(logging.Formatter(Config.LOG_FORMAT))
+        if Config.LOG_ASYNC:
+            records: queue.Queue = queue.Queue(Config.LOG_QUEUE_SIZE)
+            _handler = DroppingQueueHandler(records)
+            _listener = logging.handlers.QueueListener(records, output)
+            _listener.start()
+        else:
+            _handler = output
+            _listener = None
+        root.addHandler(_handler)
+
+        level = logging.getLevelName(Config.LOG_LEVEL)
+        if not isinstance(level, int):
+            level = logging.INFO
+        if level > logging.DEBUG and Config.LOG_DEBUG_SAMPLE_RATE > 0:
+            # DEBUG records must be created to be sampled; the filter drops the unsampled ones
+            root.setLevel(logging.DEBUG)
+            _handler.addFilter(DebugSampler(level))
+        else:
+            root.setLevel(level)
+        for name, logger_level in parse_levels(Config.LOG_LEVELS):
+            logging.getLogger(name).setLevel(logger_level)
+        _pid = os.getpid()
+
+
+def _reinit_after_fork() -> None:
+    # The listener thread did not survive the fork, and its queue may be locked
+    global _pid, _listener, _lock
+    if _pid is not None:
+        _lock = threading.Lock()
+        _listener = None
+        _pid = None
+        configure()
+
+
+def shutdown() -> None:
+    """Write the records still queued and stop the listener thread of this process."""
+    global _listener
+    if _listener is not None and _pid == os.getpid():
+        _listener.stop()
+        _listener = None
+
+
+os.register_at_fork(after_in_child=_reinit_after_fork)
+atexit.register(shutdown)
+
+
+def start_sample() -> contextvars.Token:
+    """
+    Decide whether the DEBUG records of the current request or run are kept.
+
+    Calls nested in a sampled scope (plan steps, a classified run's final
+    route, the run of a sampled request) keep the outer decision. Tasks
+    started from here inherit the decision with the context, including runs
+    that request threads hand to the background event loop.
+
+    Returns:
+        A token for end_sample
+    """
+    sampled = _sampled.get()
+    if sampled is None:
+        sampled = Config.LOG_DEBUG_SAMPLE_RATE > 0 and random.random() < Config.LOG_DEBUG_SAMPLE_RATE
+        log_stats.decisions += 1
+        log_stats.sampled += sampled
+    return _sampled.set(sampled)
+
+
+def end_sample(token: contextvars.Token) -> None:
+    """Restore the sampling decision from before start_sample."""
+    try:
+        _sampled.reset(token)
+    except ValueError:
+        # Ended from another context, e.g. an abandoned stream closed by the event loop
+        _sampled.set(None)
+
+
+@contextlib.contextmanager
+def sampled_run() -> Iterator[None]:
+    """Keep or drop the DEBUG records of the enclosed run together (see start_sample)."""
+    token = start_sample()
+    try:
+        yield
+    finally:
+        end_sample(token)
+
+
+def stats() -> Dict[str, int]:
+    """Return the logging counters of this process."""
+    records = getattr(_handler, "queue", None)
+    return {
+        "queued": records.qsize() if records is not None else 0,
+        "dropped": getattr(_handler, "dropped", 0),
+        "sampling_decisions": log_stats.decisions,
+        "sampled": log_stats.sampled,
+    }
@@ -0,0 +1,260 @@
+"""
+Per-run instrumentation exported in Prometheus format on /metrics.
+
+Runs record their phases (agent build, queueing, model turns, tool calls,
+handoffs), token usage per model and tool outcomes here. Under gunicorn the
+metrics are aggregated across workers with prometheus_client's multiprocess
+mode: gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a fresh directory
+before the app is imported, and any worker can serve the combined view.
+
+prometheus_client is optional; without it every function here is a no-op and
+/metrics reports that metrics are unavailable.
+"""
+
+import logging
+import os
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+    from prometheus_client import multiprocess
+except ImportError:  # Metrics are optional
+    prometheus_client = None
+
+# Seconds; model turns and searches take seconds, tool calls milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# Semantic cache lookups take well under a millisecond; similarities are cosines
+LOOKUP_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.925, 0.95, 0.975, 0.99, 1.0)
+
+PHASE_SECONDS = None
+RUN_SECONDS = None
+HTTP_REQUEST_SECONDS = None
+TOKENS = None
+TOOL_CALLS = None
+TOOL_SECONDS = None
+CACHE_REQUESTS = None
+ADMISSIONS = None
+ADMISSION_LOAD = None
+PROMPT_VERSIONS = None
+ROUTES = None
+ROUTE_SECONDS = None
+SEMANTIC_SIMILARITY = None
+SEMANTIC_LOOKUP_SECONDS = None
+PROCESS_STATS = None
+
+if prometheus_client is not None:
+    PHASE_SECONDS = Histogram(
+        "agent_phase_seconds", "Time spent in each phase of a run",
+        ["phase", "name"], buckets=LATENCY_BUCKETS
+    )
+    RUN_SECONDS = Histogram(
+        "agent_run_seconds", "Duration of whole runs by mode and outcome",
+        ["mode", "outcome"], buckets=LATENCY_BUCKETS
+    )
+    HTTP_REQUEST_SECONDS = Histogram(
+        "http_request_seconds", "Time spent handling HTTP requests (until the response starts)",
+        ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS
+    )
+    TOKENS = Counter("agent_tokens", "Tokens used per model", ["model", "kind"])
+    TOOL_CALLS = Counter("agent_tool_calls", "Tool invocations by outcome", ["tool", "outcome"])
+    TOOL_SECONDS = Histogram(
+        "agent_tool_seconds", "Duration of function tool calls by tool and outcome",
+        ["tool", "outcome"], buckets=LATENCY_BUCKETS
+    )
+    CACHE_REQUESTS = Counter("cache_requests", "Cache lookups by cache and result", ["cache", "result"])
+    SEMANTIC_SIMILARITY = Histogram(
+        "semantic_cache_similarity", "Similarity of the closest cached query to each semantic cache lookup, by result",
+        ["result"], buckets=SIMILARITY_BUCKETS
+    )
+    SEMANTIC_LOOKUP_SECONDS = Histogram(
+        "semantic_cache_lookup_seconds", "Duration of semantic cache lookups (embedding and search)",
+        buckets=LOOKUP_BUCKETS
+    )
+    ADMISSIONS = Counter("admission_decisions", "Runs admitted or rejected, by result", ["result"])
+    ADMISSION_LOAD = Gauge(
+        "admission_load", "Runs executing and waiting for a slot", ["state"], multiprocess_mode="livesum"
+    )
+    ROUTES = Counter("route_decisions", "Queries by route chosen and reason", ["route", "reason"])
+    ROUTE_SECONDS = Histogram(
+        "route_run_seconds", "Duration of whole runs by route and outcome",
+        ["route", "outcome"], buckets=LATENCY_BUCKETS
+    )
+    PROMPT_VERSIONS = Gauge(
+        "prompt_version_info", "Version hashes of the prompt templates and agent instructions in use",
+        ["prompt", "version"], multiprocess_mode="max"
+    )
+    # Process-local counters owned by other modules, summed over live workers
+    PROCESS_STATS = Gauge(
+        "process_component_stats", "Counters of per-process components (connection pool, caches)",
+        ["component", "stat"], multiprocess_mode="livesum"
+    )
+
+
+def available() -> bool:
+    """Whether metrics are collected (prometheus_client is installed)."""
+    return prometheus_client is not None
+
+
+def observe_phase(phase: str, seconds: float, name: str = "") -> None:
+    """
+    Record the duration of one phase of a run.
+
+    Args:
+        phase: "admission", "build", "queue", "model_turn", "tool_call", "handoff",
+            "step" (a plan step run by the orchestrator) or "route" (route classification)
+        seconds: The duration
+        name: The model, tool, target agent or step kind the phase belongs to
+    """
+    if PHASE_SECONDS is not None:
+        PHASE_SECONDS.labels(phase, name).observe(seconds)
+
+
+def observe_run(mode: str, outcome: str, seconds: float) -> None:
+    """Record a finished run ("ask", "stream" or "job"; "ok", "error", "timeout" or "cancelled")."""
+    if RUN_SECONDS is not None:
+        RUN_SECONDS.labels(mode, outcome).observe(seconds)
+        update_process_stats()
+
+
+def record_route(route: str, reason: str) -> None:
+    """Record a routing decision ("calculator", "fast" or "planner", and the rule that chose it)."""
+    if ROUTES is not None:
+        ROUTES.labels(route, reason).inc()
+
+
+def observe_route(route: str, outcome: str, seconds: float) -> None:
+    """Record the duration and outcome of a run on a route."""
+    if ROUTE_SECONDS is not None:
+        ROUTE_SECONDS.labels(route, outcome).observe(seconds)
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float) -> None:
+    """Record the time the serving layer spent on a request."""
+    if HTTP_REQUEST_SECONDS is not None:
+        HTTP_REQUEST_SECONDS.labels(endpoint, method, str(status)).observe(seconds)
+
+
+def record_usage(model: str, usage: Any) -> None:
+    """Record the token usage of a model turn (an SDK Usage object)."""
+    if TOKENS is None or usage is None:
+        return
+    TOKENS.labels(model, "input").inc(getattr(usage, "input_tokens", 0) or 0)
+    TOKENS.labels(model, "output").inc(getattr(usage, "output_tokens", 0) or 0)
+    cached = getattr(getattr(usage, "input_tokens_details", None), "cached_tokens", 0) or 0
+    reasoning = getattr(getattr(usage, "output_tokens_details", None), "reasoning_tokens", 0) or 0
+    TOKENS.labels(model, "cached_input").inc(cached)
+    TOKENS.labels(model, "reasoning").inc(reasoning)
+
+
+def record_tool_call(tool: str, outcome: str) -> None:
+    """Record a tool invocation ("ok", "error", "unsafe", "timeout", "rejected" or "crashed")."""
+    if TOOL_CALLS is not None:
+        TOOL_CALLS.labels(tool, outcome).inc()
+
+
+def observe_tool(tool: str, outcome: str, seconds: float) -> None:
+    """Record the duration of a function tool call ("ok", "error", "timeout" or "cached")."""
+    if TOOL_SECONDS is not None:
+        TOOL_SECONDS.labels(tool, outcome).observe(seconds)
+
+
+def record_cache(cache: str, result: str) -> None:
+    """Record a cache lookup ("hit", "miss" or "coalesced")."""
+    if CACHE_REQUESTS is not None:
+        CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def observe_semantic_lookup(result: str, similarity: float, seconds: float) -> None:
+    """Record a semantic cache lookup ("hit" or "miss"), the best similarity found and its duration."""
+    if SEMANTIC_SIMILARITY is not None:
+        SEMANTIC_SIMILARITY.labels(result).observe(similarity)
+        SEMANTIC_LOOKUP_SECONDS.observe(seconds)
+
+
+def record_admission(result: str) -> None:
+    """Record an admission decision ("admitted", "rate_limited", "queue_full" or "queue_timeout")."""
+    if ADMISSIONS is not None:
+        ADMISSIONS.labels(result).inc()
+
+
+def set_admission_load(active: int, waiting: int) -> None:
+    """Publish the number of runs executing and waiting in this process."""
+    if ADMISSION_LOAD is not None:
+        ADMISSION_LOAD.labels("active").set(active)
+        ADMISSION_LOAD.labels("waiting").set(waiting)
+
+
+def record_prompt_version(prompt: str, version: str) -> None:
+    """Publish the version hash of a prompt template or agent instructions."""
+    if PROMPT_VERSIONS is not None:
+        PROMPT_VERSIONS.labels(prompt, version).set(1)
+
+
+def update_process_stats() -> None:
+    """Publish this process's connection pool, cache and executor counters."""
+    if PROCESS_STATS is None:
+        return
+
+    from custom_agents.agent_cache import build_cache
+    from services.http_client import pool_stats
+    from services.jobs import worker_pool
+    from services.logs import stats as log_stats
+    from services.semantic_cache import stats as semantic_cache_stats
+    from services.web_search import search_stats
+    from tools.calc_engine import default_engine
+    from tools.executor import tool_executor
+    from tools.middleware import stats as tool_memo_stats
+    from tools.registry import stats as tool_registry_stats
+
+    components = {
+        "openai_pool": pool_stats(),
+        "agent_build_cache": build_cache.stats(),
+        "calculator_engine": default_engine.stats(),
+        "web_search": search_stats(),
+        "jobs": worker_pool.stats(),
+        "logging": log_stats(),
+        "tool_executor": tool_executor.stats(),
+        "tool_memo": tool_memo_stats(),
+        "tool_registry": tool_registry_stats(),
+        "semantic_cache": semantic_cache_stats(),
+    }
+    for component, stats in components.items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)):
+                PROCESS_STATS.labels(component, stat).set(value)
+
+
+def multiprocess_dir() -> Optional[str]:
+    """Return the directory shared by worker processes, if running in multiprocess mode."""
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+def render() -> Tuple[bytes, str]:
+    """
+    Return the exposition of all metrics and its content type.
+
+    In multiprocess mode the samples of all workers are combined.
+
+    Raises:
+        RuntimeError: If prometheus_client is not installed
+    """
+    if prometheus_client is None:
+        raise RuntimeError("Metrics are unavailable: prometheus_client is not installed")
+
+    update_process_stats()
+    if multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop the live gauges of an exited worker (gunicorn child_exit hook)."""
+    if prometheus_client is not None and multiprocess_dir():
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,285 @@
+"""
+Parallel execution of structured plans.
+
+In the "parallel" PLAN_EXECUTION mode a query is answered in three stages
+instead of one sequential planner conversation:
+
+1. The Step Planner returns a StepPlan: web searches and calculations with
+   the ids of the steps each one depends on.
+2. The steps are carried out here, each as soon as the steps it depends on
+   are done, at most FANOUT_CONCURRENCY at a time. Independent lookups run
+   concurrently, so they cost about as long as the slowest one.
+3. The planner agent writes the answer from the step results in a final
+   synthesis turn; it keeps its tools for anything the plan left out.
+
+ParallelPlanRun has the interface of agent_wrapper's run objects, so the
+serving layer awaits or streams it the same way.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import agent_wrapper
+from config import Config
+from custom_agents.step_planner_agent import PlanStep, StepPlan
+from services import metrics
+from services.deadline import Deadline, RunCancelledError, RunProgress
+from services.web_search import get_search_service
+from tools.registry import get_tool
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class StepResult:
+    """The outcome of one plan step."""
+
+    def __init__(self, step: PlanStep, output: str = "", error: Optional[str] = None, seconds: float = 0.0):
+        self.step = step
+        self.output = output
+        self.error = error
+        self.seconds = seconds
+        # The last numeric result of a calculate step, for {id} placeholders
+        self.value: Optional[str] = None
+
+    def describe(self) -> str:
+        """Return the step and its result as text for the synthesis turn."""
+        step = self.step
+        title = f"[{step.id}] {step.kind.capitalize()}: {step.query if step.kind == 'search' else step.description}"
+        return f"{title}\n{self.output if self.error is None else 'Failed: ' + self.error}"
+
+
+def order_steps(plan: StepPlan, max_steps: int) -> List[PlanStep]:
+    """
+    Return the runnable steps of a plan with dependencies before dependents.
+
+    Steps beyond ``max_steps``, with duplicate ids, or whose dependencies are
+    unknown or circular are dropped (and logged); dependencies on themselves
+    are ignored.
+    """
+    steps: Dict[str, PlanStep] = {}
+    for step in plan.steps[:max_steps]:
+        if step.id in steps:
+            logger.warning(f"Dropping plan step with duplicate id {step.id}")
+            continue
+        steps[step.id] = step
+
+    ordered: List[PlanStep] = []
+    done = set()
+    pending = list(steps.values())
+    while pending:
+        ready = [step for step in pending if all(d in done or d == step.id for d in step.depends_on)]
+        if not ready:
+            break
+        for step in ready:
+            ordered.append(step)
+            done.add(step.id)
+        pending = [step for step in pending if step.id not in done]
+
+    for step in pending:
+        logger.warning(f"Dropping plan step {step.id}: unknown or circular dependencies {step.depends_on}")
+    return ordered
+
+
+class ParallelPlanRun:
+    """A run that plans structured steps, executes them concurrently, then synthesizes the answer."""
+
+    def __init__(self, agent: Any, step_planner: Any, user_input: str, prompt: str,
+                 deadline: Optional[Deadline] = None, concurrency: int = 4,
+                 history: Optional[List[Dict[str, Any]]] = None):
+        """
+        Args:
+            agent: The built planner agent writing the answer
+            step_planner: The built Step Planner agent
+            user_input: The user's query, which is planned
+            prompt: The full prompt the planner answers
+            deadline: Optional request deadline covering all three stages
+            concurrency: Maximum number of steps running at a time
+            history: Optional input items of earlier conversation turns, given
+                to the planning and synthesis runs
+        """
+        self.agent = agent
+        self.step_planner = step_planner
+        self.user_input = user_input
+        self.prompt = prompt
+        self.deadline = deadline
+        self.concurrency = concurrency
+        self.history = history or []
+        # The step results given to the synthesis turn, kept with the conversation
+        self.context = ""
+        self.progress = RunProgress()
+        self.calculator = get_tool("calculate_batch")
+
+    async def _plan(self) -> Optional[StepPlan]:
+        run = agent_wrapper.create_run(self.step_planner, [{"role": "user", "content": self.user_input}],
+                                       deadline=self.deadline, history=self.history)
+        result = await run.get_final_run_result()
+        self._merge_progress(run.progress)
+        plan = getattr(result, 'final_output', None)
+        if not isinstance(plan, StepPlan):
+            logger.warning(f"Step planning failed, answering without a plan: {plan}")
+            return None
+        return plan
+
+    def _merge_progress(self, progress: RunProgress) -> None:
+        self.progress.merge(progress)
+
+    @staticmethod
+    def _substitute(expression: str, results: Dict[str, StepResult]) -> str:
+        # {id} becomes the result of that calculate step; unknown ids are left for the engine to reject
+        def value(match):
+            result = results.get(match.group(1))
+            return f"({result.value})" if result is not None and result.value is not None else match.group(0)
+        return _PLACEHOLDER.sub(value, expression)
+
+    async def _run_step(self, step: PlanStep, results: Dict[str, StepResult]) -> StepResult:
+        started = time.perf_counter()
+        try:
+            if step.kind == "search":
+                output = await get_search_service().search(step.query)
+                result = StepResult(step, output)
+            else:
+                expressions = [self._substitute(expression, results) for expression in step.expressions]
+                payload = await self.calculator.evaluate_async(expressions)
+                if "error" in payload:
+                    raise ValueError(payload["error"])
+                lines = [f"{item['expression']} = {item.get('result', 'error: ' + str(item.get('error')))}"
+                         for item in payload["results"]]
+                result = StepResult(step, "\n".join(lines))
+                values = [item["result"] for item in payload["results"] if "result" in item]
+                result.value = values[-1] if values else None
+        except (asyncio.CancelledError, RunCancelledError):
+            raise
+        except Exception as e:
+            logger.warning(f"Plan step {step.id} failed: {str(e)}")
+            result = StepResult(step, error=str(e))
+
+        result.seconds = time.perf_counter() - started
+        metrics.observe_phase("step", result.seconds, step.kind)
+        self.progress.add_phase("step", result.seconds)
+        self.progress.tool_calls.append(step.kind)
+        return result
+
+    async def _execute(self, steps: List[PlanStep], events: Optional[asyncio.Queue] = None) -> List[StepResult]:
+        """Run each step once its dependencies are done, at most ``concurrency`` at a time."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: Dict[str, StepResult] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run(step: PlanStep) -> StepResult:
+            dependencies = [tasks[d] for d in step.depends_on if d != step.id]
+            if dependencies:
+                await asyncio.gather(*dependencies)
+            async with semaphore:
+                if events is not None:
+                    events.put_nowait({"type": "tool_call", "name": f"{step.kind} ({step.id})",
+                                       "arguments": json.dumps(step.query if step.kind == "search" else step.expressions)})
+                result = await self._run_step(step, results)
+            results[step.id] = result
+            if events is not None:
+                events.put_nowait({"type": "tool_output", "output": result.output if result.error is None
+                                   else f"Failed: {result.error}"})
+            return result
+
+        # Steps are ordered, so the tasks a step waits for already exist
+        for step in steps:
+            tasks[step.id] = asyncio.ensure_future(run(step))
+        try:
+            return list(await asyncio.gather(*tasks.values()))
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def _prepare(self, events: Optional[asyncio.Queue] = None) -> str:
+        """Plan and execute the steps; return the input of the synthesis turn."""
+        if self.deadline is not None:
+            # Searches size their timeouts from the deadline; tasks created below inherit it
+            with self.deadline.activate():
+                return await self._plan_and_execute(events)
+        return await self._plan_and_execute(events)
+
+    async def _plan_and_execute(self, events: Optional[asyncio.Queue]) -> str:
+        started = time.perf_counter()
+        plan = await self._plan()
+        steps = order_steps(plan, Config.MAX_PLAN_STEPS) if plan is not None else []
+        if not steps:
+            return self.prompt
+
+        results = await self._execute(steps, events)
+        logger.debug("Executed %d plan step(s) in %.2f seconds (longest step %.2f seconds)",
+                     len(results), time.perf_counter() - started, max(r.seconds for r in results))
+        described = "\n\n".join(result.describe() for result in results)
+        self.context = f"Results of the plan steps carried out for this question:\n\n{described}"
+        return (
+            f"{self.prompt}\n\n"
+            "These plan steps have already been carried out. Use their results instead of repeating "
+            "the searches and calculations, and list them in your plan:\n\n"
+            + described
+        )
+
+    def _synthesis_run(self, synthesis_input: str) -> Any:
+        return agent_wrapper.create_run(self.agent, [{"role": "user", "content": synthesis_input}],
+                                        deadline=self.deadline, history=self.history)
+
+    def _cancelled(self) -> RunCancelledError:
+        error = RunCancelledError(self.deadline, self.progress)
+        logger.warning(str(error))
+        return error
+
+    async def get_final_run_result(self) -> Any:
+        """Plan, execute the steps and return the result of the synthesis turn."""
+        timeout = asyncio.timeout(self.deadline.remaining() if self.deadline else None)
+        try:
+            async with timeout:
+                synthesis_input = await self._prepare()
+                run = self._synthesis_run(synthesis_input)
+                result = await run.get_final_run_result()
+                self._merge_progress(run.progress)
+                return result
+        except RunCancelledError as e:
+            self._merge_progress(e.progress)
+            raise self._cancelled() from None
+        except TimeoutError:
+            if timeout.expired():
+                raise self._cancelled()
+            raise
+
+    async def stream_events(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the run as event dicts like agent_wrapper's runs do.
+
+        Plan steps appear as "tool_call" and "tool_output" events while they
+        run, followed by the streamed synthesis turn.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        preparation = asyncio.ensure_future(self._prepare(events))
+        try:
+            while not preparation.done() or not events.empty():
+                getter = asyncio.ensure_future(events.get())
+                try:
+                    remaining = self.deadline.remaining() if self.deadline else None
+                    await asyncio.wait({getter, preparation}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if not getter.done():
+                        getter.cancel()
+                if getter.done() and not getter.cancelled():
+                    yield getter.result()
+                elif not preparation.done():
+                    raise self._cancelled()
+            synthesis_input = preparation.result()
+        except RunCancelledError as e:
+            if e.progress is not self.progress:
+                self._merge_progress(e.progress)
+                raise self._cancelled() from None
+            raise
+        finally:
+            preparation.cancel()
+
+        run = self._synthesis_run(synthesis_input)
+        async for event in run.stream_events():
+            yield event
@@ -0,0 +1,134 @@
+"""
+Prompt assembly with byte-identical static prefixes.
+
+OpenAI caches the longest previously seen prefix of a request (instructions,
+tool definitions, then the input), which cuts input-token latency and cost
+once the prefix is at least 1024 tokens. A prefix only matches if it is
+byte-identical, so everything that varies must come last:
+
+1. agent instructions, normalized here so indentation and trailing
+   whitespace of the source code never reach the model,
+2. the static format rules of the prompt template,
+3. the variable part: the user's task (and, for a synthesis turn, the step
+   results), always at the end.
+
+Every template and set of agent instructions has a version hash. The
+versions are logged, exported on /metrics and reported by the startup
+report, so a drop in cached tokens can be matched to a prompt change.
+"""
+
+import logging
+import textwrap
+import threading
+from typing import Dict
+
+from custom_agents.agent_cache import hash_text
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+_versions: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def normalize(text: str) -> str:
+    """Return text dedented, without trailing whitespace and surrounding blank lines."""
+    lines = textwrap.dedent(text).strip().splitlines()
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def register(name: str, text: str) -> str:
+    """Record the version hash of a prompt or instructions text and return the hash."""
+    version = hash_text(text)
+    with _lock:
+        previous = _versions.get(name)
+        _versions[name] = version
+    if previous != version:
+        logger.info(f"Prompt '{name}' version {version} ({len(text)} characters)")
+        metrics.record_prompt_version(name, version)
+    return version
+
+
+def instructions(name: str, text: str) -> str:
+    """Normalize the instructions of an agent and register their version."""
+    text = normalize(text)
+    register(f"instructions:{name}", text)
+    return text
+
+
+def versions() -> Dict[str, str]:
+    """Return the version hashes of all prompts and instructions registered in this process."""
+    with _lock:
+        return dict(_versions)
+
+
+class PromptTemplate:
+    """A prompt of a static prefix followed by a variable part."""
+
+    def __init__(self, name: str, prefix: str, variable: str):
+        """
+        Args:
+            name: The template name, for version reports
+            prefix: The static part, sent first and identical for every request
+            variable: A format string with the variable part, appended after the prefix
+        """
+        self.name = name
+        self.prefix = normalize(prefix)
+        self.variable = normalize(variable)
+        self.version = register(f"prompt:{name}", f"{self.prefix}\n\n{self.variable}")
+
+    def render(self, **values: str) -> str:
+        """Return the prompt with the given values in the variable part."""
+        return f"{self.prefix}\n\n{self.variable.format(**values)}"
+
+
+PLANNER_PROMPT = PromptTemplate(
+    "planner",
+    prefix="""
+    Answer the task at the end of this message. First create a clear plan to address it,
+    then provide a comprehensive response.
+
+    Your answer has four fields:
+
+    1. "plan"
+    A concise list of the steps you'll take to answer this question, one short sentence each.
+    If the task involves any calculations, explicitly mention that you'll use the calculator tool.
+
+    2. "response"
+    Your complete, well-structured answer to the question in Markdown. Include all relevant information
+    and supporting details here. Make this field comprehensive and directly useful to the user.
+
+    3. "citations"
+    The title and URL of every source the response is based on.
+
+    4. "calculations"
+    Every calculation you did with the calculator tools, with its result.
+
+    Important instructions:
+    - For ANY mathematical calculations, use the 'calculate' tool rather than doing the math yourself.
+    - When you have several calculations, or the same formula for several values, use 'calculate_batch' to do them in one call.
+    - When using the calculator tool, show both the expression you're calculating and the result in the response.
+    - Do not include "Execution" steps or numbered execution points in your response.
+    - Do not repeat the plan or list the sources in the response; they have their own fields.
+    """,
+    variable="Task: {user_input}",
+)
+
+QUICK_PROMPT = PromptTemplate(
+    "quick",
+    prefix="""
+    Answer the question at the end of this message.
+
+    Your answer has four fields:
+
+    1. "plan"
+    One short step saying how you answer the question.
+
+    2. "response"
+    The answer itself in Markdown: clear, accurate and concise.
+
+    3. "citations" and 4. "calculations"
+    Leave these empty unless you name a specific source or calculation.
+    """,
+    variable="Question: {user_input}",
+)
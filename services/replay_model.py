@@ -0,0 +1,265 @@
+"""
+Deterministic local model backend that replays recorded fixtures.
+
+Selected with MODEL_BACKEND=replay. Every agent's model is replaced by a
+ReplayModel that answers from a fixture file instead of the OpenAI API: each
+turn waits for its recorded latency, then returns the recorded tool calls or
+text with the recorded token usage. Tools run for real, so a replayed run
+exercises the Flask layer, agent_wrapper, the agents and the tools offline.
+
+Fixture files hold a list of scripts::
+
+    {
+      "queries": ["What is 25 * 4?", ...],
+      "scripts": [
+        {
+          "model": "o3-mini",
+          "match": "\\d+\\s*[*+/-]",
+          "turns": [
+            {"latency": 1.2, "tool_calls": [{"name": "calculate", "arguments": {"expression": "25 * 4"}}],
+             "usage": {"input_tokens": 900, "output_tokens": 40, "reasoning_tokens": 32}},
+            {"latency": 1.5, "text": "{\\"plan\\": [...], \\"response\\": \\"...\\", ...}"}
+          ]
+        }
+      ]
+    }
+
+A script is chosen by model name, a regular expression searched in the last
+user message and, optionally, one searched in the agent's instructions
+("instructions"); the turn is the number of tool-calling turns since that
+message, so earlier turns of a conversation don't count. The text of an agent
+with a structured output is recorded as JSON, as the API sends it.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from agents.items import ModelResponse
+from agents.models.interface import Model, ModelProvider
+from agents.usage import Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+    ResponseUsage,
+)
+from openai.types.responses.response_usage import InputTokensDetails, OutputTokensDetails
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Used when no script matches: answer in the expected format right away
+_FALLBACK_TURN = {"latency": 0.0, "text": "## Plan\n- Answer directly\n\n## Response\nNo recorded answer for this query."}
+_FALLBACK_STRUCTURED_TURN = {"latency": 0.0, "text": json.dumps({
+    "plan": ["Answer directly"], "response": "No recorded answer for this query.", "citations": [], "calculations": []
+})}
+
+_ids = itertools.count(1)
+
+
+def _field(item: Any, name: str) -> Any:
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+def _message_text(item: Any) -> str:
+    content = _field(item, "content")
+    if isinstance(content, str):
+        return content
+    return " ".join(str(_field(part, "text") or "") for part in content or [])
+
+
+def _input_details(cached_tokens: int) -> InputTokensDetails:
+    # Newer openai releases also require the number of tokens written to the cache
+    if "cache_write_tokens" in InputTokensDetails.model_fields:
+        return InputTokensDetails(cached_tokens=cached_tokens, cache_write_tokens=0)
+    return InputTokensDetails(cached_tokens=cached_tokens)
+
+
+class ReplayScript:
+    """The recorded turns of one model for the queries matching a pattern."""
+
+    def __init__(self, model: str, match: str, turns: List[Dict[str, Any]], instructions: str = ""):
+        self.model = model
+        self.pattern = re.compile(match, re.IGNORECASE | re.DOTALL)
+        self.instructions = re.compile(instructions, re.IGNORECASE | re.DOTALL)
+        self.turns = turns
+
+    def matches(self, model: str, text: str, instructions: str) -> bool:
+        return (self.model == model and self.pattern.search(text) is not None
+                and self.instructions.search(instructions) is not None)
+
+    def turn(self, index: int) -> Dict[str, Any]:
+        # Past the recording, repeat the final (text) turn
+        return self.turns[min(index, len(self.turns) - 1)] if self.turns else _FALLBACK_TURN
+
+
+class ReplayFixtures:
+    """Scripts and sample queries loaded from a fixture file."""
+
+    def __init__(self, scripts: List[ReplayScript], queries: Optional[List[str]] = None):
+        self.scripts = scripts
+        self.queries = queries or []
+
+    @classmethod
+    def load(cls, path: str) -> "ReplayFixtures":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        scripts = [
+            ReplayScript(s["model"], s.get("match", ""), s["turns"], s.get("instructions", ""))
+            for s in data["scripts"]
+        ]
+        return cls(scripts, data.get("queries"))
+
+    def find(self, model: str, text: str, instructions: str = "") -> Optional[ReplayScript]:
+        for script in self.scripts:
+            if script.matches(model, text, instructions):
+                return script
+        return None
+
+
+class ReplayModel(Model):
+    """A model answering from fixtures with recorded latency, tool calls and usage."""
+
+    def __init__(self, model_name: str, fixtures: ReplayFixtures, latency_scale: float = 1.0):
+        self.model_name = model_name
+        self.fixtures = fixtures
+        self.latency_scale = latency_scale
+
+    def _select_turn(self, system_instructions: Optional[str], input: Any, output_schema: Any = None) -> Dict[str, Any]:
+        items = [{"role": "user", "content": input}] if isinstance(input, str) else list(input)
+        # Earlier conversation turns come first; the newest user message is the one being answered
+        last_user = max((i for i, item in enumerate(items) if _field(item, "role") == "user"), default=None)
+        user_text = _message_text(items[last_user]) if last_user is not None else ""
+
+        # Each run of consecutive function calls since that message is one earlier tool-calling turn
+        turn_index = 0
+        previous_type = None
+        for item in items[last_user:]:
+            item_type = _field(item, "type")
+            if item_type == "function_call" and previous_type != "function_call":
+                turn_index += 1
+            previous_type = item_type
+
+        script = self.fixtures.find(self.model_name, user_text, system_instructions or "")
+        if script is None:
+            logger.warning(f"No replay script for model '{self.model_name}' matches: {user_text[:80]!r}")
+            structured = output_schema is not None and not output_schema.is_plain_text()
+            return _FALLBACK_STRUCTURED_TURN if structured else _FALLBACK_TURN
+        return script.turn(turn_index)
+
+    def _output(self, turn: Dict[str, Any]) -> List[Any]:
+        output = []
+        for call in turn.get("tool_calls", []):
+            call_id = f"call_replay_{next(_ids)}"
+            output.append(ResponseFunctionToolCall(
+                type="function_call", id=f"fc_{call_id}", call_id=call_id, name=call["name"],
+                arguments=json.dumps(call.get("arguments", {})), status="completed"
+            ))
+        if "text" in turn:
+            output.append(ResponseOutputMessage(
+                id=f"msg_replay_{next(_ids)}", type="message", role="assistant", status="completed",
+                content=[ResponseOutputText(type="output_text", text=turn["text"], annotations=[])]
+            ))
+        return output
+
+    @staticmethod
+    def _usage(turn: Dict[str, Any]) -> Dict[str, int]:
+        usage = turn.get("usage", {})
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "reasoning_tokens": usage.get("reasoning_tokens", 0),
+        }
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs,
+                           tracing, *, previous_response_id=None, conversation_id=None, prompt=None) -> ModelResponse:
+        turn = self._select_turn(system_instructions, input, output_schema)
+        await asyncio.sleep(turn.get("latency", 0.0) * self.latency_scale)
+
+        usage = self._usage(turn)
+        return ModelResponse(
+            output=self._output(turn),
+            usage=Usage(
+                requests=1,
+                input_tokens=usage["input_tokens"],
+                output_tokens=usage["output_tokens"],
+                total_tokens=usage["total_tokens"],
+                input_tokens_details=_input_details(usage["cached_tokens"]),
+                output_tokens_details=OutputTokensDetails(reasoning_tokens=usage["reasoning_tokens"]),
+            ),
+            response_id=f"resp_replay_{next(_ids)}",
+        )
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs,
+                              tracing, *, previous_response_id=None, conversation_id=None,
+                              prompt=None) -> AsyncIterator[Any]:
+        turn = self._select_turn(system_instructions, input, output_schema)
+        latency = turn.get("latency", 0.0) * self.latency_scale
+        output = self._output(turn)
+        sequence = itertools.count()
+
+        # Half the latency passes before the first token, the rest while streaming
+        await asyncio.sleep(latency / 2)
+        text = turn.get("text", "")
+        chunks = re.findall(r"\S+\s*|\s+", text)
+        message_id = output[-1].id if text else ""
+        for chunk in chunks:
+            await asyncio.sleep(latency / 2 / len(chunks))
+            yield ResponseTextDeltaEvent(
+                type="response.output_text.delta", content_index=0, delta=chunk, item_id=message_id,
+                logprobs=[], output_index=len(output) - 1, sequence_number=next(sequence)
+            )
+        if not chunks:
+            await asyncio.sleep(latency / 2)
+
+        usage = self._usage(turn)
+        yield ResponseCompletedEvent(
+            type="response.completed",
+            sequence_number=next(sequence),
+            response=Response(
+                id=f"resp_replay_{next(_ids)}", created_at=time.time(), model=self.model_name,
+                object="response", output=output, parallel_tool_calls=True, tool_choice="auto", tools=[],
+                usage=ResponseUsage(
+                    input_tokens=usage["input_tokens"],
+                    output_tokens=usage["output_tokens"],
+                    total_tokens=usage["total_tokens"],
+                    input_tokens_details=_input_details(usage["cached_tokens"]),
+                    output_tokens_details=OutputTokensDetails(reasoning_tokens=usage["reasoning_tokens"]),
+                ),
+            )
+        )
+
+
+class ReplayModelProvider(ModelProvider):
+    """Provides a ReplayModel for every model name."""
+
+    def __init__(self, fixtures: ReplayFixtures, latency_scale: float = 1.0):
+        self.fixtures = fixtures
+        self.latency_scale = latency_scale
+        self._models: Dict[str, ReplayModel] = {}
+
+    @classmethod
+    def from_config(cls) -> "ReplayModelProvider":
+        """Create a provider from REPLAY_FIXTURES and REPLAY_LATENCY_SCALE."""
+        return cls(ReplayFixtures.load(Config.REPLAY_FIXTURES), Config.REPLAY_LATENCY_SCALE)
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        name = model_name or "default"
+        if name not in self._models:
+            self._models[name] = ReplayModel(name, self.fixtures, self.latency_scale)
+        return self._models[name]
@@ -0,0 +1,207 @@
+"""
+Response cache for /ask.
+
+Answers are cached under the normalized user query plus a fingerprint of the
+agent graph (models, instructions, tools, prompt template), so changing any of
+those never serves a stale answer. Two backends are available: an in-process
+LRU, and SQLite, which all gunicorn workers on a host share.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Payload plus metadata ({"hits": ..., "age": ...}) of a cache hit
+CacheHit = Tuple[Dict[str, Any], Dict[str, Any]]
+
+
+def normalize_query(query: str) -> str:
+    """Normalize case, whitespace and trailing punctuation of a query."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+
+def make_key(query: str, fingerprint: str) -> str:
+    """Return the cache key for a query answered by a given agent graph."""
+    return hashlib.sha256(f"{fingerprint}\n{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+
+def bypass_requested(headers: Any) -> bool:
+    """Whether the request asked to skip the cache (X-Cache-Bypass or Cache-Control: no-cache)."""
+    if headers.get("X-Cache-Bypass", "").lower() in ("1", "true", "yes"):
+        return True
+    return "no-cache" in headers.get("Cache-Control", "").lower()
+
+
+class ResponseCache(ABC):
+    """Interface of response cache backends."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Args:
+            maxsize: Maximum number of entries; least recently used are evicted
+            ttl: Seconds an entry stays fresh
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CacheHit]:
+        """Return (payload, metadata) for a fresh entry, or None."""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, payload: Dict[str, Any]) -> None:
+        """Store a payload, evicting the least recently used entries if full."""
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all entries."""
+        pass
+
+    @abstractmethod
+    def size(self) -> int:
+        """Return the number of stored entries."""
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "size": self.size(),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process LRU cache; each worker has its own."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheHit]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry["created_at"] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            entry["hits"] += 1
+            self.hits += 1
+            return entry["payload"], {"hits": entry["hits"], "age": round(now - entry["created_at"], 3)}
+
+    def set(self, key: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = {"payload": payload, "created_at": time.time(), "hits": 0}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """File-backed cache shared by all worker processes on a host."""
+
+    def __init__(self, path: str, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and process; connections can't cross a fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, created_at REAL NOT NULL, "
+                "last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key: str) -> Optional[CacheHit]:
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            "UPDATE responses SET hits = hits + 1, last_access = ? WHERE key = ? AND created_at > ? "
+            "RETURNING payload, created_at, hits",
+            (now, key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        payload, created_at, hits = row
+        return json.loads(payload), {"hits": hits, "age": round(now - created_at, 3)}
+
+    def set(self, key: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO responses (key, payload, created_at, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+            (key, json.dumps(payload), now, now)
+        )
+        connection.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+        connection.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY last_access DESC LIMIT ?)",
+            (self.maxsize,)
+        )
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM responses")
+
+    def size(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Create the cache backend selected in Config, or None if caching is disabled."""
+    backend = Config.RESPONSE_CACHE_BACKEND
+    if backend == "memory":
+        return MemoryResponseCache(Config.RESPONSE_CACHE_SIZE, Config.RESPONSE_CACHE_TTL)
+    if backend == "sqlite":
+        return SQLiteResponseCache(Config.RESPONSE_CACHE_PATH, Config.RESPONSE_CACHE_SIZE, Config.RESPONSE_CACHE_TTL)
+    if backend != "none":
+        logger.warning(f"Unknown response cache backend '{backend}', caching disabled")
+    return None
+
+
+# The cache used by /ask in this process
+response_cache = create_response_cache()
@@ -0,0 +1,254 @@
+"""
+Routing of queries to the cheapest way of answering them.
+
+Most queries don't need the planner's reasoning model, web searches and
+Plan/Response prompt. Before a run is created, the router picks one of three
+routes:
+
+- "calculator": the query is a plain arithmetic expression ("what is 2+2?"),
+  evaluated directly with the calculator tool, without a model;
+- "fast": a short question with no sign of needing current facts,
+  calculations or several steps, answered in one turn of FAST_MODEL;
+- "planner": everything else, and every follow-up in a conversation.
+
+The decision is made by heuristics. If ROUTER_CLASSIFIER_MODEL is set, a
+small model confirms fast routes before they run; it can only move a query
+to the planner. Decisions are counted on /metrics (route_decisions) along
+with the duration and outcome of the runs of each route (route_run_seconds).
+"""
+
+import ast
+import logging
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import agent_wrapper
+from config import Config
+from custom_agents.answer import Calculation, PlannedAnswer
+from services import metrics
+from services.deadline import Deadline, RunCancelledError, RunProgress
+from tools.calc_engine import default_engine
+from tools.registry import get_tool
+
+logger = logging.getLogger(__name__)
+
+CALCULATOR = "calculator"
+FAST = "fast"
+PLANNER = "planner"
+
+# Phrases around an arithmetic expression: "what is 2+2?", "calculate sqrt(2)"
+_CALCULATION_PREFIX = re.compile(r"^\s*(what\s+is|what's|whats|calculate|compute|evaluate)\s*[:,]?\s*", re.IGNORECASE)
+_CALCULATION_SUFFIX = re.compile(r"\s*(=|\?|\.|!)*\s*$")
+_TIMES = re.compile(r"(?<=\d)\s*[x×]\s*(?=\d)")
+
+# Signs that a query needs current facts, calculations or several steps
+_LOOKUP_CUES = re.compile(
+    r"\b(who|when|where|latest|current(ly)?|today|tonight|yesterday|tomorrow|now|news|prices?|costs?|weather|"
+    r"scores?|population|search|look\s+up|sources?|cite|compare|comparison|recent(ly)?|"
+    r"how\s+(tall|high|long|far|old|many|much|big|large|fast))\b|\b(19|20)\d{2}\b",
+    re.IGNORECASE
+)
+_MATH_CUES = re.compile(
+    r"\d\s*(\*\*|[-+*/^%x×÷])\s*\d|\b(plus|minus|times|divided|percent(age)?|square\s+root|sqrt|sum|average|"
+    r"multiply|calculate|compute|convert)\b",
+    re.IGNORECASE
+)
+
+# Largest constant exponent evaluated without a model (bigger powers go to the planner)
+_MAX_EXPONENT = 1000
+_MAX_EXPRESSION_LENGTH = 200
+
+
+class RouteDecision:
+    """The route chosen for a query, and why."""
+
+    def __init__(self, route: str, reason: str, expression: Optional[str] = None):
+        self.route = route
+        self.reason = reason
+        # The arithmetic expression of a calculator route
+        self.expression = expression
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"route": self.route, "reason": self.reason}
+
+
+def arithmetic_expression(user_input: str) -> Optional[str]:
+    """Return the query as a calculator expression if it is nothing but arithmetic, else None."""
+    text = _CALCULATION_SUFFIX.sub("", _CALCULATION_PREFIX.sub("", user_input))
+    text = _TIMES.sub("*", text).replace("÷", "/")
+    if not text or len(text) > _MAX_EXPRESSION_LENGTH or not any(c.isdigit() for c in text):
+        return None
+    try:
+        default_engine.compile(text)
+        tree = ast.parse(default_engine.normalize(text), mode="eval")
+    except (SyntaxError, ValueError, NameError):
+        return None
+
+    # A bare number ("what is 1984?") is a question about the number, not a calculation
+    if not any(isinstance(node, (ast.BinOp, ast.Call)) for node in ast.walk(tree)):
+        return None
+    for node in ast.walk(tree):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exponent = node.right
+            if not isinstance(exponent, ast.Constant) or abs(exponent.value) > _MAX_EXPONENT:
+                return None
+    return text
+
+
+def route(user_input: str, has_history: bool = False) -> RouteDecision:
+    """
+    Choose the route of a query with heuristics.
+
+    Args:
+        user_input: The user's query
+        has_history: Whether the query continues a conversation; follow-ups
+            depend on earlier turns, so they go to the planner
+    """
+    expression = arithmetic_expression(user_input)
+    if expression is not None:
+        decision = RouteDecision(CALCULATOR, "arithmetic", expression)
+    elif has_history:
+        decision = RouteDecision(PLANNER, "conversation")
+    elif _MATH_CUES.search(user_input):
+        decision = RouteDecision(PLANNER, "calculation")
+    elif _LOOKUP_CUES.search(user_input):
+        decision = RouteDecision(PLANNER, "lookup")
+    elif len(user_input.split()) > Config.ROUTER_FAST_MAX_WORDS:
+        decision = RouteDecision(PLANNER, "long")
+    else:
+        decision = RouteDecision(FAST, "simple")
+
+    metrics.record_route(decision.route, decision.reason)
+    logger.debug("Routed query to %s (%s)", decision.route, decision.reason)
+    return decision
+
+
+class CalculationResult:
+    """The result of a calculator route, shaped like an SDK run result."""
+
+    def __init__(self, output: PlannedAnswer, items: List[Dict[str, Any]], failed: bool = False):
+        self.final_output = output
+        self.trace_id = None
+        self._items = items
+        # The calculator returned an error; like a failed SDK run, it is never cached or recorded
+        self.failed = failed
+
+    def to_input_list(self) -> List[Dict[str, Any]]:
+        return list(self._items)
+
+
+class DirectCalculationRun:
+    """A run that answers an arithmetic query with the calculator tool, without a model."""
+
+    def __init__(self, user_input: str, expression: str, deadline: Optional[Deadline] = None,
+                 history: Optional[List[Dict[str, Any]]] = None):
+        """
+        Args:
+            user_input: The user's query
+            expression: The expression found in the query
+            deadline: Optional request deadline (a calculation never gets near it)
+            history: Optional input items of earlier conversation turns
+        """
+        self.user_input = user_input
+        self.expression = expression
+        self.deadline = deadline
+        self.history = history or []
+        self.progress = RunProgress()
+        self.calculator = get_tool("calculate")
+
+    async def get_final_run_result(self) -> CalculationResult:
+        started = time.perf_counter()
+        result = await self.calculator.execute_async(self.expression)
+        seconds = time.perf_counter() - started
+        self.progress.tool_calls.append(self.calculator.name)
+        self.progress.add_phase("tool_call", seconds)
+        metrics.observe_phase("tool_call", seconds, self.calculator.name)
+
+        failed = result.startswith("Error")
+        output = PlannedAnswer(
+            plan=[f"Evaluate {self.expression} with the calculator"],
+            response=result if failed else f"{self.expression} = {result}",
+            citations=[],
+            calculations=[] if failed else [Calculation(expression=self.expression, result=result)]
+        )
+        items = self.history + [
+            {"role": "user", "content": self.user_input},
+            {"role": "assistant", "content": output.model_dump_json()},
+        ]
+        return CalculationResult(output, items, failed)
+
+    async def stream_events(self) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the calculation as the event dicts of agent_wrapper's runs."""
+        yield {"type": "tool_call", "name": self.calculator.name, "arguments": self.expression}
+        result = await self.get_final_run_result()
+        yield {"type": "delta", "text": result.final_output.model_dump_json()}
+        yield {"type": "final", "final_output": result.final_output, "trace_id": None,
+               "items": result.to_input_list(), "failed": result.failed}
+
+
+class ClassifiedRun:
+    """
+    A fast-route run that first asks the route classifier to confirm the route.
+
+    If the classifier chooses the planner (or fails), the planner answers instead.
+    """
+
+    def __init__(self, classifier: Any, user_input: str, create_run: Callable[[str], Any],
+                 deadline: Optional[Deadline] = None):
+        """
+        Args:
+            classifier: The built route classifier agent
+            user_input: The user's query
+            create_run: Creates the run of a route ("fast" or "planner")
+            deadline: Optional request deadline covering classification and the run
+        """
+        self.classifier = classifier
+        self.user_input = user_input
+        self.create_run = create_run
+        self.deadline = deadline
+        self.route = FAST
+        self.progress = RunProgress()
+        self.run = None
+
+    @property
+    def context(self) -> str:
+        return getattr(self.run, 'context', "")
+
+    async def _classify(self) -> Any:
+        started = time.perf_counter()
+        run = agent_wrapper.create_run(self.classifier, [{"role": "user", "content": self.user_input}],
+                                       deadline=self.deadline)
+        try:
+            result = await run.get_final_run_result()
+            choice = getattr(getattr(result, 'final_output', None), 'route', PLANNER)
+        except RunCancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Route classification failed, using the planner: {str(e)}")
+            choice = PLANNER
+        self.progress.merge(run.progress)
+        metrics.observe_phase("route", time.perf_counter() - started, "classifier")
+
+        if choice != FAST:
+            self.route = PLANNER
+            metrics.record_route(PLANNER, "classifier")
+            logger.info("Route classifier moved the query to the planner")
+        self.run = self.create_run(self.route)
+        return self.run
+
+    async def get_final_run_result(self) -> Any:
+        run = await self._classify()
+        try:
+            return await run.get_final_run_result()
+        finally:
+            self.progress.merge(run.progress)
+
+    async def stream_events(self) -> AsyncIterator[Dict[str, Any]]:
+        run = await self._classify()
+        try:
+            async for event in run.stream_events():
+                yield event
+        finally:
+            self.progress.merge(run.progress)
+
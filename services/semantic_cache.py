@@ -0,0 +1,329 @@
+"""
+Semantic tier of the /ask response cache: paraphrased queries get the answer of a cached query.
+
+The exact-match cache (services.response_cache) only helps when a query
+normalizes to the same text. Behind it, SemanticCache embeds each answered
+query into a vector and keeps the vectors in a NumPy matrix; a query that
+missed the exact cache is embedded too, and the cached answer of the most
+similar query (cosine similarity) is served when:
+
+- the similarity is at least SEMANTIC_CACHE_THRESHOLD,
+- the answer is younger than SEMANTIC_CACHE_TTL seconds and was given by the
+  same agent graph (fingerprint),
+- both queries contain the same numbers ("25 * 4" is not "25 * 5", however
+  similar the text),
+- both queries have the same content words in the same order
+  (SEMANTIC_CACHE_MATCH_TERMS), and
+- neither query asks for something time-sensitive (SEMANTIC_CACHE_VOLATILE,
+  e.g. "today" or "latest").
+
+Embedders are pluggable (SEMANTIC_CACHE_EMBEDDER). The default, HashingEmbedder,
+hashes word and character n-grams into a fixed-size vector: it needs no
+model or network, and a lookup takes well under a millisecond. It cannot
+tell "inflation" from "deflation" or "Celsius to Fahrenheit" from the
+reverse, so with it the content-word check is what keeps wrong answers
+out, and the tier only catches rephrasings that differ in function words,
+case and punctuation. Turn the check off only with an embedder whose
+threshold was validated on real near-miss queries.
+
+The tier is off by default (SEMANTIC_CACHE). The index lives in each
+worker's memory. NumPy is optional; without it the semantic tier is disabled.
+"""
+
+import importlib
+import logging
+import re
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from services import metrics
+from services.response_cache import CacheHit, normalize_query
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the semantic cache is then disabled
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_WORDS = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_NUMBERS = re.compile(r"\d+(?:\.\d+)?")
+
+# Words that don't change what a query asks; dropped before hashing
+STOP_WORDS = frozenset("""
+a an the is are was were be been being am do does did of to in on at for by with about from as into and or but
+what what's whats which who whom whose how why when where can could would should will shall may might must
+i me my you your we our it its this that these those there here please tell explain describe give show
+""".split())
+
+
+def content_words(text: str) -> List[str]:
+    """Return the words of a normalized text without STOP_WORDS (all words if that leaves none)."""
+    words = _WORDS.findall(normalize_query(text))
+    return [word for word in words if word not in STOP_WORDS] or words
+
+
+class Embedder(ABC):
+    """Interface of query embedders."""
+
+    name = "base"
+    dimensions = 0
+
+    @abstractmethod
+    def embed(self, text: str) -> "np.ndarray":
+        """Return the L2-normalized float32 vector of a text (all zeros if it has no features)."""
+        pass
+
+
+class HashingEmbedder(Embedder):
+    """
+    Embeds texts by hashing their features into a fixed number of dimensions.
+
+    Features are the content words of the normalized text (STOP_WORDS
+    removed), their bigrams (weight 0.5) and the character trigrams of each
+    word (weight 1 per word), so rephrasings, reordered words, inflections
+    and typos keep most of the vector while a changed content word does not.
+    Each feature adds or subtracts its weight (by a second hash bit) in its
+    dimension, which keeps unrelated texts near zero similarity.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = Config.SEMANTIC_CACHE_DIMENSIONS):
+        self.dimensions = dimensions
+
+    @staticmethod
+    def features(text: str) -> List[Tuple[str, float]]:
+        """Return the (feature, weight) pairs of a text."""
+        content = content_words(text)
+        features = [(word, 1.0) for word in content]
+        features += [(f"{a} {b}", 0.5) for a, b in zip(content, content[1:])]
+        for word in content:
+            padded = f"<{word}>"
+            trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+            features += [(trigram, 1.0 / len(trigrams)) for trigram in trigrams]
+        return features
+
+    def embed(self, text: str) -> "np.ndarray":
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in self.features(text):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            vector[digest % self.dimensions] += weight if digest & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """
+    Unit vectors in a preallocated NumPy matrix, searched by cosine similarity.
+
+    Rows are added at the end and removed by moving the last row into the gap,
+    so the live rows are always ``matrix[:size]``. The matrix doubles when full,
+    up to ``maxsize`` rows. Not thread-safe; SemanticCache holds a lock around it.
+    """
+
+    def __init__(self, dimensions: int, maxsize: int):
+        self.maxsize = maxsize
+        self.matrix = np.zeros((min(64, maxsize), dimensions), dtype=np.float32)
+        self.entries: List[Dict[str, Any]] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.entries)
+
+    def add(self, vector: "np.ndarray", entry: Dict[str, Any]) -> None:
+        if self.size == len(self.matrix):
+            grown = np.zeros((min(len(self.matrix) * 2, self.maxsize), self.matrix.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix
+            self.matrix = grown
+        self.matrix[self.size] = vector
+        self.entries.append(entry)
+
+    def remove(self, index: int) -> None:
+        last = self.size - 1
+        if index != last:
+            self.matrix[index] = self.matrix[last]
+            self.entries[index] = self.entries[last]
+        self.entries.pop()
+
+    def search(self, vector: "np.ndarray", limit: int = 4) -> List[Tuple[int, float]]:
+        """Return up to ``limit`` (row, similarity) pairs, the most similar first."""
+        if not self.entries:
+            return []
+        scores = self.matrix[:self.size] @ vector
+        if self.size > limit:
+            rows = np.argpartition(scores, -limit)[-limit:]
+        else:
+            rows = np.arange(self.size)
+        rows = rows[np.argsort(scores[rows])[::-1]]
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def memory_bytes(self) -> int:
+        return self.matrix.nbytes
+
+
+def create_embedder(spec: str = Config.SEMANTIC_CACHE_EMBEDDER) -> Embedder:
+    """Create the embedder named in Config: "hashing", or "module:Class" for a custom one."""
+    if spec == "hashing":
+        return HashingEmbedder()
+    module, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module), attribute)()
+
+
+class SemanticCache:
+    """Answers of earlier queries, found by the similarity of the query (see the module docstring)."""
+
+    def __init__(self, embedder: Embedder, threshold: float, ttl: float, maxsize: int,
+                 volatile: str = Config.SEMANTIC_CACHE_VOLATILE, match_terms: bool = Config.SEMANTIC_CACHE_MATCH_TERMS):
+        """
+        Args:
+            embedder: Embeds queries into unit vectors
+            threshold: Minimum cosine similarity for a hit
+            ttl: Seconds an answer can be served
+            maxsize: Maximum number of answers kept; the least recently used are evicted
+            volatile: Regular expression of time-sensitive queries, never served or stored
+            match_terms: Only serve answers of queries with the same content words in the same order
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.volatile = re.compile(volatile, re.IGNORECASE) if volatile else None
+        self.match_terms = match_terms
+        # One index per agent graph; answers of an earlier graph are dropped
+        self._fingerprint: Optional[str] = None
+        self._index: Optional[VectorIndex] = None
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.skipped = 0
+        self.lookup_seconds = 0.0
+
+    def cacheable(self, query: str) -> bool:
+        """Whether a query may be answered from, and stored in, the semantic cache."""
+        return not (self.volatile and self.volatile.search(query))
+
+    @staticmethod
+    def numbers(query: str) -> Tuple[str, ...]:
+        return tuple(sorted(_NUMBERS.findall(query)))
+
+    def _same_question(self, entry: Dict[str, Any], numbers: Tuple[str, ...], terms: Tuple[str, ...]) -> bool:
+        # Similar vectors are not enough: swapped or substituted words change the question
+        return entry["numbers"] == numbers and (not self.match_terms or entry["terms"] == terms)
+
+    def get(self, query: str, fingerprint: str) -> Optional[Tuple[CacheHit, float]]:
+        """
+        Return the answer of the most similar fresh query, with its similarity.
+
+        Returns:
+            ((payload, metadata), similarity), where the metadata has "hits",
+            "age" and the "matched_query"; or None
+        """
+        if not self.cacheable(query):
+            self.skipped += 1
+            return None
+        started = time.perf_counter()
+        vector = self.embedder.embed(query)
+        numbers = self.numbers(query)
+        terms = tuple(content_words(query))
+        now = time.time()
+
+        best = 0.0
+        found = None
+        with self._lock:
+            self.lookups += 1
+            if self._index is not None and self._fingerprint == fingerprint:
+                for row, similarity in self._index.search(vector):
+                    best = max(best, similarity)
+                    if similarity < self.threshold:
+                        break
+                    entry = self._index.entries[row]
+                    if now - entry["created_at"] > self.ttl:
+                        self._index.remove(row)
+                        break  # Rows moved; the next lookup finds the others
+                    if self._same_question(entry, numbers, terms):
+                        entry["hits"] += 1
+                        entry["last_access"] = now
+                        self.hits += 1
+                        found = (entry["payload"], {"hits": entry["hits"], "age": round(now - entry["created_at"], 3),
+                                                    "matched_query": entry["query"]})
+                        break
+
+        seconds = time.perf_counter() - started
+        self.lookup_seconds += seconds
+        metrics.observe_semantic_lookup("hit" if found else "miss", best, seconds)
+        return (found, best) if found else None
+
+    def set(self, query: str, fingerprint: str, payload: Dict[str, Any]) -> None:
+        """Store the answer of a query."""
+        if not self.cacheable(query) or self.maxsize <= 0:
+            return
+        vector = self.embedder.embed(query)
+        if not vector.any():
+            return
+        now = time.time()
+        # A copy: callers add per-request fields (conversation_id) to the payload they return
+        entry = {"query": query, "numbers": self.numbers(query), "terms": tuple(content_words(query)),
+                 "payload": dict(payload),
+                 "created_at": now, "last_access": now, "hits": 0}
+        with self._lock:
+            if self._index is None or self._fingerprint != fingerprint:
+                self._index = VectorIndex(self.embedder.dimensions, self.maxsize)
+                self._fingerprint = fingerprint
+            # A paraphrase close enough to be served replaces the older answer
+            for row, similarity in self._index.search(vector, limit=1):
+                if similarity >= self.threshold and self._same_question(
+                        self._index.entries[row], entry["numbers"], entry["terms"]):
+                    self._index.remove(row)
+            if self._index.size >= self.maxsize:
+                self._index.remove(min(range(self._index.size), key=lambda row: self._index.entries[row]["last_access"]))
+            self._index.add(vector, entry)
+
+    def clear(self) -> None:
+        """Remove all answers."""
+        with self._lock:
+            self._index = None
+            self._fingerprint = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the size, memory use and lookup counters of the cache."""
+        index = self._index
+        return {
+            "embedder": self.embedder.name,
+            "size": index.size if index is not None else 0,
+            "memory_bytes": index.memory_bytes() if index is not None else 0,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "skipped": self.skipped,
+            "lookup_seconds": round(self.lookup_seconds, 6),
+        }
+
+
+def create_semantic_cache() -> Optional[SemanticCache]:
+    """Create the semantic cache configured in Config, or None if it is disabled."""
+    if not Config.SEMANTIC_CACHE:
+        return None
+    if np is None:
+        logger.warning("NumPy is not installed, the semantic response cache is disabled")
+        return None
+    try:
+        embedder = create_embedder()
+    except Exception as e:
+        logger.warning(f"Could not create the embedder '{Config.SEMANTIC_CACHE_EMBEDDER}', "
+                       f"the semantic response cache is disabled: {str(e)}")
+        return None
+    return SemanticCache(embedder, Config.SEMANTIC_CACHE_THRESHOLD, Config.SEMANTIC_CACHE_TTL,
+                         Config.SEMANTIC_CACHE_SIZE)
+
+
+# The semantic tier used by /ask in this process
+semantic_cache = create_semantic_cache()
+
+
+def stats() -> Dict[str, Any]:
+    """Return the semantic cache counters of this process."""
+    return semantic_cache.stats() if semantic_cache is not None else {}
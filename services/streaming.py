@@ -0,0 +1,316 @@
+"""
+Helpers for streaming agent runs to the browser as Server-Sent Events.
+
+Answers are PlannedAnswer objects (plan steps, response, citations,
+calculations). Streamed, their JSON is parsed incrementally by
+AnswerStreamer, so the plan is shown as soon as it is complete and the
+response while it is written. Agents without structured output answer in
+"## Plan" / "## Response" text, which is split instead.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from custom_agents.answer import PlannedAnswer
+
+PLAN_MARKER = "## Plan"
+RESPONSE_MARKER = "## Response"
+
+# Plan shown when the model did not follow the Plan/Response format
+FALLBACK_PLAN = "The agent will search for information about your query and provide a comprehensive response with citations."
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Format a single Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def split_plan_response(text: str) -> Tuple[str, str]:
+    """
+    Split a complete agent output into its plan and response sections.
+    
+    Args:
+        text: The final output of the agent
+        
+    Returns:
+        A (plan, response) tuple; the plan falls back to a generic
+        description when the output does not follow the expected format
+    """
+    if PLAN_MARKER in text and RESPONSE_MARKER in text:
+        plan_section, response = text.split(RESPONSE_MARKER, 1)
+        return plan_section.replace(PLAN_MARKER, "").strip(), response.strip()
+    return FALLBACK_PLAN, text
+
+
+def structured_answer(output: Any) -> PlannedAnswer:
+    """
+    Return the final output of a run as a PlannedAnswer.
+
+    Structured outputs were decoded by the SDK and are returned as they are.
+    Text (from an agent without structured output, or the error of a failed
+    run) is split into its plan and response sections.
+    """
+    if isinstance(output, PlannedAnswer):
+        return output
+    plan, response = split_plan_response(str(output))
+    steps = [line.strip().lstrip("-*").strip() for line in plan.splitlines() if line.strip()]
+    return PlannedAnswer(plan=steps, response=response, citations=[], calculations=[])
+
+
+class PlanResponseSplitter:
+    """
+    Incrementally split streamed output text into plan and response events.
+    
+    Text is buffered until the response marker arrives, at which point the
+    completed plan is emitted once; everything after the marker is passed
+    through as response deltas.
+    """
+    
+    def __init__(self):
+        self._buffer = ""
+        self._in_response = False
+        self._response_started = False
+    
+    def feed(self, delta: str) -> List[Tuple[str, str]]:
+        """
+        Consume a text delta.
+        
+        Args:
+            delta: The next chunk of output text
+            
+        Returns:
+            A list of (event, text) pairs, where event is "plan" or "response"
+        """
+        if self._in_response:
+            return self._response(delta)
+        
+        self._buffer += delta
+        index = self._buffer.find(RESPONSE_MARKER)
+        if index == -1:
+            return []
+        
+        plan = self._buffer[:index].replace(PLAN_MARKER, "").strip()
+        rest = self._buffer[index + len(RESPONSE_MARKER):]
+        self._buffer = ""
+        self._in_response = True
+        return [("plan", plan)] + self._response(rest)
+    
+    def finish(self) -> List[Tuple[str, str]]:
+        """Flush buffered text once the output is complete."""
+        if self._in_response:
+            return []
+        # The response marker never arrived: mirror the non-streaming fallback
+        events = [("plan", FALLBACK_PLAN)] + self._response(self._buffer)
+        self._buffer = ""
+        self._in_response = True
+        return events
+    
+    def _response(self, text: str) -> List[Tuple[str, str]]:
+        if not self._response_started:
+            text = text.lstrip()
+            if not text:
+                return []
+            self._response_started = True
+        return [("response", text)] if text else []
+
+
+class AnswerStreamer:
+    """
+    Incrementally parse a streamed PlannedAnswer into events per field.
+
+    The JSON text is scanned once as it arrives. "plan" is emitted when the
+    plan list is complete, "response" deltas as the response string grows,
+    and "citations" and "calculations" when each list is complete; every
+    field is decoded once, from its own slice of the text. Output that is not
+    a JSON object is passed to a PlanResponseSplitter instead.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._mode: Optional[str] = None  # "json" or "text" once the first character arrived
+        self._text = PlanResponseSplitter()
+        self._state = "object"
+        self._key: Optional[str] = None
+        self._start = 0  # Start of the value being scanned; for the response, of the text not yet emitted
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, delta: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Consume a text delta.
+
+        Args:
+            delta: The next chunk of output text
+
+        Returns:
+            A list of (event, data) pairs, where event is "plan", "response",
+            "citations" or "calculations"
+        """
+        if self._mode is None:
+            self._buffer += delta
+            text = self._buffer.lstrip()
+            if not text:
+                return []
+            self._mode = "json" if text.startswith("{") else "text"
+            if self._mode == "text":
+                self._buffer = ""
+                return self._text_events(self._text.feed(text))
+            self._buffer = text
+            return self._parse()
+        if self._mode == "text":
+            return self._text_events(self._text.feed(delta))
+        self._buffer += delta
+        return self._parse()
+
+    def finish(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Flush buffered text once the output is complete."""
+        if self._mode == "json":
+            return []
+        # Text output (or none at all) ends like the non-streaming fallback
+        return self._text_events(self._text.finish())
+
+    @staticmethod
+    def _text_events(events: List[Tuple[str, str]]) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(name, {"text": text}) for name, text in events]
+
+    def _field(self, key: str, value: Any) -> List[Tuple[str, Dict[str, Any]]]:
+        if key == "plan" and isinstance(value, list):
+            return [("plan", {"text": "\n".join(f"- {step}" for step in value), "steps": value})]
+        if key in ("citations", "calculations") and isinstance(value, list):
+            return [(key, {key: value})]
+        if key == "response" and isinstance(value, str) and value:
+            return [("response", {"text": value})]
+        return []
+
+    def _parse(self) -> List[Tuple[str, Dict[str, Any]]]:
+        events: List[Tuple[str, Dict[str, Any]]] = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._state == "object":
+                self._state = "key" if char == "{" else self._state
+                self._pos += 1
+            elif self._state == "key":
+                if char == "}":
+                    self._state = "done"
+                elif char == '"':
+                    end = self._string_end(self._pos + 1)
+                    if end is None:
+                        break
+                    self._key = json.loads(buffer[self._pos:end])
+                    self._pos = end
+                    self._state = "colon"
+                    continue
+                self._pos += 1
+            elif self._state == "colon":
+                if char == ":":
+                    self._state = "value"
+                self._pos += 1
+            elif self._state == "value":
+                if char.isspace():
+                    self._pos += 1
+                elif self._key == "response" and char == '"':
+                    self._pos += 1
+                    self._start = self._pos
+                    self._state = "response"
+                else:
+                    self._start = self._pos
+                    self._depth = 0
+                    self._in_string = False
+                    self._escape = False
+                    self._state = "scan"
+            elif self._state == "response":
+                if not self._scan_response(events):
+                    break
+            elif self._state == "scan":
+                end = self._scan_value()
+                if end is None:
+                    break
+                events.extend(self._field(self._key, json.loads(buffer[self._start:end])))
+                self._pos = end
+                self._state = "key"
+            else:
+                # Anything after the closing brace is ignored
+                self._pos = len(buffer)
+        return events
+
+    def _string_end(self, pos: int) -> Optional[int]:
+        """Return the index after the closing quote of a string whose content starts at pos, if it arrived."""
+        buffer = self._buffer
+        while pos < len(buffer):
+            if buffer[pos] == "\\":
+                pos += 2
+            elif buffer[pos] == '"':
+                return pos + 1
+            else:
+                pos += 1
+        return None
+
+    def _scan_response(self, events: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """Emit the response text decoded so far; return True once its closing quote was reached."""
+        buffer = self._buffer
+        pos = self._pos
+        closed = False
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                closed = True
+                break
+            if char != "\\":
+                pos += 1
+                continue
+            # Only decode complete escapes, including both halves of a surrogate pair
+            length = 6 if buffer[pos + 1:pos + 2] == "u" else 2
+            if pos + length > len(buffer):
+                break
+            if length == 6 and 0xD800 <= int(buffer[pos + 2:pos + 6], 16) <= 0xDBFF:
+                if pos + 12 > len(buffer):
+                    break
+                length = 12
+            pos += length
+
+        if pos > self._start:
+            text = json.loads(f'"{buffer[self._start:pos]}"')
+            events.extend(self._field("response", text))
+            self._start = pos
+        self._pos = pos + 1 if closed else pos
+        if closed:
+            self._state = "key"
+        return closed
+
+    def _scan_value(self) -> Optional[int]:
+        """Return the index after the value starting at self._start once it arrived, else None."""
+        buffer = self._buffer
+        if buffer[self._start] not in '"[{':
+            # A number, true, false or null ends at the next delimiter
+            for pos in range(self._pos, len(buffer)):
+                if buffer[pos] in ",}" or buffer[pos].isspace():
+                    return pos
+            self._pos = len(buffer)
+            return None
+
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 0:
+                        return pos
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    return pos
+        self._pos = pos
+        return None
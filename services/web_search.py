@@ -0,0 +1,253 @@
+"""
+Web search with a result cache and request coalescing.
+
+The planner searches through a function tool that takes a query and returns
+text, instead of handing the whole conversation over to the Web Search
+Assistant. Each search is then a plain query -> text call, so results are
+cached by normalized query for WEB_SEARCH_CACHE_TTL seconds, and concurrent
+identical searches share one in-flight backend call.
+"""
+
+import asyncio
+import json
+import logging
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from config import Config
+from services import metrics
+from services.deadline import remaining_budget
+from services.response_cache import MemoryResponseCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Documents searched by the local backend when no corpus file is configured
+DEFAULT_CORPUS = [
+    {
+        "title": "Eiffel Tower",
+        "url": "https://en.wikipedia.org/wiki/Eiffel_Tower",
+        "text": "The Eiffel Tower was designed by Gustave Eiffel and his team of engineers. "
+                "Construction began in 1887 and was completed in 1889.",
+    },
+]
+
+
+class SearchBackend(ABC):
+    """Interface of web search backends."""
+
+    name = "base"
+
+    @abstractmethod
+    async def search(self, query: str) -> str:
+        """Search for a query and return the findings as text."""
+        pass
+
+
+class AgentSearchBackend(SearchBackend):
+    """Runs the Web Search Assistant (gpt-4o-mini with hosted web search) for a query."""
+
+    name = "agent"
+
+    def __init__(self):
+        self._definition = None
+
+    async def search(self, query: str) -> str:
+        import agent_wrapper
+        from custom_agents.web_search_agent import WebSearchAgent
+
+        if self._definition is None:
+            self._definition = WebSearchAgent()
+        agent = self._definition.build(
+            agent_factory=agent_wrapper.Agent,
+            function_tool_factory=agent_wrapper.function_tool,
+            model_settings_factory=agent_wrapper.get_model_settings
+        )
+
+        run = agent_wrapper.create_run(agent, [{"role": "user", "content": query}])
+        result = await run.get_final_run_result()
+        if getattr(result, 'failed', False):
+            # Raise so the failure is reported to the planner and never cached
+            raise RuntimeError(result.final_output)
+        return str(result.final_output)
+
+
+class LocalSearchBackend(SearchBackend):
+    """
+    Searches a local document corpus; needs no network access.
+
+    Documents are dicts with "title", "url" and "text", ranked by how many
+    query words they contain.
+    """
+
+    name = "local"
+
+    def __init__(self, documents: Optional[List[Dict[str, str]]] = None):
+        """
+        Args:
+            documents: The corpus; defaults to WEB_SEARCH_CORPUS, or DEFAULT_CORPUS
+        """
+        if documents is None:
+            documents = self.load_corpus(Config.WEB_SEARCH_CORPUS) if Config.WEB_SEARCH_CORPUS else DEFAULT_CORPUS
+        self.documents = documents
+        self.searches = 0
+
+    @staticmethod
+    def load_corpus(path: str) -> List[Dict[str, str]]:
+        """Load a corpus from a JSON file holding a list of documents."""
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _words(text: str) -> set:
+        return set(re.findall(r"\w+", text.lower()))
+
+    async def search(self, query: str) -> str:
+        self.searches += 1
+        words = self._words(query)
+        scored = []
+        for document in self.documents:
+            score = len(words & self._words(document["title"] + " " + document["text"]))
+            if score:
+                scored.append((score, document))
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        if not scored:
+            return f"No results found for: {query}"
+        results = [
+            f"{document['title']}\n{document['text']}\nSource: {document['url']}"
+            for _, document in scored[:Config.SEARCH_RESULT_COUNT]
+        ]
+        return f"Results for: {query}\n\n" + "\n\n".join(results)
+
+
+class WebSearchService:
+    """Caches search results and coalesces concurrent identical searches."""
+
+    def __init__(self, backend: SearchBackend, ttl: float, maxsize: int):
+        """
+        Args:
+            backend: The backend performing searches
+            ttl: Seconds a search result stays fresh
+            maxsize: Maximum number of cached results
+        """
+        self.backend = backend
+        self.cache = MemoryResponseCache(maxsize, ttl)
+        self.coalesced = 0
+        self.abandoned = 0
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        # Requests awaiting each in-flight search
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    async def search(self, query: str) -> str:
+        """
+        Return the results for a query, from the cache when fresh.
+
+        A search for a query that is already being searched waits for that
+        search instead of starting another one. A search is cancelled when
+        every request waiting for it was cancelled.
+        """
+        key = normalize_query(query)
+        hit = self.cache.get(key)
+        if hit is not None:
+            payload, metadata = hit
+            logger.debug("Web search cache hit for '%s' (age=%ss)", key, metadata['age'])
+            metrics.record_cache("web_search", "hit")
+            return payload["results"]
+
+        task = self._in_flight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            self.coalesced += 1
+            logger.debug("Web search for '%s' joined an in-flight search", key)
+            metrics.record_cache("web_search", "coalesced")
+        else:
+            metrics.record_cache("web_search", "miss")
+            task = asyncio.ensure_future(self._search(key, query))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        # Shielded so a cancelled waiter doesn't cancel the search for the others
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._leave(key, task)
+
+    def _leave(self, key: str, task: asyncio.Task) -> None:
+        waiters = self._waiters.pop(task) - 1
+        if waiters:
+            self._waiters[task] = waiters
+        elif not task.done():
+            # The last waiter was cancelled: nobody needs the results anymore
+            self.abandoned += 1
+            logger.debug("Web search for '%s' cancelled, no request is waiting for it", key)
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+            task.cancel()
+
+    async def _search(self, key: str, query: str) -> str:
+        logger.debug("Web search (%s) for: %s", self.backend.name, query)
+        async with asyncio.timeout(remaining_budget(Config.SEARCH_TIMEOUT)):
+            results = await self.backend.search(query)
+        self.cache.set(key, {"results": results})
+        return results
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Retrieve the exception so a search nobody awaits anymore isn't logged as unhandled
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache and coalescing counters."""
+        return {
+            "backend": self.backend.name,
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._in_flight),
+            "size": self.cache.size(),
+            "ttl": self.cache.ttl,
+        }
+
+
+BACKENDS = {
+    AgentSearchBackend.name: AgentSearchBackend,
+    LocalSearchBackend.name: LocalSearchBackend,
+}
+
+_service: Optional[WebSearchService] = None
+
+
+def create_search_backend(name: str) -> SearchBackend:
+    """Create a search backend by name ("agent" or "local")."""
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown web search backend '{name}'") from None
+
+
+def get_search_service() -> WebSearchService:
+    """Return this process's search service, created from Config on first use."""
+    global _service
+    if _service is None:
+        _service = WebSearchService(
+            create_search_backend(Config.WEB_SEARCH_BACKEND),
+            ttl=Config.WEB_SEARCH_CACHE_TTL,
+            maxsize=Config.WEB_SEARCH_CACHE_SIZE
+        )
+    return _service
+
+
+def set_search_backend(backend: SearchBackend) -> WebSearchService:
+    """Replace the search service with a fresh one using the given backend (e.g. for offline tests)."""
+    global _service
+    _service = WebSearchService(backend, ttl=Config.WEB_SEARCH_CACHE_TTL, maxsize=Config.WEB_SEARCH_CACHE_SIZE)
+    return _service
+
+
+def search_stats() -> Dict[str, Any]:
+    """Return the search cache counters of this process."""
+    return get_search_service().stats()
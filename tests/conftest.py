@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# Offline settings, applied before Config is imported
+_state = tempfile.mkdtemp(prefix="agent-tests-")
+os.environ.setdefault("MODEL_BACKEND", "replay")
+os.environ.setdefault("OPENAI_API_KEY", "replay")
+os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+os.environ.setdefault("RESPONSE_CACHE_BACKEND", "memory")
+os.environ.setdefault("WEB_SEARCH_BACKEND", "local")
+os.environ.setdefault("TOOL_EXECUTOR", "inline")
+os.environ.setdefault("CONVERSATIONS_DATABASE_URL", f"sqlite:///{os.path.join(_state, 'conversations.sqlite3')}")
+os.environ.setdefault("JOBS_DATABASE_URL", f"sqlite:///{os.path.join(_state, 'jobs.sqlite3')}")
@@ -0,0 +1,53 @@
+import uuid
+
+import pytest
+
+from services.admission import AdmissionRejected, RateLimiter, client_identity
+
+
+def test_rotating_unknown_api_keys_are_throttled():
+    limiter = RateLimiter(per_minute=1, burst=2)
+    with pytest.raises(AdmissionRejected) as rejected:
+        for _ in range(3):
+            headers = {"X-API-Key": uuid.uuid4().hex}
+            limiter.check(*client_identity(headers, {}, "203.0.113.7", api_keys={"known"}))
+    assert rejected.value.status == 429
+
+
+def test_rotating_bearer_tokens_share_the_address_budget():
+    first = client_identity({"Authorization": "Bearer a"}, None, "203.0.113.7", api_keys=set())
+    second = client_identity({"Authorization": "Bearer b"}, None, "203.0.113.7", api_keys=set())
+    assert first == second == ("ip:203.0.113.7",)
+
+
+def test_configured_api_key_identifies_the_client():
+    identity = client_identity({"X-API-Key": "known"}, None, "203.0.113.7", api_keys={"known"})
+    assert len(identity) == 1 and identity[0].startswith("key:")
+    assert identity != client_identity({"X-API-Key": "known"}, None, "198.51.100.2", api_keys={"other"})
+
+
+def test_dropping_the_session_cookie_does_not_reset_the_limit():
+    limiter = RateLimiter(per_minute=20, burst=5)
+    admitted = 0
+    with pytest.raises(AdmissionRejected):
+        for _ in range(30):
+            # A new cookieless request, then requests in the session it was given
+            session = {}
+            for _ in range(6):
+                limiter.check(*client_identity({}, session, "203.0.113.7", api_keys=set()))
+                admitted += 1
+    assert admitted == 5
+
+
+def test_sessions_are_limited_separately_within_the_address_limit():
+    limiter = RateLimiter(per_minute=20, burst=3)
+    first, second = {"client_id": "a"}, {"client_id": "b"}
+    for _ in range(2):
+        limiter.check(*client_identity({}, first, "203.0.113.7", api_keys=set()))
+    limiter.check(*client_identity({}, second, "198.51.100.2", api_keys=set()))
+    limiter.check(*client_identity({}, first, "203.0.113.7", api_keys=set()))
+    with pytest.raises(AdmissionRejected):
+        limiter.check(*client_identity({}, first, "198.51.100.2", api_keys=set()))
+    # The rejected run took nothing from the address's budget
+    for _ in range(2):
+        limiter.check(*client_identity({}, second, "198.51.100.2", api_keys=set()))
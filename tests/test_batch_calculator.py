@@ -0,0 +1,20 @@
+from tools.batch_calculator import BatchCalculatorTool
+
+
+def results(payload):
+    return [item.get("result", item.get("error")) for item in payload["results"]]
+
+
+def test_large_integers_match_the_calculator():
+    tool = BatchCalculatorTool()
+    payload = tool.evaluate(expression="x + 1", variables=[{"name": "x", "values": [2 ** 60, 3]}])
+    assert results(payload) == [str(2 ** 60 + 1), "4"]
+    payload = tool.evaluate(expression="x ^ 3", variables=[{"name": "x", "values": [300000, 2]}])
+    assert results(payload) == [str(300000 ** 3), "8"]
+
+
+def test_malformed_variables_are_reported():
+    tool = BatchCalculatorTool()
+    for variables in ({"name": "x", "values": [1]}, ["x"], [{"name": "x", "values": "12"}],
+                      [{"name": "x", "values": ["a"]}]):
+        assert "error" in tool.evaluate(expression="x + 1", variables=variables)
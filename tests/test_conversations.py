@@ -0,0 +1,31 @@
+from services import conversations
+from services.conversations import ConversationStore
+
+
+def test_concurrent_turns_are_both_kept(tmp_path, monkeypatch):
+    store = ConversationStore(f"sqlite:///{tmp_path / 'conversations.sqlite3'}", ttl=3600, budget=100000, keep_turns=2)
+    monkeypatch.setattr(conversations, "store", store)
+    monkeypatch.setattr(conversations.Config, "ENABLE_CONVERSATIONS", True)
+
+    first = conversations.start_turn("What is the capital of France?", new=True)
+    conversations.record_turn(first, first.answered("Paris"))
+
+    # Both follow-ups read the history before either is saved
+    second = conversations.start_turn("And of Italy?", first.conversation_id)
+    third = conversations.start_turn("And of Spain?", first.conversation_id)
+    conversations.record_turn(second, second.answered("Rome"))
+    conversations.record_turn(third, third.answered("Madrid"))
+
+    history, turns = store.load(first.conversation_id)
+    assert turns == 3
+    assert [item["content"] for item in history] == [
+        "What is the capital of France?", "Paris", "And of Italy?", "Rome", "And of Spain?", "Madrid",
+    ]
+
+
+def test_save_refuses_a_stale_history(tmp_path):
+    store = ConversationStore(f"sqlite:///{tmp_path / 'conversations.sqlite3'}", ttl=3600, budget=100000, keep_turns=2)
+    assert store.save("c1", [{"role": "user", "content": "hi"}], 0) is not None
+    assert store.save("c1", [{"role": "user", "content": "hello"}], 0) is None
+    assert store.save("c1", [{"role": "user", "content": "hi"}, {"role": "user", "content": "again"}], 1) is not None
+    assert store.save("c1", [], 1) is None
@@ -0,0 +1,55 @@
+import asyncio
+import sqlite3
+
+from services import agent_runtime, jobs
+from services.admission import AdmissionRejected
+from services.jobs import FAILED, QUEUED, JobStore, JobWorkerPool
+
+
+def _not_admitted(*args, **kwargs):
+    raise AdmissionRejected(503, "queue_full", 2, "The server is busy")
+
+
+def test_a_job_not_admitted_backs_off_and_fails_after_the_limit(tmp_path, monkeypatch):
+    store = JobStore(f"sqlite:///{tmp_path / 'jobs.sqlite3'}")
+    pool = JobWorkerPool(store, concurrency=1, poll_interval=1, lease=30)
+    monkeypatch.setattr(jobs.Config, "JOB_MAX_DEFERRALS", 3)
+    monkeypatch.setattr(jobs.Config, "JOB_MAX_DEFERRAL_DELAY", 5)
+    monkeypatch.setattr(agent_runtime, "cached_answer", lambda cache_key: None)
+    monkeypatch.setattr(agent_runtime, "create_query_run", _not_admitted)
+    job_id = store.submit("What is the capital of France?")["id"]
+
+    delays = []
+    for _ in range(4):
+        # Deferred jobs are not claimable before their delay: make them due
+        with store.database.session() as session:
+            session.execute(jobs.update(jobs.Job).values(lease_expires_at=None))
+            session.commit()
+        job = store.claim(pool.owner, 30)
+        assert job is not None and job["id"] == job_id
+        asyncio.run(pool._run(job))
+        job = store.get(job_id)
+        if job["status"] == QUEUED:
+            with store.database.session() as session:
+                delays.append(round(session.get(jobs.Job, job_id).lease_expires_at - jobs.time.time()))
+
+    assert delays == [2, 4, 5]
+    assert job["status"] == FAILED
+    assert job["deferrals"] == 3
+    assert job["attempts"] == 1
+    assert pool.requeued == 3 and pool.failed == 1
+
+
+def test_new_columns_are_added_to_an_existing_jobs_table(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE jobs (id VARCHAR(32) PRIMARY KEY, query TEXT, status VARCHAR(16), attempts INTEGER, "
+            "owner VARCHAR(128), lease_expires_at FLOAT, result TEXT, error TEXT, progress TEXT, "
+            "created_at FLOAT, started_at FLOAT, finished_at FLOAT)"
+        )
+        connection.execute("INSERT INTO jobs (id, query, status, attempts, created_at) VALUES ('old', 'hi', 'queued', 0, 0)")
+
+    store = JobStore(f"sqlite:///{path}")
+    assert store.get("old")["deferrals"] == 0
+    assert store.claim("worker", 30)["id"] == "old"
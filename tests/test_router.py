@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from services import agent_runtime, response_cache, router
+from tools.calculator import CalculatorTool
+
+
+@pytest.mark.parametrize("query, expression", [
+    ("What is 2+2?", "2+2"),
+    ("calculate sqrt(16)", "sqrt(16)"),
+    ("what's 25 x 4", "25*4"),
+])
+def test_arithmetic_goes_to_the_calculator(query, expression):
+    decision = router.route(query)
+    assert decision.route == router.CALCULATOR
+    assert decision.expression == expression
+
+
+@pytest.mark.parametrize("query", ["What is 1984?", "what is 42", "What is 911?", "What is -5?"])
+def test_bare_number_is_not_arithmetic(query):
+    assert router.arithmetic_expression(query) is None
+    assert router.route(query).route != router.CALCULATOR
+
+
+class BusyCalculator:
+    name = "calculate"
+
+    async def execute_async(self, expression):
+        return CalculatorTool.BUSY
+
+
+def test_calculator_error_is_not_cached():
+    query = "What is 2+2?"
+    run = router.DirectCalculationRun(query, "2+2")
+    run.calculator = BusyCalculator()
+    key = agent_runtime.CacheKey(response_cache.make_key(query, "agents"), query, "agents")
+
+    payload = asyncio.run(agent_runtime.run_query(run, cache_key=key))
+
+    assert payload["failed"] is True
+    assert payload["response"] == CalculatorTool.BUSY
+    assert response_cache.response_cache.get(key.exact) is None
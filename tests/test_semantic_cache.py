@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from services.semantic_cache import HashingEmbedder, SemanticCache
+
+FINGERPRINT = "agents"
+
+# Different questions the hashing embedder scores as near-duplicates
+NEAR_MISSES = [
+    ("What causes inflation?", "What causes deflation?"),
+    ("Tell me about the fall of the Roman Empire", "Tell me about the fall of the Ottoman Empire"),
+    ("How do I convert Celsius to Fahrenheit?", "How do I convert Fahrenheit to Celsius?"),
+    ("How do I convert miles to km?", "How do I convert km to miles?"),
+    ("Is TCP faster than UDP?", "Is UDP faster than TCP?"),
+    ("Is green tea healthier than black tea?", "Is black tea healthier than green tea?"),
+]
+
+
+def make_cache(**kwargs):
+    return SemanticCache(HashingEmbedder(), threshold=0.75, ttl=3600, maxsize=100, volatile="", **kwargs)
+
+
+@pytest.mark.parametrize("stored, asked", NEAR_MISSES)
+def test_near_miss_is_not_served(stored, asked):
+    cache = make_cache()
+    cache.set(stored, FINGERPRINT, {"response": stored})
+    assert cache.get(asked, FINGERPRINT) is None
+
+
+def test_rephrasing_is_served():
+    cache = make_cache()
+    cache.set("What is the capital of France?", FINGERPRINT, {"response": "Paris"})
+    (payload, metadata), similarity = cache.get("what's the capital of france", FINGERPRINT)
+    assert payload == {"response": "Paris"}
+    assert metadata["matched_query"] == "What is the capital of France?"
+    assert similarity >= 0.75
+
+
+def test_different_numbers_are_not_served():
+    cache = make_cache(match_terms=False)
+    cache.set("What is 25 * 4?", FINGERPRINT, {"response": "100"})
+    assert cache.get("What is 25 * 5?", FINGERPRINT) is None
+
+
+def test_other_agent_graph_is_not_served():
+    cache = make_cache()
+    cache.set("What is the capital of France?", FINGERPRINT, {"response": "Paris"})
+    assert cache.get("What is the capital of France?", "other") is None
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+from tools.base_tool import BaseTool, TransientResult
+from tools.batch_calculator import BatchCalculatorTool
+from tools.calculator import CalculatorTool
+from tools.executor import ToolCrashedError, ToolTimeoutError
+from tools.middleware import MemoizeMiddleware, ToolPipeline
+from tools.web_search import WebSearchTool
+
+
+class FlakyTool(BaseTool):
+    memoize = True
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+
+    @property
+    def name(self):
+        return "flaky"
+
+    @property
+    def description(self):
+        return "Returns the next result"
+
+    def execute(self, *args, **kwargs):
+        self.calls += 1
+        return self.results.pop(0)
+
+
+def test_transient_results_are_not_memoized():
+    tool = FlakyTool([TransientResult("Error: timed out"), "4", "5"])
+
+    async def flaky(expression: str) -> str:
+        return tool.execute(expression)
+
+    wrapped = ToolPipeline([MemoizeMiddleware(maxsize=8)]).wrap(tool, flaky)
+
+    async def calls():
+        return [await wrapped("2+2") for _ in range(3)]
+
+    assert asyncio.run(calls()) == ["Error: timed out", "4", "4"]
+    assert tool.calls == 2
+
+
+def test_executor_failures_are_transient():
+    calculator = CalculatorTool()
+    for error in (ToolTimeoutError("slow"), ToolCrashedError("gone")):
+        assert not calculator.memoizable(calculator._error("9**9**9", error))
+        assert not BatchCalculatorTool().memoizable(BatchCalculatorTool()._failed(error))
+    assert calculator.memoizable(calculator._error("1/0", ZeroDivisionError("division by zero")))
+    assert json.loads(BatchCalculatorTool()._failed(ToolTimeoutError("slow"))) == {"error": "slow"}
+
+
+def test_web_search_execute_returns_the_results():
+    result = WebSearchTool().execute("python")
+    assert isinstance(result, str)
@@ -0,0 +1,43 @@
+import asyncio
+
+from services.web_search import SearchBackend, WebSearchService
+
+
+class SlowBackend(SearchBackend):
+    name = "slow"
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def search(self, query: str) -> str:
+        self.started += 1
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"results for {query}"
+
+
+def test_search_is_cancelled_with_its_last_waiter():
+    backend = SlowBackend()
+    service = WebSearchService(backend, ttl=60, maxsize=8)
+
+    async def scenario():
+        first = asyncio.ensure_future(service.search("python"))
+        second = asyncio.ensure_future(service.search("Python"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        assert await second == "results for python"
+
+        third = asyncio.ensure_future(service.search("rust"))
+        await asyncio.sleep(0.05)
+        third.cancel()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert backend.started == 2
+    assert backend.cancelled == 1
+    assert service.abandoned == 1
+    assert service.stats()["in_flight"] == 0
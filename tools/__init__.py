@@ -1,4 +1,22 @@
-from tools.base_tool import BaseTool
-from tools.calculator import CalculatorTool
+import importlib
 
-__all__ = ['BaseTool', 'CalculatorTool']
+# Exported names and their modules; imported on first use, so importing a
+# tool module (or the registry) doesn't import every other tool
+_EXPORTS = {
+    'BaseTool': 'tools.base_tool',
+    'CalculatorTool': 'tools.calculator',
+    'BatchCalculatorTool': 'tools.batch_calculator',
+    'CalculatorEngine': 'tools.calc_engine',
+    'ToolExecutor': 'tools.executor',
+    'ToolRegistry': 'tools.registry',
+    'get_tool': 'tools.registry',
+    'WebSearchTool': 'tools.web_search',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'tools' has no attribute '{name}'")
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
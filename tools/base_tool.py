@@ -1,38 +1,106 @@
+import asyncio
+import inspect
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional, Type
+from typing import Any, Callable, Dict, Optional, Type
+
+from tools.middleware import default_pipeline
+from tools.registry import tool_registry
+
+class TransientResult(str):
+    """
+    A result, usually an error message, that only applies to this call.
+
+    Tools return it for failures like a timed out, crashed or rejected
+    worker, so memoization never serves them for later calls.
+    """
+
 
 class BaseTool(ABC):
     """Base class for all tools in the system.
-    
+
     Following the Interface Segregation and Dependency Inversion principles,
     this abstract base class defines the interface that all tools must implement.
     """
-    
+
+    # Bump when the tool's parameters or description change: built function tools are keyed on it
+    version = "1"
+
+    # Performance controls applied by the middleware of to_function_tool (see tools.middleware)
+    memoize = False  # Deterministic: results are reused for the same arguments
+    max_concurrency = 0  # Calls running at a time per event loop; 0 for no limit
+    timeout: Optional[float] = None  # Seconds per call; None for Config.TOOL_CALL_TIMEOUT
+
     @property
     @abstractmethod
     def name(self) -> str:
         """Name of the tool."""
         pass
-    
+
     @property
     @abstractmethod
     def description(self) -> str:
         """Description of what the tool does."""
         pass
-    
+
     @abstractmethod
     def execute(self, *args, **kwargs) -> Any:
         """Execute the tool with the provided arguments."""
         pass
-    
-    def to_function_tool(self, function_tool_factory=None):
+
+    async def execute_async(self, *args, **kwargs) -> Any:
+        """
+        Execute the tool without blocking the event loop.
+
+        By default execute runs in a worker thread (and an awaitable it
+        returns is awaited). Tools doing I/O override this with a coroutine.
+        """
+        result = await asyncio.to_thread(self.execute, *args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def cache_key(self) -> tuple:
+        """
+        Return a hashable key of everything the tool's function tool depends on.
+
+        Instances with equal keys share one built function tool (see
+        tools.registry); subclasses with per-instance options extend it.
+        """
+        return (type(self).__module__, type(self).__qualname__, self.name, self.version)
+
+    def memoizable(self, result: Any) -> bool:
+        """Whether a result of a ``memoize`` tool may be reused: not a TransientResult."""
+        return not isinstance(result, TransientResult)
+
+    def tool_function(self) -> Callable:
+        """
+        Return the function the SDK calls for this tool.
+
+        Its name, signature and docstring become the tool's schema, so tools
+        override this with a typed function calling execute_async.
+        """
+        async def wrapper(*args, **kwargs):
+            return await self.execute_async(*args, **kwargs)
+
+        # Set the name and docstring of the wrapper
+        wrapper.__name__ = self.name
+        wrapper.__doc__ = self.description
+        return wrapper
+
+    def to_function_tool(self, function_tool_factory=None, pipeline=None):
         """
         Convert this tool to a function tool for the OpenAI Agents SDK.
-        
+
+        The tool function is wrapped in the middleware pipeline, so calls are
+        timed, memoized, limited and bounded in time as the tool declares. The
+        function tool is named after the tool and built once per tool version
+        (see tools.registry), so agent builds don't derive the schema again.
+
         Args:
             function_tool_factory: A function that creates a function tool,
                 usually agents.function_tool
-        
+            pipeline: Optional ToolPipeline; defaults to tools.middleware.default_pipeline
+
         Returns:
             A function tool for the OpenAI Agents SDK
         """
@@ -40,13 +108,6 @@ class BaseTool(ABC):
             # If no factory is provided, return a placeholder
             # This will be replaced in the actual agent creation
             return self
-        
-        # Create a wrapper function with the same signature as execute
-        wrapper = lambda *args, **kwargs: self.execute(*args, **kwargs)
-        
-        # Set the name and docstring of the wrapper
-        wrapper.__name__ = self.name
-        wrapper.__doc__ = self.description
-        
-        # Create and return the function tool
-        return function_tool_factory(wrapper)
+
+        # The SDK extracts the schema from the wrapped function's signature and docstring
+        return tool_registry.function_tool(self, function_tool_factory, pipeline or default_pipeline)
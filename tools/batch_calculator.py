@@ -0,0 +1,281 @@
+import json
+import logging
+import math
+from typing import Any, Dict, List, Optional
+
+from typing_extensions import TypedDict
+
+from services import metrics
+from tools.base_tool import BaseTool, TransientResult
+from tools.calc_engine import CalculatorEngine, UnsafeExpressionError, default_engine, format_number
+from tools.executor import ToolExecutionError, ToolRejectedError, tool_executor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; bindings are then evaluated row by row
+    np = None
+
+# Upper bound on expressions or binding rows evaluated in one call
+MAX_BATCH_SIZE = 1000
+
+# Integers beyond this magnitude are not exact as float64; they are evaluated row by row
+MAX_EXACT_INTEGER = 2 ** 53
+
+
+class VariableBinding(TypedDict):
+    """A variable and the values to evaluate an expression with."""
+    name: str
+    values: List[float]
+
+
+def _vector_log(x, base=None):
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+
+def _vector_functions() -> Dict[str, Any]:
+    """NumPy equivalents of MATH_FUNCTIONS for array inputs."""
+    return {
+        "sin": np.sin,
+        "cos": np.cos,
+        "tan": np.tan,
+        "sqrt": np.sqrt,
+        "log": _vector_log,
+        "exp": np.exp,
+        "abs": np.abs,
+        "pi": math.pi,
+        "e": math.e,
+        "ln": np.log,
+    }
+
+
+VECTOR_FUNCTIONS = _vector_functions() if np is not None else None
+
+
+class BatchCalculatorTool(BaseTool):
+    """
+    Evaluates many expressions in a single tool call.
+
+    Either a list of independent expressions, or one expression evaluated for
+    every row of variable bindings. Bindings are evaluated as NumPy arrays
+    when NumPy is installed. With the shared engine, the whole batch is
+    evaluated in one call to the tool executor's worker processes.
+    """
+
+    # Results depend only on the arguments
+    memoize = True
+
+    BUSY = "The calculator is busy. Please try again shortly."
+
+    def __init__(self, engine: Optional[CalculatorEngine] = None):
+        """
+        Initialize the batch calculator.
+
+        Args:
+            engine: Optional evaluation engine; defaults to the shared, cached engine
+        """
+        self.engine = engine or default_engine
+
+    @property
+    def name(self) -> str:
+        return "calculate_batch"
+
+    @property
+    def description(self) -> str:
+        return ("Evaluate several mathematical expressions in one call. Pass a list of expressions, "
+                "or one expression with variables bound to lists of values to evaluate it for each set of values.")
+
+    def execute(self, *args, **kwargs) -> Any:
+        """
+        Execute the batch calculator.
+
+        Args:
+            *args: Positional arguments (first one is used as the list of expressions)
+            **kwargs: 'expressions', or 'expression' with 'variables'
+                (a list of {"name": ..., "values": [...]})
+
+        Returns:
+            A JSON string with per-item results and errors, or a top-level error
+        """
+        try:
+            if self.engine is default_engine:
+                payload = tool_executor.call(_evaluate, args, kwargs)
+            else:
+                payload = self.evaluate(*args, **kwargs)
+        except ToolExecutionError as e:
+            return self._failed(e)
+        return self._report(payload)
+
+    async def execute_async(self, *args, **kwargs) -> Any:
+        """Like execute, but awaits the worker process instead of blocking the event loop."""
+        try:
+            payload = await self.evaluate_async(*args, **kwargs)
+        except ToolExecutionError as e:
+            return self._failed(e)
+        return self._report(payload)
+
+    async def evaluate_async(self, *args, **kwargs) -> Dict[str, Any]:
+        """
+        Evaluate the arguments of execute in a tool worker process and return the payload.
+
+        Raises:
+            ToolExecutionError: If the batch was rejected, timed out or its worker crashed
+        """
+        if self.engine is not default_engine:
+            return self.evaluate(*args, **kwargs)
+        return await tool_executor.run(_evaluate, args, kwargs)
+
+    def _report(self, payload: Dict[str, Any]) -> str:
+        metrics.record_tool_call(self.name, "error" if "error" in payload else "ok")
+        return json.dumps(payload)
+
+    def _failed(self, error: ToolExecutionError) -> str:
+        logging.warning(f"Batch calculation failed: {str(error)}")
+        metrics.record_tool_call(self.name, error.reason)
+        # Rejections, timeouts and crashes are not results of the batch: never memoized
+        return TransientResult(json.dumps({"error": self.BUSY if isinstance(error, ToolRejectedError) else str(error)}))
+
+    def cache_key(self) -> tuple:
+        # Tools with their own engine get their own function tool
+        key = super().cache_key()
+        return key if self.engine is default_engine else key + (id(self.engine),)
+
+    def evaluate(self, *args, **kwargs) -> Dict[str, Any]:
+        """Evaluate the arguments of execute in the calling thread and return the payload."""
+        expressions = args[0] if args else kwargs.get('expressions')
+        expression = kwargs.get('expression')
+        variables = kwargs.get('variables')
+
+        if expression and variables:
+            return self.evaluate_bindings(expression, variables)
+        if expressions:
+            return self.evaluate_many(expressions)
+        if expression:
+            return self.evaluate_many([expression])
+        return {"error": "No expressions provided. Pass 'expressions', or 'expression' with 'variables'."}
+
+    def evaluate_many(self, expressions: List[str]) -> Dict[str, Any]:
+        """Evaluate independent expressions, reporting errors per item."""
+        if len(expressions) > MAX_BATCH_SIZE:
+            return {"error": f"Too many expressions (maximum {MAX_BATCH_SIZE})."}
+
+        logging.debug("Calculating batch of %d expressions", len(expressions))
+        results = []
+        for expression in expressions:
+            item = {"expression": expression}
+            try:
+                item["result"] = format_number(self.engine.evaluate(expression))
+            except UnsafeExpressionError:
+                item["error"] = "The expression contains unsafe operations or functions."
+            except Exception as e:
+                item["error"] = str(e)
+            results.append(item)
+        return {"results": results}
+
+    @staticmethod
+    def _invalid_variables(variables: Any) -> Optional[str]:
+        # The model may send any JSON; report a malformed shape instead of raising
+        if not isinstance(variables, list):
+            return "'variables' must be a list of {\"name\": ..., \"values\": [...]} objects."
+        for binding in variables:
+            if not isinstance(binding, dict) or not isinstance(binding.get("name"), str) \
+                    or not isinstance(binding.get("values"), list):
+                return "Every variable needs a \"name\" and a list of \"values\"."
+            if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in binding["values"]):
+                return f"The values of variable '{binding['name']}' must be numbers."
+        return None
+
+    def evaluate_bindings(self, expression: str, variables: List[VariableBinding]) -> Dict[str, Any]:
+        """Evaluate one expression for every row of variable values."""
+        invalid = self._invalid_variables(variables)
+        if invalid is not None:
+            return {"error": invalid}
+        columns = {binding["name"].lower(): list(binding["values"]) for binding in variables}
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) != 1:
+            return {"error": "All variables must have the same number of values."}
+        rows = lengths.pop()
+        if rows > MAX_BATCH_SIZE:
+            return {"error": f"Too many values (maximum {MAX_BATCH_SIZE})."}
+
+        logging.debug("Calculating %s over %d sets of values", expression, rows)
+        try:
+            # Validate once; the error is the same for every row
+            self.engine.compile(expression, columns.keys())
+        except UnsafeExpressionError:
+            return {"error": "The expression contains unsafe operations or functions."}
+        except Exception as e:
+            return {"error": str(e)}
+
+        results = None
+        if np is not None:
+            results = self._evaluate_vectorized(expression, columns, rows)
+        if results is None:
+            results = self._evaluate_rows(expression, columns, rows)
+
+        return {"expression": expression, "results": results}
+
+    def _evaluate_vectorized(self, expression, columns, rows) -> Optional[List[Dict[str, Any]]]:
+        # float64 would round large integers; Python ints are exact
+        if any(isinstance(value, int) and abs(value) > MAX_EXACT_INTEGER
+               for column in columns.values() for value in column):
+            return None
+        integers = all(isinstance(value, int) for column in columns.values() for value in column)
+        try:
+            arrays = {name: np.asarray(values, dtype=float) for name, values in columns.items()}
+            with np.errstate(all="ignore"):
+                values = self.engine.evaluate(expression, arrays, functions=VECTOR_FUNCTIONS)
+            values = np.broadcast_to(values, (rows,))
+            if integers and np.any(np.abs(values[np.isfinite(values)]) > MAX_EXACT_INTEGER):
+                # Integer results past float64 precision (e.g. large powers)
+                return None
+        except Exception as e:
+            # Fall back to row-by-row evaluation, which reports errors per item
+            logging.debug("Vectorized evaluation failed, evaluating row by row: %s", e)
+            return None
+
+        results = []
+        for index, value in enumerate(values):
+            item = {"variables": {name: column[index] for name, column in columns.items()}}
+            if np.isfinite(value):
+                item["result"] = format_number(float(value))
+            else:
+                item["error"] = "The result is undefined or infinite for these values."
+            results.append(item)
+        return results
+
+    def _evaluate_rows(self, expression, columns, rows) -> List[Dict[str, Any]]:
+        results = []
+        for index in range(rows):
+            row = {name: column[index] for name, column in columns.items()}
+            item = {"variables": row}
+            try:
+                item["result"] = format_number(self.engine.evaluate(expression, row))
+            except Exception as e:
+                item["error"] = str(e)
+            results.append(item)
+        return results
+
+    def tool_function(self):
+        """Return the typed function the SDK calls (see BaseTool.tool_function)."""
+        async def calculate_batch(expressions: Optional[List[str]] = None,
+                                  expression: Optional[str] = None,
+                                  variables: Optional[List[VariableBinding]] = None) -> str:
+            """
+            Evaluate several mathematical expressions in one call. Use this instead of repeated calculate calls.
+
+            Args:
+                expressions: Independent expressions to evaluate, e.g. ["25 * 4", "sqrt(2)"]
+                expression: One expression using variables, e.g. "x ^ 2 + y"
+                variables: Values for the variables in expression; every variable needs the same number of values
+
+            Returns:
+                JSON with a result or an error for every expression or set of values
+            """
+            return await self.execute_async(expressions=expressions, expression=expression, variables=variables)
+
+        return calculate_batch
+
+
+def _evaluate(args: tuple, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Evaluate a batch with the shared engine (run by tool workers)."""
+    return BatchCalculatorTool().evaluate(*args, **kwargs)
@@ -0,0 +1,173 @@
+import ast
+import math
+import threading
+from collections import ChainMap, OrderedDict
+from types import CodeType, MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+# Functions and constants available to expressions; shared and read-only
+MATH_FUNCTIONS = MappingProxyType({
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "sqrt": math.sqrt,
+    "log": math.log,
+    "exp": math.exp,
+    "abs": abs,
+    "pi": math.pi,
+    "e": math.e,
+    "ln": math.log,  # Natural logarithm
+})
+
+_ALLOWED_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.UAdd,
+    ast.USub,
+)
+
+# Empty builtins: expressions can only reach MATH_FUNCTIONS
+_GLOBALS = {"__builtins__": {}}
+
+
+class UnsafeExpressionError(ValueError):
+    """Raised when an expression uses syntax or names outside the whitelist."""
+
+
+class CalculatorEngine:
+    """
+    Parses, validates and compiles arithmetic expressions once.
+
+    Expressions are normalized, parsed into an AST and checked against a
+    whitelist of node types and names. The compiled code objects are kept in a
+    bounded LRU cache keyed by the normalized expression, so repeated
+    expressions skip parsing and validation entirely.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        """
+        Initialize the engine.
+
+        Args:
+            maxsize: Maximum number of compiled expressions to keep
+        """
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[Tuple[str, Tuple[str, ...]], CodeType]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(expression: Any) -> str:
+        """Normalize notation and whitespace so equivalent inputs share a cache key."""
+        if not isinstance(expression, str):
+            expression = str(expression)
+        return "".join(expression.lower().replace("^", "**").split())
+
+    def compile(self, expression: Any, variables: Iterable[str] = ()) -> CodeType:
+        """
+        Return the compiled code object for an expression.
+
+        Args:
+            expression: The expression to compile
+            variables: Names of variables the expression may use besides the
+                math functions (lowercase, as expressions are normalized)
+
+        Raises:
+            UnsafeExpressionError: If the expression is outside the whitelist
+            NameError: If the expression uses an unknown name
+            SyntaxError: If the expression cannot be parsed
+        """
+        variables = tuple(sorted(variables))
+        key = (self.normalize(expression), variables)
+
+        with self._lock:
+            code = self._cache.get(key)
+            if code is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return code
+            self.misses += 1
+
+        tree = ast.parse(key[0], mode="eval")
+        self._validate(tree, variables)
+        code = compile(tree, "<calculator>", "eval")
+
+        with self._lock:
+            self._cache[key] = code
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return code
+
+    def evaluate(self, expression: Any, variables: Optional[Mapping[str, Any]] = None,
+                 functions: Mapping[str, Any] = MATH_FUNCTIONS) -> Any:
+        """
+        Evaluate an expression with only the whitelisted math functions available.
+
+        Args:
+            expression: The expression to evaluate
+            variables: Optional variable values by (lowercase) name
+            functions: The function table; must provide the same names as
+                MATH_FUNCTIONS (e.g. NumPy equivalents for vectorized input)
+        """
+        if not variables:
+            return eval(self.compile(expression), _GLOBALS, functions)
+        code = self.compile(expression, variables.keys())
+        return eval(code, _GLOBALS, ChainMap(dict(variables), functions))
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache hit/miss counters and size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "maxsize": self.maxsize}
+
+    def clear(self) -> None:
+        """Drop all compiled expressions."""
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def _validate(tree: ast.AST, variables: Tuple[str, ...] = ()) -> None:
+        for name in variables:
+            if name in MATH_FUNCTIONS or not name.isidentifier() or name.startswith("_"):
+                raise UnsafeExpressionError(f"Invalid variable name '{name}'")
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise UnsafeExpressionError(f"{type(node).__name__} is not allowed")
+            if isinstance(node, ast.Name) and node.id not in MATH_FUNCTIONS and node.id not in variables:
+                raise NameError(f"name '{node.id}' is not defined")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise UnsafeExpressionError("Only numeric constants are allowed")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or not callable(MATH_FUNCTIONS.get(node.func.id)):
+                    raise UnsafeExpressionError("Only math functions can be called")
+                if node.keywords:
+                    raise UnsafeExpressionError("Keyword arguments are not allowed")
+
+
+def format_number(result: Any) -> str:
+    """Format an evaluation result the way the calculator tools report it."""
+    if isinstance(result, (int, float)):
+        if isinstance(result, int) or float(result).is_integer():
+            return str(int(result))
+        return str(round(result, 8))
+    return str(result)
+
+
+# Engine shared by all calculator tools in this process
+default_engine = CalculatorEngine()
+
+
+def evaluate_formatted(expression: Any) -> str:
+    """Evaluate an expression with the shared engine and format the result (run by tool workers)."""
+    return format_number(default_engine.evaluate(expression))
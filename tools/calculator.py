@@ -1,12 +1,35 @@
 import logging
-import math
-import re
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-from tools.base_tool import BaseTool
+from services import metrics
+from tools.base_tool import BaseTool, TransientResult
+from tools.calc_engine import CalculatorEngine, UnsafeExpressionError, default_engine, evaluate_formatted, format_number
+from tools.executor import ToolExecutionError, ToolRejectedError, ToolTimeoutError, tool_executor
 
 class CalculatorTool(BaseTool):
-    """A simple calculator tool for basic arithmetic operations."""
+    """
+    A simple calculator tool for basic arithmetic operations.
+
+    With the shared engine, expressions are evaluated by the tool executor's
+    worker processes, so an expression like 9**9**9 runs out of time there
+    instead of blocking the server.
+    """
+
+    # Results depend only on the expression
+    memoize = True
+
+    NO_EXPRESSION = "Error: No expression provided. Please provide a mathematical expression to evaluate."
+    BUSY = TransientResult("Error: The calculator is busy. Please try again shortly.")
+    
+    def __init__(self, engine: Optional[CalculatorEngine] = None):
+        """
+        Initialize the calculator.
+        
+        Args:
+            engine: Optional evaluation engine; defaults to the shared, cached engine.
+                Other engines evaluate in the calling thread.
+        """
+        self.engine = engine or default_engine
     
     @property
     def name(self) -> str:
@@ -20,6 +43,9 @@ class CalculatorTool(BaseTool):
         """
         Execute the calculator with the provided arguments.
         
+        Blocks the calling thread until the result is ready; use
+        execute_async on an event loop.
+        
         Args:
             *args: Positional arguments (first one is used as expression if provided)
             **kwargs: Keyword arguments (looks for 'expression' key)
@@ -27,106 +53,82 @@ class CalculatorTool(BaseTool):
         Returns:
             A string containing the result of the calculation or an error message
         """
+        expression = self._expression(args, kwargs)
+        if expression is None:
+            return self.NO_EXPRESSION
+        try:
+            if self.engine is default_engine:
+                result = tool_executor.call(evaluate_formatted, expression)
+            else:
+                result = format_number(self.engine.evaluate(expression))
+        except Exception as e:
+            return self._error(expression, e)
+        metrics.record_tool_call(self.name, "ok")
+        return result
+
+    async def execute_async(self, *args, **kwargs) -> Any:
+        """Like execute, but awaits the worker process instead of blocking the event loop."""
+        expression = self._expression(args, kwargs)
+        if expression is None:
+            return self.NO_EXPRESSION
+        try:
+            if self.engine is default_engine:
+                result = await tool_executor.run(evaluate_formatted, expression)
+            else:
+                result = format_number(self.engine.evaluate(expression))
+        except Exception as e:
+            return self._error(expression, e)
+        metrics.record_tool_call(self.name, "ok")
+        return result
+
+    def cache_key(self) -> tuple:
+        # Tools with their own engine get their own function tool
+        key = super().cache_key()
+        return key if self.engine is default_engine else key + (id(self.engine),)
+
+    @staticmethod
+    def _expression(args, kwargs) -> Optional[Any]:
         # Extract expression from either args or kwargs
         if args and len(args) > 0:
             expression = args[0]
         elif 'expression' in kwargs:
             expression = kwargs['expression']
         else:
-            return "Error: No expression provided. Please provide a mathematical expression to evaluate."
-            
-        logging.info(f"Calculating expression: {expression}")
-        
-        try:
-            # Clean and validate the expression
-            cleaned_expr = self._clean_expression(expression)
-            if self._is_unsafe_expression(cleaned_expr):
-                return "Error: The expression contains unsafe operations or functions."
-            
-            # Define allowed math functions
-            math_context = {
-                "sin": math.sin, 
-                "cos": math.cos, 
-                "tan": math.tan, 
-                "sqrt": math.sqrt, 
-                "log": math.log,
-                "exp": math.exp,
-                "abs": abs,
-                "pi": math.pi, 
-                "e": math.e,
-                "ln": lambda x: math.log(x, math.e)  # Add natural logarithm function
-            }
-            
-            # Evaluate the expression with restricted context
-            result = eval(cleaned_expr, {"__builtins__": None}, math_context)
-            
-            # Format the result
-            if isinstance(result, (int, float)):
-                if isinstance(result, int) or float(result).is_integer():
-                    return str(int(result))
-                else:
-                    return str(round(result, 8))
-            else:
-                return str(result)
-                
-        except Exception as e:
-            logging.error(f"Error in calculation: {str(e)}")
-            return f"Error calculating: {str(e)}"
-    
-    def _clean_expression(self, expression: str) -> str:
-        """Clean and sanitize the expression for evaluation."""
-        if not isinstance(expression, str):
-            expression = str(expression)
-            
-        # Replace common mathematical notations
-        expression = expression.lower().replace('^', '**')
-        
-        # Clean whitespace
-        expression = re.sub(r'\s+', '', expression)
-        
+            return None
+        logging.debug("Calculating expression: %s", expression)
         return expression
-    
-    def _is_unsafe_expression(self, expression: str) -> bool:
-        """Check if the expression contains unsafe operations."""
-        unsafe_patterns = [
-            r'import',
-            r'exec',
-            r'eval',
-            r'compile',
-            r'open',
-            r'__',
-            r'globals',
-            r'locals',
-            r'getattr',
-            r'setattr',
-            r'system',
-            r'subprocess',
-            r'os\.',
-            r'sys\.',
-        ]
-        
-        for pattern in unsafe_patterns:
-            if re.search(pattern, expression):
-                return True
-        
-        return False
-        
-    def to_function_tool(self, function_tool_factory=None):
-        """
-        Convert this tool to a function tool for the OpenAI Agents SDK.
-        
-        Args:
-            function_tool_factory: A function that creates a function tool
-        
-        Returns:
-            A function tool for the OpenAI Agents SDK
-        """
-        if function_tool_factory is None:
-            return self
+
+    def _error(self, expression: Any, error: Exception) -> str:
+        if isinstance(error, UnsafeExpressionError):
+            logging.warning(f"Rejected unsafe expression {expression!r}: {str(error)}")
+            metrics.record_tool_call(self.name, "unsafe")
+            return "Error: The expression contains unsafe operations or functions."
+        if isinstance(error, ToolTimeoutError):
+            logging.warning(f"Calculation of {expression!r} timed out")
+            metrics.record_tool_call(self.name, "timeout")
+            return TransientResult("Error: The calculation took too long. Try a smaller expression.")
+        if isinstance(error, MemoryError):
+            # The worker's address space limit
+            logging.warning(f"Calculation of {expression!r} ran out of memory")
+            metrics.record_tool_call(self.name, "error")
+            return "Error: The calculation needs too much memory. Try a smaller expression."
+        if isinstance(error, ToolRejectedError):
+            logging.warning(f"Calculation of {expression!r} rejected: {str(error)}")
+            metrics.record_tool_call(self.name, error.reason)
+            return self.BUSY
+        if isinstance(error, ToolExecutionError):
+            # The worker died, e.g. over its CPU limit
+            logging.warning(f"Calculation of {expression!r} failed: {str(error)}")
+            metrics.record_tool_call(self.name, error.reason)
+            return TransientResult(f"Error calculating: {str(error)}")
+        logging.error(f"Error in calculation: {str(error)}")
+        metrics.record_tool_call(self.name, "error")
+        return f"Error calculating: {str(error)}"
         
-        # Create a properly typed wrapper function for the SDK that will map to our execute method
+    def tool_function(self):
+        """Return the typed function the SDK calls (see BaseTool.tool_function)."""
         # The function signature must match what we want in our parameters
-        def calculator_function(expression: str) -> str:
+        async def calculator_function(expression: str) -> str:
             """
             Perform mathematical calculations. Supports addition, subtraction, multiplication, division, exponentiation, and basic math functions like sin, cos, sqrt.
             
@@ -137,8 +139,6 @@ class CalculatorTool(BaseTool):
                 The result of the calculation as a string
             """
             # Pass the expression as a keyword argument instead of a positional argument
-            return self.execute(expression=expression)
+            return await self.execute_async(expression=expression)
         
-        # Return the function tool
-        # The SDK will automatically extract the schema from the function signature and docstring
-        return function_tool_factory(calculator_function)
+        return calculator_function
@@ -0,0 +1,421 @@
+"""
+Isolated execution of CPU-bound tool calls in a warm pool of worker processes.
+
+The calculator tools evaluate expressions chosen by the model, and a single
+expression (``9**9**9``) can keep a CPU busy for minutes. Evaluated on the
+event loop, it stalls every run of the server process. ToolExecutor runs
+such calls in separate Python processes instead:
+
+- TOOL_WORKERS processes are started ahead of time with the tool modules
+  imported, and each runs one call at a time.
+- A call gets TOOL_TIMEOUT seconds of wall-clock time. A worker that
+  overruns is killed and replaced, and the call fails with ToolTimeoutError.
+- Workers run under rlimits: TOOL_MEMORY_LIMIT_MB of address space (the call
+  fails with MemoryError), and TOOL_CPU_LIMIT CPU seconds per call (the
+  kernel kills the worker, and the call fails with ToolCrashedError).
+- At most TOOL_QUEUE_SIZE calls wait for a worker, each for up to
+  TOOL_QUEUE_TIMEOUT seconds; calls beyond that fail with ToolRejectedError.
+
+Async callers await results without blocking the event loop: the waiting is
+done by a thread per worker process. Functions and arguments are pickled, so
+functions must be importable module-level functions. TOOL_EXECUTOR=inline
+calls them in the calling thread instead, without isolation or limits.
+
+The pool belongs to one server process: gunicorn workers start their own
+while warming up (or on first use), and never use one inherited by a fork.
+"""
+
+import argparse
+import asyncio
+import atexit
+import concurrent.futures
+import importlib
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Connection
+from queue import SimpleQueue
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules every worker imports before its first call
+PRELOAD_MODULES = ("tools.calc_engine", "tools.batch_calculator")
+
+
+class ToolExecutionError(RuntimeError):
+    """Raised when the executor could not complete a tool call."""
+
+    reason = "error"
+
+
+class ToolTimeoutError(ToolExecutionError):
+    """The call ran out of wall-clock time; its worker was replaced."""
+
+    reason = "timeout"
+
+
+class ToolRejectedError(ToolExecutionError):
+    """Too many calls were waiting for a worker, or the wait expired."""
+
+    reason = "rejected"
+
+
+class ToolCrashedError(ToolExecutionError):
+    """The worker died during the call, e.g. killed for exceeding its CPU limit."""
+
+    reason = "crashed"
+
+
+class WorkerProcess:
+    """A worker process and the connection to it; runs one call at a time."""
+
+    def __init__(self, memory_limit_mb: int, cpu_limit: int, preload: Sequence[str] = PRELOAD_MODULES):
+        """
+        Start the worker process.
+
+        Args:
+            memory_limit_mb: Address space limit of the process in MiB (0 for none)
+            cpu_limit: CPU seconds allowed per call (0 for no limit)
+            preload: Modules the process imports before its first call
+        """
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit = cpu_limit
+        self.preload = tuple(preload)
+        self.restarts = 0
+        self._start()
+
+    def _start(self) -> None:
+        # Returns once the process runs; it reports back when its modules are imported
+        self.ready = False
+        parent, child = socket.socketpair()
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+        # One call at a time per process: numerical libraries don't need thread pools
+        env.setdefault("OPENBLAS_NUM_THREADS", "1")
+        env.setdefault("OMP_NUM_THREADS", "1")
+        # Not "-m tools.executor": the worker's classes must be the ones the parent unpickles
+        command = [sys.executable, "-c", "import sys, tools.executor; tools.executor.main(sys.argv[1:])",
+                   "--fd", str(child.fileno()),
+                   "--memory-limit", str(self.memory_limit_mb), "--cpu-limit", str(self.cpu_limit)]
+        command += [argument for module in self.preload for argument in ("--preload", module)]
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env, stdin=subprocess.DEVNULL,
+                                        pass_fds=[child.fileno()])
+        child.close()
+        self.connection = Connection(parent.detach())
+
+    def wait_ready(self, timeout: float = 30.0) -> None:
+        """
+        Wait until the process has imported its modules and waits for calls.
+
+        Raises:
+            ToolCrashedError: If the process exited or took longer than ``timeout`` seconds
+        """
+        if self.ready:
+            return
+        try:
+            if not self.connection.poll(timeout):
+                raise ToolCrashedError(f"The tool worker did not start within {timeout:g} seconds")
+            self.connection.recv()
+        except (EOFError, OSError):
+            raise ToolCrashedError(f"The tool worker failed to start (exit code {self.process.poll()})") from None
+        self.ready = True
+
+    def call(self, function: Callable, args: tuple, timeout: float) -> Any:
+        """
+        Run function(*args) in the process and return its result.
+
+        Raises:
+            ToolTimeoutError: If the call took longer than ``timeout`` seconds
+            ToolCrashedError: If the process died during the call
+            Exception: Whatever the function raised
+        """
+        self.wait_ready()
+        try:
+            self.connection.send((function, args))
+            if not self.connection.poll(timeout):
+                self.restart()
+                raise ToolTimeoutError(f"The tool call did not finish within {timeout:g} seconds")
+            ok, value = self.connection.recv()
+        except (EOFError, OSError):
+            try:
+                code = self.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                code = None
+            self.restart()
+            raise ToolCrashedError(f"The tool worker exited during the call (exit code {code})") from None
+        if ok:
+            return value
+        raise value
+
+    def restart(self) -> None:
+        """Kill the process and start a fresh one."""
+        self.stop(graceful=False)
+        self.restarts += 1
+        self._start()
+
+    def stop(self, graceful: bool = True) -> None:
+        """Stop the process; gracefully, it exits once its connection is closed."""
+        self.connection.close()
+        if graceful:
+            try:
+                self.process.wait(timeout=1)
+                return
+            except subprocess.TimeoutExpired:
+                pass
+        self.process.kill()
+        self.process.wait()
+
+
+class ToolExecutor:
+    """Runs tool functions in a pool of isolated worker processes (see the module docstring)."""
+
+    def __init__(self, workers: int = Config.TOOL_WORKERS, timeout: float = Config.TOOL_TIMEOUT,
+                 queue_size: int = Config.TOOL_QUEUE_SIZE, queue_timeout: float = Config.TOOL_QUEUE_TIMEOUT,
+                 memory_limit_mb: int = Config.TOOL_MEMORY_LIMIT_MB, cpu_limit: int = Config.TOOL_CPU_LIMIT,
+                 backend: str = Config.TOOL_EXECUTOR):
+        """
+        Args:
+            workers: Number of worker processes
+            timeout: Default wall-clock seconds per call
+            queue_size: Maximum number of calls waiting for a worker
+            queue_timeout: Maximum seconds a call waits for a worker
+            memory_limit_mb: Address space limit per worker in MiB (0 for none)
+            cpu_limit: CPU seconds per call (0 for no limit)
+            backend: "process", or "inline" to call functions in the calling thread
+        """
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit = cpu_limit
+        self.backend = backend
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.rejected = 0
+        self._processes: List[WorkerProcess] = []
+        self._idle: SimpleQueue = SimpleQueue()
+        self._threads: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def isolated(self) -> bool:
+        return self.backend == "process"
+
+    @property
+    def started(self) -> bool:
+        """Whether this process's worker processes are running."""
+        return self._pid == os.getpid()
+
+    def start(self) -> None:
+        """
+        Start this process's worker processes (once per process, after any fork).
+
+        Blocks until every worker is ready; agent_runtime.warm_worker calls it
+        before requests arrive, and run() starts them in a thread otherwise.
+        """
+        if not self.isolated or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Processes inherited from a parent belong to it: start our own
+            started = time.perf_counter()
+            self._processes = [WorkerProcess(self.memory_limit_mb, self.cpu_limit) for _ in range(self.workers)]
+            for process in self._processes:
+                process.wait_ready()
+            self._idle = SimpleQueue()
+            for process in self._processes:
+                self._idle.put(process)
+            self._threads = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="tool-executor")
+            self.pending = 0
+            self._pid = os.getpid()
+        logger.info(f"Tool executor started {self.workers} worker process(es) in {time.perf_counter() - started:.3f} "
+                    f"seconds (timeout {self.timeout:g}s, memory {self.memory_limit_mb} MiB, cpu {self.cpu_limit}s)")
+
+    def submit(self, function: Callable, *args: Any, timeout: Optional[float] = None) -> concurrent.futures.Future:
+        """
+        Queue function(*args) for a worker process.
+
+        Returns:
+            A future of the result; cancelling it before a worker picks the
+            call up removes it from the queue
+
+        Raises:
+            ToolRejectedError: If the queue is full
+        """
+        self.start()
+        with self._lock:
+            if self.pending >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise ToolRejectedError("Too many tool calls are waiting. Please try again shortly.")
+            self.pending += 1
+        future = self._threads.submit(self._execute, function, args, timeout or self.timeout)
+        future.add_done_callback(self._finished)
+        return future
+
+    async def run(self, function: Callable, *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Run function(*args) in a worker process; the event loop keeps running meanwhile.
+
+        Raises:
+            ToolExecutionError: If the call was rejected, timed out or its worker crashed
+            Exception: Whatever the function raised
+        """
+        if not self.isolated:
+            return function(*args)
+        if not self.started:
+            # Spawning workers blocks; keep the event loop serving other requests
+            await asyncio.to_thread(self.start)
+        future = self.submit(function, *args, timeout=timeout)
+        try:
+            async with asyncio.timeout(self._wait_limit(timeout)):
+                return await asyncio.wrap_future(future)
+        except TimeoutError:
+            raise self._expired(future) from None
+
+    def call(self, function: Callable, *args: Any, timeout: Optional[float] = None) -> Any:
+        """Run function(*args) in a worker process, blocking the calling thread (see run)."""
+        if not self.isolated:
+            return function(*args)
+        future = self.submit(function, *args, timeout=timeout)
+        try:
+            return future.result(self._wait_limit(timeout))
+        except concurrent.futures.TimeoutError:
+            raise self._expired(future) from None
+
+    def _wait_limit(self, timeout: Optional[float]) -> float:
+        # Queueing plus running; a call that started late still has its own timeout
+        return self.queue_timeout + (timeout or self.timeout) + 1
+
+    def _expired(self, future: concurrent.futures.Future) -> ToolExecutionError:
+        if future.cancel():
+            with self._lock:
+                self.rejected += 1
+            return ToolRejectedError("No tool worker became free in time. Please try again shortly.")
+        return ToolTimeoutError("The tool call did not finish in time")
+
+    def _execute(self, function: Callable, args: tuple, timeout: float) -> Any:
+        # Runs on a pool thread; there is a thread per process, so one is always idle
+        process = self._idle.get()
+        try:
+            result = process.call(function, args, timeout)
+        except ToolTimeoutError:
+            self._count("timeouts")
+            raise
+        except ToolCrashedError:
+            self._count("crashes")
+            raise
+        except BaseException:
+            self._count("failed")
+            raise
+        finally:
+            self._idle.put(process)
+        self._count("completed")
+        return result
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _finished(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        """Stop this process's worker processes."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            processes, self._processes = self._processes, []
+            threads, self._threads = self._threads, None
+            self._pid = None
+        if threads is not None:
+            threads.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.stop()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the executor's counters."""
+        return {
+            "workers": len(self._processes),
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "rejected": self.rejected,
+            "restarts": sum(process.restarts for process in self._processes),
+        }
+
+
+# Executor shared by all tools in this process
+tool_executor = ToolExecutor()
+atexit.register(tool_executor.shutdown)
+
+
+def _apply_limits(memory_limit_mb: int) -> None:
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _limit_cpu(cpu_limit: int) -> None:
+    # RLIMIT_CPU counts the whole life of the process: allow cpu_limit more seconds from now.
+    # Past the soft limit the kernel sends SIGXCPU, which terminates the process.
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + 1 + cpu_limit
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, resource.RLIM_INFINITY))
+
+
+def serve(fd: int, memory_limit_mb: int, cpu_limit: int, preload: Sequence[str]) -> None:
+    """Worker process main loop: run calls from the connection until it closes."""
+    connection = Connection(fd)
+    for module in preload:
+        importlib.import_module(module)
+    _apply_limits(memory_limit_mb)
+    try:
+        connection.send((True, None))
+    except OSError:
+        return  # Stopped before it was ready
+
+    while True:
+        try:
+            function, args = connection.recv()
+        except (EOFError, OSError):
+            return
+        if cpu_limit > 0:
+            _limit_cpu(cpu_limit)
+        try:
+            reply = (True, function(*args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            # The result or the exception could not be pickled
+            connection.send((False, ToolExecutionError(f"{type(e).__name__}: {str(e)}")))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Worker process entry point (see WorkerProcess)."""
+    parser = argparse.ArgumentParser(description="Tool executor worker process")
+    parser.add_argument("--fd", type=int, required=True)
+    parser.add_argument("--memory-limit", type=int, default=0)
+    parser.add_argument("--cpu-limit", type=int, default=0)
+    parser.add_argument("--preload", action="append", default=[])
+    options = parser.parse_args(argv)
+    serve(options.fd, options.memory_limit, options.cpu_limit, options.preload)
@@ -0,0 +1,258 @@
+"""
+Middleware applied to every function tool given to the agents.
+
+BaseTool.to_function_tool wraps the function the SDK calls in a ToolPipeline,
+so every tool gets the same performance controls without implementing them.
+Tools declare what applies to them with class attributes:
+
+- ``memoize``: the tool is deterministic, so its results are reused for the
+  same arguments (MemoizeMiddleware, up to TOOL_MEMO_SIZE results per tool)
+- ``max_concurrency``: at most this many calls of the tool run at a time per
+  event loop; more wait (ConcurrencyMiddleware)
+- ``timeout``: seconds a call may take, TOOL_CALL_TIMEOUT if None
+  (TimeoutMiddleware)
+
+TimingMiddleware records the duration of every call in the per-tool
+histogram of services.metrics, cached results included.
+
+A middleware is an async callable ``(call, call_next) -> result``: it can
+inspect or change ``call``, return without calling ``call_next`` (a cache
+hit), or handle what ``call_next`` raises. Pipelines are immutable; ``then``
+returns a pipeline with more middleware appended.
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import math
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+from config import Config
+from services import metrics
+from services.response_cache import MemoryResponseCache
+
+NextHandler = Callable[["ToolCall"], Awaitable[Any]]
+
+
+class ToolCall:
+    """A tool invocation passing through the middleware."""
+
+    def __init__(self, tool: Any, bound: inspect.BoundArguments):
+        """
+        Args:
+            tool: The BaseTool being called
+            bound: The arguments of the call, bound to the tool function's signature
+        """
+        self.tool = tool
+        self.bound = bound
+        # How the call ended: "ok", "error", "timeout" or "cached"
+        self.outcome = "ok"
+
+    @property
+    def name(self) -> str:
+        return self.tool.name
+
+    @property
+    def arguments(self) -> Dict[str, Any]:
+        """The arguments by parameter name."""
+        return dict(self.bound.arguments)
+
+
+class ToolMiddleware(ABC):
+    """Interface of tool middleware."""
+
+    @abstractmethod
+    async def __call__(self, call: ToolCall, call_next: NextHandler) -> Any:
+        """Handle a call, usually by awaiting call_next(call) and returning its result."""
+        pass
+
+
+class TimingMiddleware(ToolMiddleware):
+    """Records the duration and outcome of every call (metrics.observe_tool)."""
+
+    async def __call__(self, call: ToolCall, call_next: NextHandler) -> Any:
+        started = time.perf_counter()
+        try:
+            return await call_next(call)
+        except Exception:
+            call.outcome = "error"
+            raise
+        finally:
+            metrics.observe_tool(call.name, call.outcome, time.perf_counter() - started)
+
+
+class TimeoutMiddleware(ToolMiddleware):
+    """
+    Ends calls that take longer than the tool's timeout with an error result.
+
+    A synchronous tool's worker thread cannot be stopped; it runs to the end
+    and its result is dropped.
+    """
+
+    def __init__(self, default: float = Config.TOOL_CALL_TIMEOUT):
+        """
+        Args:
+            default: Seconds per call for tools without a timeout of their own (0 for none)
+        """
+        self.default = default
+
+    async def __call__(self, call: ToolCall, call_next: NextHandler) -> Any:
+        timeout = call.tool.timeout if call.tool.timeout is not None else self.default
+        if not timeout or timeout <= 0:
+            return await call_next(call)
+
+        deadline = asyncio.timeout(timeout)
+        try:
+            async with deadline:
+                return await call_next(call)
+        except TimeoutError:
+            if not deadline.expired():
+                raise  # The tool's own timeout
+            call.outcome = "timeout"
+            metrics.record_tool_call(call.name, "timeout")
+            return f"Error: The {call.name} tool did not finish within {timeout:g} seconds."
+
+
+class MemoizeMiddleware(ToolMiddleware):
+    """Reuses the results of tools with ``memoize`` set, keyed by their arguments."""
+
+    def __init__(self, maxsize: int = Config.TOOL_MEMO_SIZE):
+        """
+        Args:
+            maxsize: Results kept per tool (0 disables memoization)
+        """
+        self.maxsize = maxsize
+        self._caches: Dict[str, MemoryResponseCache] = {}
+        self._lock = threading.Lock()
+
+    def _cache(self, name: str) -> MemoryResponseCache:
+        with self._lock:
+            cache = self._caches.get(name)
+            if cache is None:
+                # Deterministic results never go stale
+                cache = self._caches[name] = MemoryResponseCache(self.maxsize, math.inf)
+            return cache
+
+    @staticmethod
+    def key(call: ToolCall) -> str:
+        return json.dumps(call.arguments, sort_keys=True, default=str)
+
+    async def __call__(self, call: ToolCall, call_next: NextHandler) -> Any:
+        if not call.tool.memoize or self.maxsize <= 0:
+            return await call_next(call)
+
+        cache = self._cache(call.name)
+        key = self.key(call)
+        hit = cache.get(key)
+        if hit is not None:
+            call.outcome = "cached"
+            metrics.record_cache(f"tool:{call.name}", "hit")
+            return hit[0]["result"]
+
+        metrics.record_cache(f"tool:{call.name}", "miss")
+        result = await call_next(call)
+        if call.tool.memoizable(result):
+            cache.set(key, {"result": result})
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and size counters summed over the tools."""
+        caches = list(self._caches.values())
+        return {
+            "tools": len(caches),
+            "size": sum(cache.size() for cache in caches),
+            "hits": sum(cache.hits for cache in caches),
+            "misses": sum(cache.misses for cache in caches),
+        }
+
+
+class ConcurrencyMiddleware(ToolMiddleware):
+    """Limits the calls of a tool running at a time to its ``max_concurrency``, per event loop."""
+
+    def __init__(self):
+        # asyncio semaphores belong to one loop: one per loop and tool
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+            weakref.WeakKeyDictionary())
+        self._lock = threading.Lock()
+
+    def _semaphore(self, name: str, limit: int) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._semaphores.setdefault(loop, {})
+            semaphore = semaphores.get(name)
+            if semaphore is None:
+                semaphore = semaphores[name] = asyncio.Semaphore(limit)
+            return semaphore
+
+    async def __call__(self, call: ToolCall, call_next: NextHandler) -> Any:
+        limit = call.tool.max_concurrency
+        if not limit or limit <= 0:
+            return await call_next(call)
+        async with self._semaphore(call.name, limit):
+            return await call_next(call)
+
+
+class ToolPipeline:
+    """An ordered chain of middleware around tool functions; the first is the outermost."""
+
+    def __init__(self, middleware: Sequence[ToolMiddleware] = ()):
+        self.middleware: List[ToolMiddleware] = list(middleware)
+
+    def then(self, *middleware: ToolMiddleware) -> "ToolPipeline":
+        """Return a pipeline running this one's middleware, then the given middleware."""
+        return ToolPipeline(self.middleware + list(middleware))
+
+    async def run(self, call: ToolCall, handler: NextHandler) -> Any:
+        """Pass a call through the middleware to handler."""
+        async def invoke(index: int, call: ToolCall) -> Any:
+            if index == len(self.middleware):
+                return await handler(call)
+            return await self.middleware[index](call, functools.partial(invoke, index + 1))
+        return await invoke(0, call)
+
+    def wrap(self, tool: Any, function: Callable) -> Callable:
+        """
+        Wrap a tool function so its calls pass through the middleware.
+
+        The wrapper keeps the function's name, signature and docstring, which
+        the SDK turns into the tool's schema. A synchronous function is run
+        in a worker thread.
+
+        Args:
+            tool: The BaseTool the function belongs to
+            function: The function the SDK calls
+
+        Returns:
+            An async function with the same signature
+        """
+        signature = inspect.signature(function)
+
+        async def handler(call: ToolCall) -> Any:
+            if inspect.iscoroutinefunction(function):
+                return await function(*call.bound.args, **call.bound.kwargs)
+            return await asyncio.to_thread(function, *call.bound.args, **call.bound.kwargs)
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return await self.run(ToolCall(tool, bound), handler)
+
+        return wrapper
+
+
+# Result cache of the default pipeline, for the process stats
+memoize = MemoizeMiddleware()
+
+# Pipeline of BaseTool.to_function_tool. Timeouts are outside the cache, so they are never memoized
+default_pipeline = ToolPipeline([TimingMiddleware(), TimeoutMiddleware(), memoize, ConcurrencyMiddleware()])
+
+
+def stats() -> Dict[str, int]:
+    """Return the tool result cache counters of this process."""
+    return memoize.stats()
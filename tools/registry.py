@@ -0,0 +1,180 @@
+"""
+Registry of the tools agents can use, with their SDK function tools built once.
+
+Tools are discovered without importing them: BUILTIN_TOOLS names the tools
+of this package, and installed packages can add tools through the
+``agent_tools`` entry point group (``name = "package.module:ToolClass"``),
+read on the first lookup. A tool's module is imported, and the tool
+created, the first time the tool is requested, so registering more tools
+costs no startup time.
+
+Turning a tool into an SDK FunctionTool introspects its function (signature,
+type hints, docstring) and builds a pydantic model for its JSON schema.
+function_tool() does this once per tool version, factory and pipeline and
+returns the same FunctionTool to every agent build that uses the tool. The
+FunctionTool is named after the tool (``tool.name``), which is also the
+name the prompts refer to.
+"""
+
+import importlib
+import logging
+import threading
+from importlib import metadata
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Entry point group installed packages register tools under
+ENTRY_POINT_GROUP = "agent_tools"
+
+# Tools of this package: name -> "module:class"
+BUILTIN_TOOLS = {
+    "calculate": "tools.calculator:CalculatorTool",
+    "calculate_batch": "tools.batch_calculator:BatchCalculatorTool",
+    "web_search": "tools.web_search:WebSearchTool",
+}
+
+
+class ToolRegistry:
+    """A thread-safe registry of tool classes, tool instances and built function tools."""
+
+    def __init__(self, builtins: Optional[Dict[str, str]] = None, entry_point_group: Optional[str] = ENTRY_POINT_GROUP):
+        """
+        Args:
+            builtins: Tool targets ("module:class") by name; defaults to BUILTIN_TOOLS
+            entry_point_group: Entry point group read for more tools, or None
+        """
+        self._targets: Dict[str, Any] = dict(BUILTIN_TOOLS if builtins is None else builtins)
+        self._entry_point_group = entry_point_group
+        self._discovered = entry_point_group is None
+        self._instances: Dict[str, Any] = {}
+        self._function_tools: Dict[Hashable, Any] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def _discover(self) -> None:
+        if self._discovered:
+            return
+        with self._lock:
+            if self._discovered:
+                return
+            try:
+                entry_points = metadata.entry_points(group=self._entry_point_group)
+            except Exception as e:
+                logger.warning(f"Could not read the {self._entry_point_group} entry points: {str(e)}")
+                entry_points = []
+            for entry_point in entry_points:
+                # Tools of this package keep their built-in definition
+                self._targets.setdefault(entry_point.name, entry_point)
+            self._discovered = True
+
+    def register(self, name: str, target: Any) -> None:
+        """
+        Register a tool.
+
+        Args:
+            name: The tool name
+            target: A "module:class" string, or the tool class (or factory)
+        """
+        with self._lock:
+            self._targets[name] = target
+            self._instances.pop(name, None)
+
+    def names(self) -> List[str]:
+        """Return the names of all registered tools, without importing them."""
+        self._discover()
+        return sorted(self._targets)
+
+    def get(self, name: str) -> Any:
+        """
+        Return the shared instance of a tool, importing and creating it on first use.
+
+        Raises:
+            KeyError: If no tool of that name is registered
+        """
+        tool = self._instances.get(name)
+        if tool is not None:
+            return tool
+        self._discover()
+        with self._lock:
+            tool = self._instances.get(name)
+            if tool is None:
+                if name not in self._targets:
+                    raise KeyError(f"Unknown tool '{name}'")
+                tool = self._instances[name] = self._load(self._targets[name])()
+                logger.debug("Loaded tool %s (%s)", name, type(tool).__qualname__)
+            return tool
+
+    @staticmethod
+    def _load(target: Any) -> Callable[[], Any]:
+        if isinstance(target, str):
+            module, _, attribute = target.partition(":")
+            return getattr(importlib.import_module(module), attribute)
+        if isinstance(target, metadata.EntryPoint):
+            return target.load()
+        return target
+
+    def function_tool(self, tool: Any, function_tool_factory: Callable, pipeline: Any) -> Any:
+        """
+        Return the SDK function tool of a tool, building it on first use.
+
+        Args:
+            tool: The BaseTool
+            function_tool_factory: A function that creates a function tool, usually agents.function_tool
+            pipeline: The ToolPipeline wrapping the tool function
+
+        Returns:
+            The function tool shared by every build with the same tool version, factory and pipeline
+        """
+        key = (tool.cache_key(), id(function_tool_factory), id(pipeline))
+        function_tool = self._function_tools.get(key)
+        if function_tool is not None:
+            self.hits += 1
+            return function_tool
+
+        with self._lock:
+            function_tool = self._function_tools.get(key)
+            if function_tool is not None:
+                self.hits += 1
+                return function_tool
+            self.misses += 1
+            function_tool = function_tool_factory(pipeline.wrap(tool, tool.tool_function()), name_override=tool.name)
+            self._function_tools[key] = function_tool
+            logger.debug("Built function tool %s", tool.name)
+            return function_tool
+
+    def schema(self, name: str, function_tool_factory: Callable, pipeline: Any = None) -> Optional[Dict[str, Any]]:
+        """Return the JSON schema of a tool's parameters, as sent to the model."""
+        tool = self.get(name)
+        function_tool = tool.to_function_tool(function_tool_factory, pipeline)
+        return getattr(function_tool, "params_json_schema", None)
+
+    def clear(self) -> None:
+        """Drop the built function tools (e.g. after a tool's code was reloaded)."""
+        with self._lock:
+            self._function_tools.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return registry counters."""
+        return {
+            "registered": len(self._targets),
+            "loaded": len(self._instances),
+            "function_tools": len(self._function_tools),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Registry shared by all agents in this process
+tool_registry = ToolRegistry()
+
+
+def get_tool(name: str) -> Any:
+    """Return the shared instance of a registered tool (see ToolRegistry.get)."""
+    return tool_registry.get(name)
+
+
+def stats() -> Dict[str, int]:
+    """Return the tool registry counters of this process."""
+    return tool_registry.stats()
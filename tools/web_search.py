@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Any
+
+from config import Config
+from tools.base_tool import BaseTool
+from services.web_search import get_search_service
+
+
+class WebSearchTool(BaseTool):
+    """
+    Searches the web through the shared, cached search service.
+
+    Results are cached by normalized query and concurrent identical searches
+    are coalesced; see services.web_search.
+    """
+
+    # Each search may be a model run: bound how many the planner starts at once
+    max_concurrency = Config.WEB_SEARCH_CONCURRENCY
+
+    @property
+    def name(self) -> str:
+        return "web_search"
+
+    @property
+    def description(self) -> str:
+        return "Search the web for information. Use this when you need up-to-date information or to verify facts."
+
+    def execute(self, *args, **kwargs) -> Any:
+        """
+        Execute the web search.
+
+        Args:
+            *args: Positional arguments (first one is used as the query)
+            **kwargs: Keyword arguments ('query' is used if no positional args)
+
+        Blocks until the search is done, on an event loop of its own; on an
+        event loop, await execute_async instead.
+
+        Returns:
+            The search results as text
+
+        Raises:
+            RuntimeError: If called on a running event loop
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass  # No loop in this thread: run the search on one of its own
+        else:
+            raise RuntimeError("WebSearchTool.execute blocks; await execute_async on an event loop")
+        return asyncio.run(self.execute_async(*args, **kwargs))
+
+    async def execute_async(self, *args, **kwargs) -> Any:
+        """Search the web; the search service is asynchronous, so no thread is needed."""
+        query = args[0] if args else kwargs.get('query', '')
+        logging.debug("Searching the web for: %s", query)
+        return await get_search_service().search(query)
+
+    def tool_function(self):
+        """Return the typed function the SDK calls (see BaseTool.tool_function)."""
+        async def web_search(query: str) -> str:
+            """
+            Search the web for information. Use this when you need up-to-date information or to verify facts.
+
+            Args:
+                query: A clear, specific search query
+
+            Returns:
+                The findings, with their sources
+            """
+            return await self.execute_async(query=query)
+
+        return web_search